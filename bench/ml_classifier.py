@@ -0,0 +1,235 @@
+"""
+Train, export and benchmark the learned flow classifier (core.flow_model).
+
+train     draws labelled traffic from the bench.traffic workload models (one slice per
+          model), replays it through a FlowTable in classifier-sized batches, takes a
+          feature row every time a flow would be asked at runtime (min_packets, then
+          every power of two) and fits a small MLP with NumPy (Adam, cross-entropy).
+          Ports are randomized first: the generator's per-slice UDP port would leak the label.
+export    converts the .npz MLP to TorchScript or ONNX (needs torch).
+bench     CPU inference latency per batch of flows for every available backend, and the
+          cost per packet of FlowClassifier.assign against the DSCP lookup alone.
+
+Usage:
+    python -m bench.ml_classifier train --out flow_model.npz --duration 20
+    python -m bench.ml_classifier export flow_model.npz --format onnx
+    python -m bench.ml_classifier bench flow_model.npz --json ml.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import config
+from bench.traffic import DEFAULT_MODELS, TrafficGenerator
+from core.flow_model import FEATURES, FlowClassifier, FlowModel, FlowTable
+from utils.helpers import log
+
+BATCH = 256  # frames per classifier batch when replaying a trace
+INFERENCE_SIZES = [1, 16, 256, 4096]
+
+
+def dataset(specs, duration: float, load: float, seed: int, min_packets: int = 4, capacity: int = 1 << 16):
+    """(features, labels, label names) of a generated trace, sampled as the runtime classifier would."""
+    generator = TrafficGenerator(specs, duration, load, seed=seed)
+    names = [name for name, _, _, _ in generator.slices]
+    rng = np.random.default_rng(seed)
+    table = FlowTable(capacity)
+    label = np.full(capacity, -1, dtype=np.int64)
+    rows, labels = [], []
+    start = 0
+    for _, batch in generator.chunks():
+        n = len(batch)
+        batch.dport[:n] = rng.choice([53, 80, 443, 1883, 5060, 5683, 8080, 9000], n)
+        slice_ids = generator.slice_ids[start:start + n]
+        start += n
+        for first in range(0, n, BATCH):
+            view = batch.select(np.arange(first, min(first + BATCH, n)))
+            slots, owned = table.update(view)
+            label[slots[owned]] = slice_ids[first:first + BATCH][owned]
+            seen = np.unique(slots[owned])
+            due = seen[(table.packets[seen] >= min_packets) & (table.packets[seen] >= 2 * table.asked_at[seen])]
+            table.asked_at[due] = table.packets[due]
+            rows.append(table.features(due))
+            labels.append(label[due])
+    return np.concatenate(rows), np.concatenate(labels), names
+
+
+def train_mlp(x: np.ndarray, y: np.ndarray, classes: int, hidden: int = 32, epochs: int = 300, lr: float = 1e-2,
+              seed: int = 0):
+    """One-hidden-layer ReLU MLP fitted with full-batch Adam. Returns [(w0, b0), (w1, b1)]."""
+    rng = np.random.default_rng(seed)
+    params = [rng.normal(0, np.sqrt(2 / x.shape[1]), (x.shape[1], hidden)), np.zeros(hidden),
+              rng.normal(0, np.sqrt(2 / hidden), (hidden, classes)), np.zeros(classes)]
+    moments = [(np.zeros_like(p), np.zeros_like(p)) for p in params]
+    onehot = np.eye(classes)[y]
+    # Weight classes by inverse frequency: a few eMBB flows against thousands of mMTC devices
+    weights = (len(y) / (classes * np.maximum(np.bincount(y, minlength=classes), 1)))[y][:, None]
+    for step in range(1, epochs + 1):
+        hidden_in = x @ params[0] + params[1]
+        hidden_out = np.maximum(hidden_in, 0)
+        logits = hidden_out @ params[2] + params[3]
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        d_logits = (probabilities - onehot) * weights / len(y)
+        d_hidden = (d_logits @ params[2].T) * (hidden_in > 0)
+        grads = [x.T @ d_hidden, d_hidden.sum(axis=0), hidden_out.T @ d_logits, d_logits.sum(axis=0)]
+        for p, g, (m, v) in zip(params, grads, moments):
+            m *= 0.9
+            m += 0.1 * g
+            v *= 0.999
+            v += 0.001 * g * g
+            p -= lr * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return [(params[0], params[1]), (params[2], params[3])]
+
+
+def accuracy(model: FlowModel, x: np.ndarray, y: np.ndarray, confidence: float) -> dict:
+    best, probability = model.predict(x)
+    sure = probability >= confidence
+    return {"accuracy": round(float((best == y).mean()), 4),
+            "confident_share": round(float(sure.mean()), 4),
+            "confident_accuracy": round(float((best[sure] == y[sure]).mean()), 4) if sure.any() else None}
+
+
+def train(out: str, specs, duration: float, load: float, seed: int, confidence: float) -> dict:
+    x, y, names = dataset(specs, duration, load, seed)
+    log('blue', f"{len(x)} feature rows ({', '.join(f'{n}: {int((y == i).sum())}' for i, n in enumerate(names))})")
+    layers = train_mlp(x, y, len(names), seed=seed)
+    arrays = {f"{kind}{i}": value.astype(np.float32) for i, (w, b) in enumerate(layers)
+              for kind, value in (("w", w), ("b", b))}
+    np.savez(out, labels=np.array(names), features=np.array(FEATURES), **arrays)
+    model = FlowModel(out)
+    # Held-out trace: same models, other seed
+    x_test, y_test, _ = dataset(specs, duration / 2, load, seed + 1)
+    return {"model": out, "train": accuracy(model, x, y, confidence),
+            "test": accuracy(model, x_test, y_test, confidence)}
+
+
+def export(path: str, fmt: str) -> str:
+    """Convert an .npz MLP to TorchScript (.pt) or ONNX (.onnx), with its labels sidecar."""
+    import torch
+
+    model = FlowModel(path)
+    modules = []
+    for i, (w, b) in enumerate(model.layers):
+        linear = torch.nn.Linear(w.shape[0], w.shape[1])
+        with torch.no_grad():
+            linear.weight.copy_(torch.from_numpy(w.T.copy()))
+            linear.bias.copy_(torch.from_numpy(b))
+        modules.append(linear)
+        if i < len(model.layers) - 1:
+            modules.append(torch.nn.ReLU())
+    module = torch.nn.Sequential(*modules).eval()
+    example = torch.zeros(1, len(FEATURES))
+    out = os.path.splitext(path)[0] + (".pt" if fmt == "torchscript" else ".onnx")
+    if fmt == "torchscript":
+        torch.jit.trace(module, example).save(out)
+    else:
+        torch.onnx.export(module, example, out, input_names=["features"], output_names=["logits"],
+                          dynamic_axes={"features": {0: "flows"}, "logits": {0: "flows"}})
+    with open(out + ".json", "w") as f:
+        json.dump({"labels": model.labels, "features": list(FEATURES)}, f)
+    return out
+
+
+def _best_of(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench(path: str, specs, duration: float, load: float, repeat: int = 20) -> dict:
+    report = {"inference": {}, "assign": {}}
+    candidates = [path] + [os.path.splitext(path)[0] + ext for ext in (".pt", ".onnx") if not path.endswith(ext)]
+    rng = np.random.default_rng(0)
+    for candidate in candidates:
+        if not os.path.exists(candidate):
+            continue
+        try:
+            model = FlowModel(candidate)
+        except ImportError as e:
+            log('yellow', f"{candidate}: {e.name} is not installed, skipped")
+            continue
+        rows = {}
+        for size in INFERENCE_SIZES:
+            x = rng.normal(0, 1, (size, len(FEATURES))).astype(np.float32)
+            model.predict(x)  # warm-up
+            seconds = _best_of(lambda: model.predict(x), repeat)
+            rows[size] = {"us": round(seconds * 1e6, 1), "us_per_flow": round(seconds * 1e6 / size, 3)}
+        report["inference"][model.backend] = rows
+    # Classifier cost per packet on a generated trace: DSCP lookup alone vs DSCP + flow classifier
+    generator = TrafficGenerator(specs, duration, load, seed=1)
+    batches = [batch for _, batch in generator.chunks()]
+    names = [spec.name for spec in specs]
+    dscp_table = np.full(64, -1, dtype=np.int16)
+    for index, spec in enumerate(specs):
+        dscp_table[spec.dscp] = index
+    packets = sum(len(batch) for batch in batches)
+
+    def dscp_only():
+        for batch in batches:
+            view = batch.view()
+            np.where(view.l3_offsets >= 0, dscp_table[view.dscp], -1)
+
+    def with_model():
+        classifier = FlowClassifier(FlowModel(path), names, untagged_only=False)
+        for batch in batches:
+            for first in range(0, len(batch), BATCH):
+                view = batch.select(np.arange(first, min(first + BATCH, len(batch))))
+                classifier.assign(view, np.where(view.l3_offsets >= 0, dscp_table[view.dscp], -1))
+
+    for name, func in (("dscp", dscp_only), ("dscp+model", with_model)):
+        seconds = _best_of(func, 3)
+        report["assign"][name] = {"packets": packets, "ns_per_packet": round(seconds * 1e9 / packets, 1)}
+    return report
+
+
+def main():
+    from core.slice_config import ConfigError, load_config
+
+    parser = argparse.ArgumentParser(description="NetSlicer flow classifier: train, export, benchmark")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    train_parser = sub.add_parser("train", help="fit an .npz MLP on generated traffic")
+    train_parser.add_argument("--out", default="flow_model.npz")
+    train_parser.add_argument("--seed", type=int, default=7)
+    train_parser.add_argument("--confidence", type=float, default=0.8)
+    export_parser = sub.add_parser("export", help="convert an .npz model (needs torch)")
+    export_parser.add_argument("model")
+    export_parser.add_argument("--format", choices=["torchscript", "onnx"], default="onnx")
+    bench_parser = sub.add_parser("bench", help="CPU inference and classification cost")
+    bench_parser.add_argument("model")
+    for sub_parser in (train_parser, bench_parser):
+        sub_parser.add_argument("--config", default=config.DEFAULT_CONFIG, help="Slice configuration")
+        sub_parser.add_argument("--duration", type=float, default=10.0, help="Seconds of generated traffic")
+        sub_parser.add_argument("--load", type=float, default=0.8, help="Offered load, fraction of the slice rate")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    opts = parser.parse_args()
+
+    if opts.mode == "export":
+        log('cyan', f"Wrote {export(opts.model, opts.format)}")
+        return
+    try:
+        # Only the slices a workload model knows how to generate are learned
+        specs = [spec for spec in load_config(opts.config).slices if spec.name in DEFAULT_MODELS]
+    except ConfigError as e:
+        log('red', str(e))
+        sys.exit(1)
+    if opts.mode == "train":
+        result = train(opts.out, specs, opts.duration, opts.load, opts.seed, opts.confidence)
+    else:
+        result = bench(opts.model, specs, opts.duration, opts.load)
+    log('cyan', json.dumps(result, indent=2))
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
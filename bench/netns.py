@@ -0,0 +1,445 @@
+"""
+End-to-end slicing bench in network namespaces.
+
+Builds three namespaces on one host and runs the slicer inline between them:
+
+    nsl-src  s0 ──veth── r0  nsl-router  r1 ──veth── d0  nsl-dst
+             s1 ────────────── return link ────────────── d1
+
+The router namespace runs the real startup path (setup_environment, setup_slices with the
+bench slice plan on r1) and the sniff -> classify -> forward loop: frames captured on r0 are
+classified on their DSCP, marked, rewritten to the next hop and sent out of r1 through the
+slice HTB classes. Kernel forwarding is diverted to NFQUEUE by setup_environment, so every
+packet crosses the slicer; replies (TCP ACKs) come back over the direct return link.
+
+Local generators in nsl-src push a DSCP-mixed load (URLLC: paced UDP below its rate, eMBB:
+bulk TCP, mMTC: UDP above its ceil) plus per-slice probes (core.prober). The bench then
+checks per-slice throughput against the HTB rate/ceil, tc drops and the one-way delay
+ordering URLLC < eMBB < mMTC.
+
+Requires root, iproute2 and iptables on Linux.
+
+Usage:
+    sudo python -m bench.netns
+    sudo python -m bench.netns --duration 20 --scale 2 --json netns.json
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from utils.helpers import log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NS_SRC, NS_ROUTER, NS_DST = "nsl-src", "nsl-router", "nsl-dst"
+# (namespace, interface, address, MAC) of both ends of every link
+LINKS = [
+    ((NS_SRC, "s0", "10.90.1.1/24", "02:00:00:00:01:01"), (NS_ROUTER, "r0", "10.90.1.254/24", "02:00:00:00:01:fe")),
+    ((NS_ROUTER, "r1", "10.90.2.254/24", "02:00:00:00:02:fe"), (NS_DST, "d0", "10.90.2.1/24", "02:00:00:00:02:01")),
+    ((NS_DST, "d1", "10.90.3.2/24", "02:00:00:00:03:02"), (NS_SRC, "s1", "10.90.3.1/24", "02:00:00:00:03:01")),
+]
+SINK_ADDR = "10.90.2.1"
+PROBE_PORT = 7000
+UDP_BASE_PORT = 9000
+TCP_BASE_PORT = 9100
+SINK_LEAD = 0.5  # seconds the sink listens before the source starts
+
+# Bench slice plan (rates in kbit before scaling). Queue sizes make the expected queueing
+# delay at the ceil grow from URLLC to mMTC.
+SLICES = [
+    {"name": "urllc", "dscp": 46, "rate": 1000, "ceil": 2000, "qsize": 50, "prio": 0,
+     "load": "udp", "offered": 500, "size": 200},
+    {"name": "embb", "dscp": 10, "rate": 2000, "ceil": 4000, "qsize": 100, "prio": 1,
+     "load": "tcp", "offered": None, "size": 1400},
+    {"name": "mmtc", "dscp": 0, "rate": 500, "ceil": 1000, "qsize": 100, "prio": 2,
+     "load": "udp", "offered": 2000, "size": 1000},
+]
+
+
+def sh(*cmd, check=True, netns=None):
+    if netns:
+        cmd = ("ip", "netns", "exec", netns) + cmd
+    return subprocess.run(cmd, check=check, capture_output=True, text=True)
+
+
+def _scaled(scale):
+    slices = []
+    for spec in SLICES:
+        spec = dict(spec)
+        for key in ("rate", "ceil", "offered"):
+            if spec[key] is not None:
+                spec[key] = int(spec[key] * scale)
+        slices.append(spec)
+    return slices
+
+
+def write_config(path, slices):
+    """Write the bench slice plan as a slicer configuration file (forwarding to the sink)."""
+    lines = ['interface = "r1"', 'filter = "auto"', 'engine = "cpu"', "batch_size = 32", "time_limit = 0.005", ""]
+    for spec in slices:
+        lines += [
+            "[[slices]]",
+            f'name = "{spec["name"]}"',
+            f'dscp = {spec["dscp"]}',
+            f'rate = "{spec["rate"]}kbit"',
+            f'ceil = "{spec["ceil"]}kbit"',
+            'burst = "3k"',
+            f'qsize = {spec["qsize"]}',
+            f'prio = {spec["prio"]}',
+            f'stages = [{{ type = "rewrite", dst = "{LINKS[1][1][3]}", src = "{LINKS[1][0][3]}" }}]',
+            "",
+        ]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+
+# === Topology ==================================================================
+
+def create_topology():
+    destroy_topology()
+    for netns in (NS_SRC, NS_ROUTER, NS_DST):
+        sh("ip", "netns", "add", netns)
+        sh("ip", "link", "set", "lo", "up", netns=netns)
+    for (ns_a, if_a, addr_a, mac_a), (ns_b, if_b, addr_b, mac_b) in LINKS:
+        sh("ip", "link", "add", if_a, "netns", ns_a, "address", mac_a, "type", "veth",
+           "peer", "name", if_b, "netns", ns_b, "address", mac_b)
+        for netns, iface, addr in ((ns_a, if_a, addr_a), (ns_b, if_b, addr_b)):
+            sh("ip", "addr", "add", addr, "dev", iface, netns=netns)
+            # The slicer forwards frame by frame: no GSO super-packets on the way in
+            if not _has("ethtool") or sh("ethtool", "-K", iface, "tso", "off", "gso", "off", "gro", "off",
+                                         check=False, netns=netns).returncode != 0:
+                sh("ip", "link", "set", "dev", iface, "gso_max_segs", "1", check=False, netns=netns)
+            sh("ip", "link", "set", iface, "up", netns=netns)
+    # Forward path through the router, return path over the direct link
+    sh("ip", "route", "add", "10.90.2.0/24", "via", "10.90.1.254", "dev", "s0", netns=NS_SRC)
+    sh("ip", "route", "add", "10.90.1.0/24", "via", "10.90.3.1", "dev", "d1", netns=NS_DST)
+    sh("ip", "neigh", "replace", "10.90.1.254", "lladdr", LINKS[0][1][3], "dev", "s0", netns=NS_SRC)
+    sh("ip", "neigh", "replace", "10.90.1.1", "lladdr", LINKS[2][1][3], "dev", "d1", netns=NS_DST)
+    for netns in (NS_SRC, NS_DST):
+        # Asymmetric routing: replies arrive on the return link
+        for key in ("all", "default", "s0", "s1", "d0", "d1"):
+            sh("sysctl", "-qw", f"net.ipv4.conf.{key}.rp_filter=0", check=False, netns=netns)
+
+
+def destroy_topology():
+    for netns in (NS_SRC, NS_ROUTER, NS_DST):
+        sh("ip", "netns", "del", netns, check=False)
+
+
+def _has(tool):
+    return any(os.access(os.path.join(d, tool), os.X_OK) for d in os.environ.get("PATH", "").split(os.pathsep))
+
+
+def _worker(netns, *args):
+    """Start a worker of this module inside a namespace."""
+    cmd = ["ip", "netns", "exec", netns, sys.executable, "-m", "bench.netns", *args]
+    return subprocess.Popen(cmd, cwd=ROOT)
+
+
+# === Workers ===================================================================
+
+def run_slicer(config_path):
+    """Router namespace: the slicer startup path and sniff -> classify -> forward loop."""
+    import config
+    from core.classifier import PacketClassifier
+    from core.packet_filter import build_filter
+    from core.parser import Args
+    from core.scanner import Scanner
+    from core.slice_config import load_config
+    from core.slices_setup import setup_slices
+    from core.sniffer import Sniffer
+    from utils.helpers import reset_environment, setup_environment
+
+    cfg = load_config(config_path)
+    config.args = Args(display_packets=False, display_metrics=False, store_packets=False, interface=cfg.interface,
+                       config=config_path, rate_limit="", probe_target=None, probe_port=PROBE_PORT,
+                       keep_dscp=True, gpu=False, verbose="INFO", seed=42, fix_seed=False)
+    signal.signal(signal.SIGTERM, _interrupt)
+    setup_environment(config.args)
+    try:
+        slices = setup_slices(cfg.interface, cfg.slices)
+        classifier = PacketClassifier(slices=slices, args=config.args, batch_size=cfg.batch_size,
+                                      time_limit=cfg.time_limit)
+        scanner = Scanner()
+        scanner.interface = "r0"
+        scanner.filters = build_filter(cfg.slices) if _has_libpcap() else None
+        Sniffer(args=config.args, scanner=scanner, classifier=classifier).start_sniffing()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reset_environment()
+
+
+def _interrupt(*_):
+    raise KeyboardInterrupt
+
+
+def _has_libpcap():
+    try:
+        from scapy.arch.common import compile_filter
+        compile_filter("ip")
+        return True
+    except Exception:
+        return False
+
+
+def run_sink(slices, duration, warmup, out):
+    """
+    Destination namespace: count received bytes per slice and measure one-way probe delay.
+    Only the bytes received in the `duration` seconds after `warmup` are reported.
+    """
+    from core.prober import ProbeReflector
+
+    received = {spec["name"]: 0 for spec in slices}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def udp_sink(name, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("0.0.0.0", port))
+        sock.settimeout(0.2)
+        while not stop.is_set():
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                continue
+            with lock:
+                received[name] += len(data)
+
+    def tcp_sink(name, port):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("0.0.0.0", port))
+        server.listen(1)
+        server.settimeout(0.2)
+        while not stop.is_set():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(0.2)
+            while not stop.is_set():
+                try:
+                    data = conn.recv(65535)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                with lock:
+                    received[name] += len(data)
+            conn.close()
+
+    threads = []
+    for index, spec in enumerate(slices):
+        if spec["load"] == "udp":
+            threads.append(threading.Thread(target=udp_sink, args=(spec["name"], UDP_BASE_PORT + index), daemon=True))
+        else:
+            threads.append(threading.Thread(target=tcp_sink, args=(spec["name"], TCP_BASE_PORT + index), daemon=True))
+    reflector = ProbeReflector(port=PROBE_PORT, slices={spec["name"]: spec["dscp"] for spec in slices}, echo=False)
+    for thread in threads:
+        thread.start()
+    reflector.start()
+    # Only count what arrived during the measurement window: TCP slow start and the tc
+    # queues filling up during the warm-up are left out
+    time.sleep(warmup)
+    with lock:
+        warm = dict(received)
+    time.sleep(duration)
+    with lock:
+        measured = {name: received[name] - warm[name] for name in received}
+    stop.set()
+    reflector.stop()
+    with open(out, "w") as f:
+        json.dump({"received": measured, "probes": reflector.metrics.snapshot()}, f)
+
+
+def run_source(slices, duration, warmup):
+    """Source namespace: per-slice generators and probe trains."""
+    from core.prober import SliceProber
+
+    deadline = time.monotonic() + warmup + duration
+
+    def udp_load(spec, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, spec["dscp"] << 2)
+        payload = bytes(spec["size"])
+        interval = spec["size"] * 8 / (spec["offered"] * 1000)
+        next_send = time.monotonic()
+        while time.monotonic() < deadline:
+            try:
+                sock.sendto(payload, (SINK_ADDR, port))
+            except OSError:
+                pass
+            next_send += interval
+            time.sleep(max(next_send - time.monotonic(), 0))
+
+    def tcp_load(spec, port):
+        sock = socket.create_connection((SINK_ADDR, port), timeout=5)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, spec["dscp"] << 2)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_MAXSEG, spec["size"])
+        payload = bytes(64 * 1024)
+        while time.monotonic() < deadline:
+            try:
+                sock.send(payload)
+            except (socket.timeout, OSError):
+                pass
+        sock.close()
+
+    threads = []
+    for index, spec in enumerate(slices):
+        if spec["load"] == "udp":
+            threads.append(threading.Thread(target=udp_load, args=(spec, UDP_BASE_PORT + index), daemon=True))
+        else:
+            threads.append(threading.Thread(target=tcp_load, args=(spec, TCP_BASE_PORT + index), daemon=True))
+    prober = SliceProber({spec["name"]: spec["dscp"] for spec in slices}, SINK_ADDR, port=PROBE_PORT, period=0.5,
+                         train_size=5, spacing=0.01)
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    prober.start()
+    for thread in threads:
+        thread.join()
+    prober.stop()
+
+
+# === Orchestration =============================================================
+
+def tc_drops(interface="r1", netns=NS_ROUTER):
+    """Drops of every slice leaf qdisc, by qdisc handle major (e.g. "11")."""
+    qdiscs = json.loads(sh("tc", "-s", "-j", "qdisc", "show", "dev", interface, netns=netns).stdout)
+    return {q["handle"].rstrip(":"): q.get("drops", 0) for q in qdiscs if q.get("parent", "").startswith("1:")}
+
+
+def check(slices, sink, drops, duration, tolerance):
+    """Return (report rows, failures)."""
+    failures, rows = [], []
+    for index, spec in enumerate(slices):
+        name = spec["name"]
+        kbit = sink["received"][name] * 8 / duration / 1000
+        delay = sink["probes"].get(name, {}).get("delay_avg_ms")
+        dropped = drops.get(f"1{index + 1}", 0)
+        rows.append({"slice": name, "load": spec["load"], "kbit": round(kbit, 1), "rate": spec["rate"],
+                     "ceil": spec["ceil"], "drops": dropped, "delay_ms": delay})
+        if kbit > spec["ceil"] * (1 + tolerance):
+            failures.append(f"{name}: {kbit:.0f} kbit/s above its ceil {spec['ceil']} kbit/s")
+        floor = spec["offered"] if spec["offered"] and spec["offered"] < spec["rate"] else spec["rate"]
+        if kbit < floor * (1 - tolerance):
+            failures.append(f"{name}: {kbit:.0f} kbit/s below its guaranteed {floor} kbit/s")
+        if spec["offered"] and spec["offered"] < spec["rate"] and dropped:
+            failures.append(f"{name}: {dropped} drops although it stays below its rate")
+        if spec["offered"] and spec["offered"] > spec["ceil"] and not dropped:
+            failures.append(f"{name}: no drops although it is offered more than its ceil")
+    delays = [(row["slice"], row["delay_ms"]) for row in rows]
+    if any(delay is None for _, delay in delays):
+        failures.append("missing probe delay for " + ", ".join(name for name, delay in delays if delay is None))
+    elif any(a[1] >= b[1] for a, b in zip(delays, delays[1:])):
+        failures.append("delay ordering violated: " + " < ".join(f"{name} ({delay} ms)" for name, delay in delays))
+    return rows, failures
+
+
+def run(duration=10.0, warmup=3.0, scale=1.0, tolerance=0.25, keep=False):
+    slices = _scaled(scale)
+    workdir = tempfile.mkdtemp(prefix="netslicer-netns-")
+    config_path = os.path.join(workdir, "bench.toml")
+    sink_out = os.path.join(workdir, "sink.json")
+    write_config(config_path, slices)
+    spec_arg = json.dumps(slices)
+
+    log('blue', "Creating namespaces and veth links...")
+    create_topology()
+    procs = []
+    try:
+        slicer = _worker(NS_ROUTER, "slicer", config_path)
+        procs.append(slicer)
+        time.sleep(3)  # tc plan installed and capture socket open
+        if slicer.poll() is not None:
+            raise RuntimeError("the slicer exited during startup")
+        # The sink starts SINK_LEAD seconds before the source: its warm-up covers that lead too
+        sink = _worker(NS_DST, "sink", spec_arg, "--duration", str(duration), "--warmup", str(warmup + SINK_LEAD),
+                       "--out", sink_out)
+        procs.append(sink)
+        time.sleep(SINK_LEAD)
+        log('blue', f"Pushing load for {warmup + duration:.0f}s...")
+        source = _worker(NS_SRC, "source", spec_arg, "--duration", str(duration), "--warmup", str(warmup))
+        procs.append(source)
+        source.wait()
+        sink.wait()
+        drops = tc_drops()
+        with open(sink_out) as f:
+            result = json.load(f)
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+                try:
+                    proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        if not keep:
+            destroy_topology()
+    return check(slices, result, drops, duration, tolerance)
+
+
+def display(rows, failures):
+    log('magenta', "Per-slice results")
+    print(f"  {'slice':<6} {'load':<4} {'kbit/s':>8} {'rate':>6} {'ceil':>6} {'drops':>6} {'delay ms':>9}")
+    for row in rows:
+        delay = "-" if row["delay_ms"] is None else f"{row['delay_ms']:.2f}"
+        print(f"  {row['slice']:<6} {row['load']:<4} {row['kbit']:>8} {row['rate']:>6} {row['ceil']:>6} "
+              f"{row['drops']:>6} {delay:>9}")
+    if failures:
+        for failure in failures:
+            log('red', failure)
+    else:
+        log('green', "All slice checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSlicer network-namespace bench")
+    sub = parser.add_subparsers(dest="mode")
+    slicer = sub.add_parser("slicer", help="(worker) run the slicer in the router namespace")
+    slicer.add_argument("config")
+    sink = sub.add_parser("sink", help="(worker) receive the load in the destination namespace")
+    sink.add_argument("slices")
+    sink.add_argument("--duration", type=float, required=True)
+    sink.add_argument("--warmup", type=float, default=0.0)
+    sink.add_argument("--out", required=True)
+    source = sub.add_parser("source", help="(worker) generate the load in the source namespace")
+    source.add_argument("slices")
+    source.add_argument("--duration", type=float, required=True)
+    source.add_argument("--warmup", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds of load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of load before probing")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every rate of the bench plan")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative throughput tolerance")
+    parser.add_argument("--keep", action="store_true", help="Keep the namespaces for inspection")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    opts = parser.parse_args()
+
+    if opts.mode == "slicer":
+        run_slicer(opts.config)
+    elif opts.mode == "sink":
+        run_sink(json.loads(opts.slices), opts.duration, opts.warmup, opts.out)
+    elif opts.mode == "source":
+        run_source(json.loads(opts.slices), opts.duration, opts.warmup)
+    else:
+        if os.geteuid() != 0:
+            log('red', "The namespace bench must run as root")
+            sys.exit(1)
+        rows, failures = run(opts.duration, opts.warmup, opts.scale, opts.tolerance, opts.keep)
+        display(rows, failures)
+        if opts.json:
+            with open(opts.json, "w") as f:
+                json.dump({"slices": rows, "failures": failures}, f, indent=2)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
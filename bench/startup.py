@@ -0,0 +1,108 @@
+"""
+Startup-time benchmark: import cost per module, measured in fresh interpreters.
+
+Every run starts `python -X importtime` on a snippet, parses the per-module self and
+cumulative import times it prints on stderr, and reports the most expensive modules for
+each startup mode (the backends a mode should load on top of main.py).
+
+Usage:
+    python -m bench.startup
+    python -m bench.startup --modes cpu gpu --top 15 --json startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from utils.helpers import log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported by each startup mode; heavy backends must only appear where they are needed
+MODES = {
+    "cpu": ["main"],
+    "sniff": ["main", "scapy.layers.inet", "scapy.layers.inet6", "scapy.sendrecv"],
+    "gpu": ["main", "torch"],
+    "store": ["main", "influxdb_client"],
+    "interactive": ["main", "questionary"],
+}
+# Backends that must not be imported by main.py itself
+HEAVY_BACKENDS = ["torch", "scapy.all", "influxdb_client", "questionary"]
+
+
+def import_times(modules, python=sys.executable):
+    """
+    Import `modules` in a fresh interpreter and return (wall seconds, {module: (self_us, cumulative_us)}).
+    Modules that fail to import are reported with an "error" entry.
+    """
+    snippet = "\n".join(f"import {module}" for module in modules)
+    started = time.perf_counter()
+    proc = subprocess.run([python, "-X", "importtime", "-c", snippet], cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    if proc.returncode != 0:
+        times["error"] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"
+    return wall, times
+
+
+def run(modes, top=10, repeat=3):
+    report = {}
+    for mode in modes:
+        # Keep the fastest run: the others mostly measure disk cache and scheduler noise
+        best = None
+        for _ in range(repeat):
+            wall, times = import_times(MODES[mode])
+            if best is None or wall < best[0]:
+                best = (wall, times)
+        wall, times = best
+        error = times.pop("error", None)
+        ranked = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        report[mode] = {
+            "modules": MODES[mode],
+            "wall_s": round(wall, 4),
+            "cumulative_us": {module: times[module][1] for module in MODES[mode] if module in times},
+            "heavy_backends_loaded": [module for module in HEAVY_BACKENDS
+                                      if module in times and f"'{module}'" not in (error or "")],
+            "top_self_us": {name: self_us for name, (self_us, _) in ranked},
+        }
+        if error:
+            report[mode]["error"] = error
+    return report
+
+
+def display(report):
+    for mode, result in report.items():
+        log('magenta', f"[{mode}] {result['wall_s']} s to import {', '.join(result['modules'])}")
+        for module, cumulative in result["cumulative_us"].items():
+            print(f"    {module:<30} {cumulative / 1000:>9.1f} ms cumulative")
+        if result["heavy_backends_loaded"]:
+            print(f"    heavy backends loaded: {', '.join(result['heavy_backends_loaded'])}")
+        for module, self_us in result["top_self_us"].items():
+            print(f"    {module:<30} {self_us / 1000:>9.1f} ms self")
+        if "error" in result:
+            log('red', f"    {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSlicer startup-time benchmark")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--top", type=int, default=10, help="Most expensive modules to list per mode")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode (the fastest is kept)")
+    parser.add_argument("--json", type=str, help="Also write the report to this file")
+    opts = parser.parse_args()
+    report = run(opts.modes, top=opts.top, repeat=opts.repeat)
+    display(report)
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Workload-model traffic generator for slice load testing.
+
+Instead of one constant-rate iperf3 stream, every slice gets a load shaped like its
+service, marked with the slice DSCP of the configuration file:
+    periodic    URLLC control loops: small packets from a few devices at a fixed period
+    heavy_tail  eMBB: flows arriving as a Poisson process, Pareto-distributed flow sizes,
+                each flow paced at its own rate in MTU-sized packets
+    poisson     mMTC: many sparse devices, each sending a small report at Poisson times
+
+The offered load of a slice is `load` x its configured rate. The models first draw the
+whole schedule (send time, frame size, flow) with NumPy; frames are then built in chunks
+(Ethernet / IPv4 / UDP headers written for the whole chunk at once, IPv4 checksums
+included) and either sent on a raw packet socket or written to a PCAP for replay
+(tcpreplay, or this tool with --replay). Sending is paced against the schedule: the
+sender sleeps until shortly before the next deadline, spins to it, then sends every frame
+already due back to back, so a late wake-up turns into a short burst, not a slower rate.
+
+Requires root (raw socket) unless only writing a PCAP.
+
+Usage:
+    sudo python -m bench.traffic veth0 --duration 10 --load 0.8 --dst-mac 02:00:00:00:01:fe
+    python -m bench.traffic --pcap load.pcap --duration 5 --config slices.toml --model mmtc=poisson
+    sudo python -m bench.traffic veth0 --replay load.pcap
+"""
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import config
+from core.packet_batch import PacketBatch
+from core.policy import parse_rate
+from protocols.pcap import Pcap
+from utils.helpers import log
+
+HEADERS = 14 + 20 + 8  # Ethernet + IPv4 + UDP
+MIN_FRAME = 60  # shortest Ethernet frame without FCS
+MAX_FRAME = 1514
+UDP_BASE_PORT = 9000  # destination port of slice i: UDP_BASE_PORT + i
+SOURCE_NET = 0x0AC80000  # 10.200.0.0/16: one source address per flow
+CHUNK = 4096  # frames built at once
+SPIN = 200e-6  # seconds spun (instead of slept) before a deadline
+
+
+@dataclass
+class Schedule:
+    times: np.ndarray  # send time from the start (s)
+    sizes: np.ndarray  # Ethernet frame size (B)
+    flows: np.ndarray  # flow index within the slice
+
+    def __len__(self):
+        return len(self.times)
+
+
+def _schedule(times, sizes, flows, duration) -> Schedule:
+    keep = (times >= 0) & (times < duration)
+    return Schedule(times[keep], np.clip(sizes[keep], MIN_FRAME, MAX_FRAME).astype(np.int64), flows[keep])
+
+
+# === Workload models ============================================================
+
+def periodic(rate: float, duration: float, rng: np.random.Generator, size: int = 128, period: float = 1e-3,
+             jitter: float = 0.0) -> Schedule:
+    """
+    URLLC control loops: each device sends one `size`-byte frame every `period` seconds.
+    :param rate: offered load (B/s), which sets the number of devices
+    :param jitter: standard deviation of the send time around its slot (s)
+    """
+    devices = max(1, round(rate * period / size))
+    slots = int(duration / period) + 1
+    phases = rng.uniform(0, period, devices)  # devices are not synchronized
+    times = (np.arange(slots)[:, None] * period + phases).ravel()
+    if jitter:
+        times = times + rng.normal(0, jitter, len(times))
+    flows = np.tile(np.arange(devices), slots)
+    return _schedule(times, np.full(len(times), size), flows, duration)
+
+
+def heavy_tail(rate: float, duration: float, rng: np.random.Generator, alpha: float = 1.2,
+               min_flow: int = 20_000, flow_rate: str = "20mbit", mtu: int = MAX_FRAME) -> Schedule:
+    """
+    eMBB: Poisson flow arrivals, Pareto(alpha, min_flow) flow sizes, each flow paced at flow_rate.
+    A heavy tail makes the bytes of one run swing far from their mean, so flows are kept in
+    arrival order while their bytes inside the run fit in rate * duration (a flow that would
+    overshoot is skipped): every run offers the requested load.
+    :param rate: offered load (B/s)
+    :param alpha: Pareto shape, in (1, 2] for a finite mean and heavy tail
+    """
+    # Cap the tail at what a flow can send in the run, so one draw does not dominate memory
+    pace = parse_rate(flow_rate)
+    cap = pace * duration
+    mean_flow = cap if cap <= min_flow else min_flow + (min_flow - min_flow ** alpha * cap ** (1 - alpha)) / (alpha - 1)
+    # Flows start from -duration (no flow lasts longer than the run): the run opens in steady
+    # state, with flows already in progress. Draw twice the expected flows, then fill the budget
+    arrivals = rng.poisson(rate / mean_flow * 2 * duration) * 2 + 16
+    starts = rng.uniform(-duration, duration, arrivals)
+    flow_bytes = np.minimum((rng.pareto(alpha, arrivals) + 1) * min_flow, cap)
+    counts = np.ceil(flow_bytes / mtu).astype(np.int64)
+    flows = np.repeat(np.arange(arrivals), counts)
+    # Packet k of a flow leaves k * mtu / pace after its start; the last one carries the remainder
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    k = np.arange(counts.sum()) - first
+    times = starts[flows] + k * (mtu / pace)
+    last = k == counts[flows] - 1
+    sizes = np.where(last, flow_bytes[flows] - (counts[flows] - 1) * mtu, mtu).astype(np.int64)
+    # ── Keep flows while their bytes inside the run fit in the budget ──
+    inside = (times >= 0) & (times < duration)
+    window = np.bincount(flows[inside], weights=np.maximum(sizes[inside], MIN_FRAME), minlength=arrivals)
+    kept = np.zeros(arrivals, dtype=bool)
+    budget = rate * duration
+    for flow in np.flatnonzero(window):
+        if window[flow] <= budget:
+            kept[flow] = True
+            budget -= window[flow]
+    keep = kept[flows]
+    return _schedule(times[keep], sizes[keep], flows[keep], duration)
+
+
+def poisson(rate: float, duration: float, rng: np.random.Generator, devices: int = 1000, size: int = 100) -> Schedule:
+    """
+    mMTC: `devices` sensors, each reporting `size` bytes at Poisson times.
+    :param rate: offered load (B/s), which sets the mean reporting interval (devices * size / rate)
+    """
+    count = rng.poisson(rate / size * duration)
+    times = np.sort(rng.uniform(0, duration, count))
+    return _schedule(times, np.full(count, size), rng.integers(0, devices, count), duration)
+
+
+MODELS = {"periodic": periodic, "heavy_tail": heavy_tail, "poisson": poisson}
+# Model of the slices of the default configuration, by slice name
+DEFAULT_MODELS = {"urllc": "periodic", "embb": "heavy_tail", "mmtc": "poisson"}
+
+
+# === Frames =====================================================================
+
+def _mac(text: str) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(text.replace(":", "")), dtype=np.uint8)
+
+
+def build_frames(sizes: np.ndarray, src: np.ndarray, dst: int, sport: np.ndarray, dport: np.ndarray,
+                 tos: np.ndarray, ident: np.ndarray, src_mac: str, dst_mac: str) -> PacketBatch:
+    """
+    Ethernet / IPv4 / UDP frames of the given sizes in one buffer, headers written column-wise.
+    :param src: IPv4 source address of every frame (int); dst: the destination (int)
+    """
+    n = len(sizes)
+    offsets = np.zeros(n, dtype=np.int64)
+    np.cumsum(sizes[:-1], out=offsets[1:])
+    header = np.zeros((n, HEADERS), dtype=np.uint8)
+    header[:, 0:6] = _mac(dst_mac)
+    header[:, 6:12] = _mac(src_mac)
+    header[:, 12:14] = (0x08, 0x00)
+    ip_len = sizes - 14
+    udp_len = ip_len - 20
+
+    def put16(column, values):
+        header[:, column] = values >> 8
+        header[:, column + 1] = values & 0xFF
+
+    def put32(column, values):
+        put16(column, values >> 16)
+        put16(column + 2, values & 0xFFFF)
+
+    header[:, 14] = 0x45
+    header[:, 15] = tos
+    put16(16, ip_len)
+    put16(18, ident & 0xFFFF)
+    header[:, 22] = 64  # TTL
+    header[:, 23] = 17  # UDP
+    put32(26, src)
+    put32(30, np.full(n, dst, dtype=np.int64))
+    # IPv4 header checksum over the ten 16-bit words (checksum field still zero)
+    words = header[:, 14:34].astype(np.int64)
+    total = (words[:, 0::2] << 8 | words[:, 1::2]).sum(axis=1)
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    put16(24, ~total & 0xFFFF)
+    put16(34, sport)
+    put16(36, dport)
+    put16(38, udp_len)  # UDP checksum left at 0 (optional over IPv4)
+    buffer = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    buffer[offsets[:, None] + np.arange(HEADERS)] = header
+    return PacketBatch.from_buffer(buffer, offsets, sizes)
+
+
+class TrafficGenerator:
+    def __init__(self, specs: List, duration: float = 10.0, load: float = 0.5, models: Optional[Dict[str, str]] = None,
+                 dst: str = "192.0.2.1", src_mac: str = "02:00:00:00:00:01", dst_mac: str = "ff:ff:ff:ff:ff:ff",
+                 seed: Optional[int] = None):
+        """
+        :param specs: SliceSpec of every slice (name, DSCP and rate)
+        :param load: offered load of a slice, as a fraction of its rate
+        :param models: slice name -> model name (default: DEFAULT_MODELS); other slices get no load
+        :param dst: destination IPv4 address of every frame (UDP port UDP_BASE_PORT + slice index)
+        """
+        self.duration = duration
+        self.dst = struct.unpack("!I", socket.inet_aton(dst))[0]
+        self.src_mac, self.dst_mac = src_mac, dst_mac
+        rng = np.random.default_rng(seed)
+        models = DEFAULT_MODELS if models is None else models
+        self.slices = []  # (name, model, dscp, port)
+        times, sizes, flows, slice_ids = [], [], [], []
+        for index, spec in enumerate(specs):
+            model = models.get(spec.name)
+            if model is None:
+                log('yellow', f"Slice {spec.name}: no workload model, no load generated")
+                continue
+            schedule = MODELS[model](load * parse_rate(spec.rate), duration, rng)
+            self.slices.append((spec.name, model, spec.dscp, UDP_BASE_PORT + index))
+            times.append(schedule.times)
+            sizes.append(schedule.sizes)
+            flows.append(schedule.flows)
+            slice_ids.append(np.full(len(schedule), len(self.slices) - 1))
+        if not self.slices:
+            raise ValueError("no slice has a workload model")
+        times = np.concatenate(times)
+        order = np.argsort(times, kind="stable")
+        self.times = times[order]
+        self.sizes = np.concatenate(sizes)[order]
+        self.flows = np.concatenate(flows)[order]
+        self.slice_ids = np.concatenate(slice_ids)[order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def chunks(self, start: float = 0.0):
+        """(send times, frames) in chunks of CHUNK frames; timestamps are start + send time."""
+        tos = np.array([dscp << 2 for _, _, dscp, _ in self.slices], dtype=np.int64)
+        ports = np.array([port for _, _, _, port in self.slices], dtype=np.int64)
+        for first in range(0, len(self), CHUNK):
+            part = slice(first, first + CHUNK)
+            slice_ids, flows = self.slice_ids[part], self.flows[part]
+            # One source address and port per (slice, flow): distinct 5-tuples for the flow hash
+            src = SOURCE_NET + ((slice_ids << 12) + flows) % 0xFFFF
+            batch = build_frames(self.sizes[part], src, self.dst, 10000 + flows % 50000, ports[slice_ids],
+                                 tos[slice_ids], np.arange(first, first + len(flows)), self.src_mac, self.dst_mac)
+            batch.timestamps[:len(batch)] = start + self.times[part]
+            yield self.times[part], batch
+
+    def summary(self) -> List[dict]:
+        rows = []
+        for index, (name, model, dscp, port) in enumerate(self.slices):
+            mine = self.slice_ids == index
+            rows.append({"slice": name, "model": model, "dscp": dscp, "port": port, "packets": int(mine.sum()),
+                         "flows": int(len(np.unique(self.flows[mine]))),
+                         "kbit": round(float(self.sizes[mine].sum()) * 8 / self.duration / 1e3, 1)})
+        return rows
+
+    def write_pcap(self, path: str) -> int:
+        pcap = Pcap(path)
+        try:
+            for _, batch in self.chunks(start=time.time()):
+                pcap.write_batch(batch)
+        finally:
+            pcap.close()
+        return len(self)
+
+    def send(self, interface: str) -> dict:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sock.bind((interface, 0))
+        try:
+            return pace(sock, self.chunks())
+        finally:
+            sock.close()
+
+
+def pace(sock: socket.socket, chunks) -> dict:
+    """Send (send times, frames) chunks on schedule. Returns the send and lateness counters."""
+    start = time.perf_counter()
+    sent = late_sum = late_max = bursts = 0
+    for times, batch in chunks:
+        i, n = 0, len(batch)
+        while i < n:
+            due = float(times[i])
+            wait = due - (time.perf_counter() - start)
+            if wait > SPIN:
+                time.sleep(wait - SPIN)
+            while time.perf_counter() - start < due:
+                pass
+            now = time.perf_counter() - start
+            # Every frame already due leaves now, back to back
+            end = max(int(np.searchsorted(times, now, side="right")), i + 1)
+            for k in range(i, end):
+                sock.send(batch.frame(k))
+            late = now - due
+            late_sum += late
+            late_max = max(late_max, late)
+            bursts += 1
+            sent += end - i
+            i = end
+    elapsed = time.perf_counter() - start
+    return {"sent": sent, "seconds": round(elapsed, 3), "bursts": bursts,
+            "late_mean_us": round(late_sum / bursts * 1e6, 1) if bursts else 0.0,
+            "late_max_us": round(late_max * 1e6, 1)}
+
+
+def replay(interface: str, path: str) -> dict:
+    """Send a PCAP (e.g. written with --pcap) on an interface with its original spacing."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic = struct.unpack("<I", data[:4])[0]
+    endian = "<" if magic in (0xa1b2c3d4, 0xa1b23c4d) else ">"
+    scale = 1e-9 if magic in (0xa1b23c4d, 0x4d3cb2a1) else 1e-6
+    frames, stamps, offset = [], [], 24
+    while offset + 16 <= len(data):
+        sec, frac, captured, _ = struct.unpack(endian + "IIII", data[offset:offset + 16])
+        frames.append(data[offset + 16:offset + 16 + captured])
+        stamps.append(sec + frac * scale)
+        offset += 16 + captured
+    if not frames:
+        return {"sent": 0}
+    batch = PacketBatch.from_frames(frames, stamps)
+    times = batch.timestamps[:len(batch)] - batch.timestamps[0]
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    sock.bind((interface, 0))
+    try:
+        return pace(sock, [(times, batch)])
+    finally:
+        sock.close()
+
+
+def _interface_mac(interface: str) -> Optional[str]:
+    try:
+        with open(f"/sys/class/net/{interface}/address") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def main():
+    from core.slice_config import ConfigError, load_config
+
+    parser = argparse.ArgumentParser(description="NetSlicer workload-model traffic generator")
+    parser.add_argument("interface", nargs="?", help="Send on this interface (raw socket, root)")
+    parser.add_argument("--config", default=config.DEFAULT_CONFIG, help="Slice configuration (DSCPs and rates)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    parser.add_argument("--load", type=float, default=0.5, help="Offered load of a slice, as a fraction of its rate")
+    parser.add_argument("--model", action="append", default=[], metavar="SLICE=MODEL",
+                        help=f"Workload model of a slice ({', '.join(MODELS)}); default: {DEFAULT_MODELS}")
+    parser.add_argument("--dst", default="192.0.2.1", help="Destination IPv4 address")
+    parser.add_argument("--dst-mac", default="ff:ff:ff:ff:ff:ff", help="Next-hop MAC address")
+    parser.add_argument("--src-mac", default=None, help="Source MAC address (default: the interface's)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the workload models")
+    parser.add_argument("--pcap", default=None, help="Write the load to this PCAP instead of sending it")
+    parser.add_argument("--replay", default=None, help="Send this PCAP on the interface with its original spacing")
+    parser.add_argument("--json", default=None, help="Also write the summary to this file")
+    opts = parser.parse_args()
+
+    if opts.replay:
+        if not opts.interface:
+            parser.error("--replay needs an interface")
+        log('cyan', json.dumps(replay(opts.interface, opts.replay)))
+        return
+    if not opts.interface and not opts.pcap:
+        parser.error("give an interface to send on, or --pcap")
+    try:
+        specs = load_config(opts.config).slices
+    except ConfigError as e:
+        log('red', str(e))
+        sys.exit(1)
+    models = dict(DEFAULT_MODELS)
+    for item in opts.model:
+        name, _, model = item.partition("=")
+        if model not in MODELS:
+            parser.error(f"unknown model {model!r} (known: {', '.join(MODELS)})")
+        models[name] = model
+    src_mac = opts.src_mac or (_interface_mac(opts.interface) if opts.interface else None) or "02:00:00:00:00:01"
+    generator = TrafficGenerator(specs, opts.duration, opts.load, models, opts.dst, src_mac, opts.dst_mac, opts.seed)
+    rows = generator.summary()
+    for row in rows:
+        log('blue', f"{row['slice']:<6} {row['model']:<10} DSCP {row['dscp']:<2} {row['packets']:>8} packets "
+                    f"{row['flows']:>6} flows {row['kbit']:>10} kbit/s")
+    result = {"slices": rows}
+    if opts.pcap:
+        log('cyan', f"Wrote {generator.write_pcap(opts.pcap)} frames to {opts.pcap}")
+    else:
+        if os.geteuid() != 0:
+            log('red', "Sending on a raw socket needs root")
+            sys.exit(1)
+        log('cyan', f"Sending {len(generator)} frames on {opts.interface} for {opts.duration:.0f}s...")
+        result["send"] = generator.send(opts.interface)
+        log('cyan', json.dumps(result["send"]))
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 import platform
 from typing import Optional
 
@@ -14,6 +15,9 @@ SLICE_POLICIES = {
 
 HANDLE = "1:"
 
+# Declarative slice configuration used when --config is not given
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slices.toml")
+
 # Platform Detection
 IS_LINUX = platform.system() == "Linux"
 IS_MACOS = platform.system() == "Darwin"
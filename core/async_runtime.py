@@ -0,0 +1,255 @@
+"""
+asyncio runtime: capture, batch deadlines, tc and the control plane on one event loop.
+
+The default runtime mixes a blocking scapy.sniff() loop, a threading.Timer per batch and
+synchronous tc calls. With --runtime asyncio everything runs in one thread instead:
+    capture     the raw AF_PACKET socket is registered with loop.add_reader() and drained
+                (up to max_drain frames per wake-up) straight into a PacketBatch, no Scapy
+    deadlines   a batch waiting for more frames is flushed by a loop timer (call_later)
+    tc          slices are installed and changed through asyncio subprocesses
+    polling     capture socket counters and tc class stats are refreshed by a periodic task
+    control     one HTTP server on the loop: GET /metrics, GET /stats,
+                POST /slices/<name>?rate=..&ceil=.. (tc class change), POST /stop
+
+Frames keep their DSCP (as with --keep-dscp) and the slicer's own transmissions are skipped.
+Slices still send with a plain packet-socket send, which does not wait on the wire.
+
+    python main.py --runtime asyncio --metrics-port 9108
+"""
+import asyncio
+import json
+import signal
+import socket
+import subprocess
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from core.classifier import PacketClassifier
+from core.network_slice import NetworkSlice
+from core.packet_batch import PacketBatch
+from core.packet_filter import KernelFilterStats
+from core.slice_config import SlicerConfig, compile_tc_plan
+from core.slices_setup import build_slices
+from utils.exporter import CONTENT_TYPES, METRICS, MetricsExporter, parse_tc_class_stats
+from utils.helpers import log
+from utils.metrics import PacketMetrics
+
+ETH_P_ALL = 0x0003
+PACKET_OUTGOING = 4  # sll_pkttype of frames this host transmitted
+RECV_SIZE = 65535
+
+
+async def run_tc(cmd: List[str]) -> None:
+    """Async counterpart of network_slice.run_tc_command (flower filters may fail with a warning)."""
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, stderr = await process.communicate()
+    if not process.returncode:
+        return
+    message = stderr.decode().strip().splitlines()[0] if stderr.strip() else "tc error"
+    if "flower" in cmd:
+        log('yellow', f"Skipping VLAN filter ({message})")
+        return
+    raise subprocess.CalledProcessError(process.returncode, cmd, stderr=message)
+
+
+async def tc_class_stats_async(interface: str) -> Dict[str, Dict[str, int]]:
+    process = await asyncio.create_subprocess_exec("tc", "-s", "-j", "class", "show", "dev", interface,
+                                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    stdout, _ = await process.communicate()
+    return parse_tc_class_stats(stdout.decode())
+
+
+class AsyncSlicer:
+    def __init__(self, interface: str, filters: Optional[str], slicer_config: SlicerConfig, args,
+                 metrics_port: Optional[int] = None, address: str = "0.0.0.0", stats_interval: float = 1.0,
+                 max_drain: int = 256):
+        """
+        :param filters: BPF expression attached to the capture socket (None: every frame)
+        :param metrics_port: port of the HTTP metrics / control server (None: no server)
+        :param stats_interval: seconds between two polls of the capture and tc counters
+        :param max_drain: most frames read per socket wake-up, so timers and requests still run
+        """
+        self.interface = interface
+        self.filters = filters
+        self.config = slicer_config
+        self.args = args
+        self.metrics_port = metrics_port
+        self.address = address
+        self.stats_interval = stats_interval
+        self.max_drain = max_drain
+        self.batch_size = max(slicer_config.batch_size, 1)
+        self.time_limit = slicer_config.time_limit
+        self.slices: Dict[str, NetworkSlice] = {}
+        self.classifier: Optional[PacketClassifier] = None
+        self.metrics = PacketMetrics()
+        self.sock: Optional[socket.socket] = None
+        self.filter_stats: Optional[KernelFilterStats] = None
+        self.capture: Dict[str, Optional[int]] = {}
+        self.tc_stats: Dict[str, Dict[str, int]] = {}
+        self.exporter: Optional[MetricsExporter] = None
+        self._batch = PacketBatch(capacity=self.batch_size)
+        self._spare = PacketBatch(capacity=self.batch_size)
+        self._deadline: Optional[asyncio.TimerHandle] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # === tc =====================================================================
+
+    async def setup_slices(self):
+        """setup_slices() through async subprocesses."""
+        self.slices = build_slices(self.interface, self.config.slices)
+        process = await asyncio.create_subprocess_exec("tc", "qdisc", "del", "dev", self.interface, "root",
+                                                       stderr=subprocess.DEVNULL)
+        await process.wait()
+        for name in self.slices:
+            log('yellow', f"Configuring slice {name}...")
+        for cmd in compile_tc_plan(self.interface, self.slices):
+            await run_tc(cmd)
+
+    async def change_rate(self, name: str, rate: Optional[str], ceil: Optional[str]):
+        ns = self.slices[name]
+        ns.policy.rate = rate or ns.policy.rate
+        ns.policy.ceil = ceil or ns.policy.ceil
+        await run_tc(["tc", "class", "change", "dev", self.interface, "parent", ns.tc_handle,
+                      "classid", ns.tc_classid, "htb", "rate", ns.policy.rate, "ceil", ns.policy.ceil,
+                      "burst", ns.policy.burst, "prio", str(ns.policy.prio)])
+        log('cyan', f"Slice {name}: rate {ns.policy.rate}, ceil {ns.policy.ceil}")
+
+    # === Capture ================================================================
+
+    def open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        sock.bind((self.interface, 0))
+        if self.filters:
+            from scapy.arch.linux import attach_filter
+            attach_filter(sock, self.filters, self.interface)
+        sock.setblocking(False)
+        return sock
+
+    def _on_readable(self):
+        now = time.time()
+        for _ in range(self.max_drain):
+            try:
+                frame, address = self.sock.recvfrom(RECV_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            if address[2] == PACKET_OUTGOING:
+                continue  # sent by the slices (or this host): not ours to classify
+            self._batch.append(frame, now)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+        if not len(self._batch):
+            return
+        if self.time_limit <= 0:
+            self.flush()  # no deadline configured: a batch is whatever one wake-up drained
+        elif self._deadline is None:
+            self._deadline = self._loop.call_later(self.time_limit, self.flush)
+
+    def flush(self):
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+        batch = self._batch
+        if not len(batch):
+            return
+        # Double buffering without locks: everything runs on the loop thread
+        self._batch, self._spare = self._spare, batch
+        start = time.perf_counter_ns()
+        batch.seal()
+        self.metrics.update_batch(batch)
+        self.classifier.classify_batch(batch)
+        METRICS.observe_flush(len(batch), time.perf_counter_ns() - start)
+        batch.clear()
+
+    # === Polling and control ====================================================
+
+    async def _poll(self):
+        while True:
+            self.capture = self.filter_stats.read()
+            self.tc_stats = await tc_class_stats_async(self.interface)
+            if self.args.display_metrics:
+                log('magenta', f"Packets/s: {self.metrics.pps()} | Throughput: {self.metrics.throughput()} KB/s | "
+                               f"Total Packets: {self.metrics.packet_count} | "
+                               f"Kernel drops: {self.capture['queue_drops']}")
+            await asyncio.sleep(self.stats_interval)
+
+    def stats(self) -> dict:
+        return {
+            "packets": self.metrics.packet_count,
+            "bytes": self.metrics.total_data,
+            "capture": self.capture,
+            "slices": {name: ns.get_stats() for name, ns in self.slices.items()},
+        }
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            method, target = lines[0].split(" ")[:2]
+            headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:] if line)}
+            status, content_type, body = await self._route(method, target, headers)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, content_type, body = "400 Bad Request", "text/plain", "bad request\n"
+        payload = body.encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    async def _route(self, method: str, target: str, headers: Dict[str, str]):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        if method == "GET" and parts == ["metrics"]:
+            openmetrics = "application/openmetrics-text" in headers.get("accept", "")
+            return "200 OK", CONTENT_TYPES[openmetrics], self.exporter.render(openmetrics, tc_stats=self.tc_stats)
+        if method == "GET" and parts == ["stats"]:
+            return "200 OK", "application/json", json.dumps(self.stats(), default=str) + "\n"
+        if method == "POST" and len(parts) == 2 and parts[0] == "slices" and parts[1] in self.slices:
+            try:
+                await self.change_rate(parts[1], query.get("rate"), query.get("ceil"))
+            except subprocess.CalledProcessError as e:
+                return "400 Bad Request", "text/plain", f"{e.stderr}\n"
+            return "200 OK", "application/json", json.dumps(self.stats()["slices"][parts[1]], default=str) + "\n"
+        if method == "POST" and parts == ["stop"]:
+            self.stop()
+            return "200 OK", "text/plain", "stopping\n"
+        return "404 Not Found", "text/plain", "not found\n"
+
+    # === Lifecycle ==============================================================
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        await self.setup_slices()
+        self.classifier = PacketClassifier(slices=self.slices, args=self.args)
+        self.sock = self.open_socket()
+        self.filter_stats = KernelFilterStats(self.sock, self.interface)
+        self.exporter = MetricsExporter(self.metrics_port, slices=self.slices, interface=self.interface,
+                                        capture_stats=lambda: self.capture)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(signum, self.stop)
+        self._loop.add_reader(self.sock.fileno(), self._on_readable)
+        poller = asyncio.create_task(self._poll())
+        server = None
+        if self.metrics_port:
+            server = await asyncio.start_server(self._handle_http, self.address, self.metrics_port)
+            log('blue', f"Metrics and control on :{self.metrics_port} (/metrics, /stats, /slices/<name>, /stop)")
+        log('cyan', f"asyncio runtime capturing on {self.interface}... Press Ctrl+C to stop.")
+        try:
+            await self._stopped.wait()
+        finally:
+            self._loop.remove_reader(self.sock.fileno())
+            self.flush()
+            self.classifier.close()
+            poller.cancel()
+            if server:
+                server.close()
+                await server.wait_closed()
+            log('cyan', self.filter_stats.summary())
+            self.sock.close()
@@ -1,46 +1,64 @@
 import threading
+import time
 
-import torch
-from scapy.packet import Packet
-from scapy.packet import Packet
+import numpy as np
 from termcolor import cprint
-from termcolor import cprint
-from typing import Dict
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 from core.network_slice import NetworkSlice
-from core.network_slice import NetworkSlice
+from core.packet_batch import PacketBatch
 from utils import log
+from utils.exporter import METRICS
+from utils.profiling import TIMERS
+
+if TYPE_CHECKING:
+    from scapy.packet import Packet
 
 
 def gpu_frontend(func):
     """
     Decorator that turns classify_packet into GPU‐batching.
-    It buffers incoming packets in self._buffer and, once either
-      • len(self._buffer) == self.batch_size, or
+    It serializes incoming packets once into self._batch (a PacketBatch) and, once either
+      • len(self._batch) == self.batch_size, or
       • self.time_limit seconds have elapsed since the first packet in the current batch,
-    it will flush the buffer by calling self._flush_buffer(), which invokes the original
-    per‐packet logic (_classify_single) on each packet in GPU.
+    it will flush the buffer by calling self._flush_buffer(), which classifies the whole
+    batch at once and hands index views of it to the slices. The timer is armed with the
+    generation of the batch it waits for: fired late, after that batch was flushed by size,
+    it does nothing.
     """
 
-    def wrapper(self, packet: Packet):
+    def wrapper(self, packet: "Packet"):
+        timed = TIMERS.enabled  # no clock reads per packet unless profiling
+        if timed:
+            start = time.perf_counter_ns()
+            frame = bytes(packet)
+            locked = time.perf_counter_ns()
+            TIMERS.add("classifier.serialize", locked - start)
+        else:
+            frame = bytes(packet)
         with self._lock:
-            self._buffer.append(packet)
-            if len(self._buffer) == 1 and self.time_limit > 0:
-                self._timer = threading.Timer(self.time_limit, self._flush_buffer)
+            if timed:
+                TIMERS.add("classifier.lock_wait", time.perf_counter_ns() - locked)
+            self._batch.append(frame, float(packet.time))
+            if len(self._batch) == 1 and self.time_limit > 0:
+                self._timer = threading.Timer(self.time_limit, self._flush_buffer, args=(self._generation,))
                 self._timer.start()
 
             # 3) If we've reached batch_size, cancel any pending timer and flush immediately:
-            if len(self._buffer) >= self.batch_size:
-                if self._timer:
-                    self._timer.cancel()
-                    self._timer = None
-                # Flush right away
-                self._flush_buffer()
+            flush = len(self._batch) >= self.batch_size
+            if flush and self._timer:
+                self._timer.cancel()
+                self._timer = None
+        if flush:
+            # Flush right away
+            self._flush_buffer()
 
     return wrapper
 
 
+SLICE_COLORS = {"urllc": "blue", "embb": "green", "mmtc": "yellow"}
+
+
 class PacketClassifier:
     def __init__(self, slices: Dict[str, NetworkSlice], args, batch_size: int = 1, time_limit: float = 0.0):
         """
@@ -51,117 +69,139 @@ class PacketClassifier:
         """
         self.args = args
         self.slices: Dict[str, NetworkSlice] = slices
+        self.slice_names: List[str] = list(slices)
+        # DSCP -> slice index lookup table (-1 = unclassified)
+        self.dscp_table = np.full(64, -1, dtype=np.int16)
+        for index, ns in enumerate(slices.values()):
+            self.dscp_table[ns.dscp & 0x3F] = index
+        METRICS.register_slices(self.slice_names)
+        # Learned flow classifier for untagged traffic (--ml-model, see core.flow_model)
+        from core.flow_model import load_flow_classifier
+        self.flow_classifier = load_flow_classifier(args, self.slice_names)
+        # Per-flow IPFIX records of what the slices carried (--flow-export, see core.flow_meter)
+        from core.flow_meter import load_flow_meter
+        self.flow_meter = load_flow_meter(args)
 
         # GPU‐batching parameters
         self.batch_size = batch_size
         self.time_limit = time_limit
 
-        # Internal buffering state:
-        self._buffer: List[Packet] = []
+        # Internal buffering state (double-buffered: the flushed batch is recycled once processed):
+        self._batch = PacketBatch(capacity=max(batch_size, 1))
+        self._spare: List[PacketBatch] = []
         self._lock = threading.Lock()
         self._timer: threading.Timer = None
+        self._generation = 0  # batches swapped out so far (see gpu_frontend)
+        # The size and timer flushes run on different threads: one batch is classified at a time,
+        # so the slices, their stages and METRICS keep a single writer
+        self._flush_lock = threading.Lock()
         log('blue', f"Packet Classifier started ...")
 
     @gpu_frontend
-    def classify_packet(self, packet: Packet):
-        print(f"Classifying packet {packet}")
+    def classify_packet(self, packet: "Packet"):
         pass
 
-    def _flush_buffer(self):
-        with self._lock:
-            packets_to_process = self._buffer.copy()
-            print(f"packets_to_process={packets_to_process}")
-            self._buffer.clear()
-            if self._timer:
+    def _flush_buffer(self, generation: Optional[int] = None):
+        """:param generation: set by the timer: only flush if that batch is still the one buffering"""
+        with self._flush_lock:
+            with self._lock:
+                if generation is not None and generation != self._generation:
+                    return
+                batch = self._batch
+                self._batch = self._spare.pop() if self._spare else PacketBatch(capacity=max(self.batch_size, 1))
+                self._generation += 1
                 self._timer = None
 
-        if not packets_to_process:
-            return
-
-        # ── GPU‐Accelerated Classification Pipeline ────────────────────────────────────
-
-        tos_list = [pkt["IP"].tos for pkt in packets_to_process]
-        tos_tensor = torch.tensor(tos_list, dtype=torch.uint8, device="cuda")
-        dscp_tensor = tos_tensor >> 2
-        # URLLC: dscp == 46 | eMBB: dscp == 10 | mMTC: dscp == 0 | others = unclassified
-        mask_urllc = (dscp_tensor == 46)
-        mask_embb  = (dscp_tensor == 10)
-        mask_mmtc  = (dscp_tensor == 0)
-
-        idx_urllc = torch.nonzero(mask_urllc, as_tuple=True)[0]
-        idx_embb  = torch.nonzero(mask_embb,  as_tuple=True)[0]
-        idx_mmtc  = torch.nonzero(mask_mmtc,  as_tuple=True)[0]
-        idx_other = torch.nonzero(~(mask_urllc | mask_embb | mask_mmtc), as_tuple=True)[0]
-
-        # 5) For each slice, gather the corresponding Packet objects into a Python list
-        def gather_subbatch(indices_tensor):
-            if indices_tensor.numel() == 0:
-                return []
-            idx_list = indices_tensor.to("cpu").tolist()
-            return [packets_to_process[i] for i in idx_list]
-
-        sub_urllc = gather_subbatch(idx_urllc)
-        sub_embb  = gather_subbatch(idx_embb)
-        sub_mmtc  = gather_subbatch(idx_mmtc)
-        sub_other = gather_subbatch(idx_other)
-        # ── Return to CPU for dispatching sub‐batchs to slices ────────────────────────────────────
-        if sub_urllc:
-            ns: NetworkSlice = self.slices["urllc"]
-            try:
-                cprint(f">> [GPU] URLLC batch of {len(sub_urllc)} packets", "blue", attrs=["bold"])
-                ns.process_packet_batch_gpu(sub_urllc)
-            except AttributeError:
-                cprint(f">> [CPU fallback] URLLC batch of {len(sub_urllc)} packets", "light_blue", attrs=["bold"])
-                for pkt in sub_urllc:
-                    ns.process_packet(pkt)
-        if sub_embb:
-            ns: NetworkSlice = self.slices["embb"]
-            try:
-                cprint(f">> [GPU] eMBB batch of {len(sub_embb)} packets", "green", attrs=["bold"])
-                ns.process_packet_batch_gpu(sub_embb)
-            except AttributeError:
-                cprint(f">> [CPU fallback] eMBB batch of {len(sub_embb)} packets", "light_green", attrs=["bold"])
-                for pkt in sub_embb:
-                    ns.process_packet(pkt)
-        if sub_mmtc:
-            ns: NetworkSlice = self.slices["mmtc"]
-            try:
-                cprint(f">> [GPU] mMTC batch of {len(sub_mmtc)} packets", "yellow", attrs=["bold"])
-                ns.process_packet_batch_gpu(sub_mmtc)
-            except AttributeError:
-                cprint(f">> [CPU fallback] mMTC batch of {len(sub_mmtc)} packets", "light_yellow", attrs=["bold"])
-                for pkt in sub_mmtc:
-                    ns.process_packet(pkt)
-        if sub_other:
-            for pkt in sub_other:
-                dscp = pkt["IP"].tos >> 2
-                cprint(f">> Packet[DSCP={dscp} | {pkt['IP'].tos}] is not classified!", "grey")
-
-    def _classify_single(self, packet: Packet):
+            if len(batch):
+                start = time.perf_counter_ns()
+                batch.seal()
+                sealed = time.perf_counter_ns()
+                TIMERS.add("classifier.seal", sealed - start)
+                self._classify(batch)
+                stop = time.perf_counter_ns()
+                TIMERS.add("classifier.dispatch", stop - sealed)
+                METRICS.observe_flush(len(batch), stop - start)
+        batch.clear()
+        with self._lock:
+            self._spare.append(batch)
+
+    def classify_frames(self, buffer, offsets, lengths, timestamps=None):
+        """Classify a block of raw frames laid out in one buffer (decoded in a single pass)."""
+        self.classify_batch(PacketBatch.from_buffer(buffer, offsets, lengths, timestamps))
+
+    def classify_batch(self, batch: PacketBatch):
+        """Split a batch by DSCP and hand one index view per slice to the slices."""
+        with self._flush_lock:
+            self._classify(batch)
+
+    def _classify(self, batch: PacketBatch):
+        view = batch.view()
+        slice_ids = np.where(view.l3_offsets >= 0, self.dscp_table[view.dscp], -1)
+        if self.flow_classifier is not None:
+            slice_ids = self.flow_classifier.assign(view, slice_ids)
+        METRICS.add_batch(slice_ids, view.lengths)
+        dscp_in = view.dscp if self.flow_meter is not None else None
+        metered = []  # what the slices forwarded, to the flow meter
+        for index, name in enumerate(self.slice_names):
+            sub = view.select(slice_ids == index)
+            if not len(sub):
+                continue
+            ns: NetworkSlice = self.slices[name]
+            color = SLICE_COLORS.get(name, "white")
+            if self.args.gpu:
+                cprint(f">> [GPU] {name} batch of {len(sub)} packets", color, attrs=["bold"])
+                sent = ns.process_packet_batch_gpu(sub)
+            else:
+                cprint(f">> [CPU] {name} batch of {len(sub)} packets", f"light_{color}", attrs=["bold"])
+                sent = ns.process_batch(sub)
+            metered.append(sent.indices)
+        other = view.select(slice_ids < 0)
+        for dscp in other.dscp:
+            cprint(f">> Packet[DSCP={dscp}] is not classified!", "grey")
+        if self.flow_meter is not None:
+            # Only what the slices sent (pipeline and flow queue drops left out), plus the
+            # unclassified packets. The batch columns now read the remarked DSCP
+            rows = np.concatenate(metered + [other.indices])
+            self.flow_meter.update(batch.select(rows), slice_ids[rows], dscp_in[rows])
+
+    def close(self):
+        """Classify what is still buffered and export the open flows."""
+        if self._timer:
+            self._timer.cancel()
+        self._flush_buffer()
+        if self.flow_meter is not None:
+            self.flow_meter.stop()
+            self.flow_meter = None
+
+    def _classify_single(self, packet: "Packet"):
         """
         The original per‐packet logic for DSCP‐based slicing. Identical to your original code.
         """
-        if not packet.haslayer("IP"):
+        if packet.haslayer("IP"):
+            tos = packet["IP"].tos
+        elif packet.haslayer("IPv6"):
+            tos = packet["IPv6"].tc
+        else:
             print("Warning: Non-IP packet cannot be sliced")
             return
 
-        # Extract DSCP (top 6 bits of TOS)
-        dscp = packet["IP"].tos >> 2
+        # Extract DSCP (top 6 bits of TOS / traffic class)
+        dscp = tos >> 2
 
         if dscp == 46:
             ns: NetworkSlice = self.slices["urllc"]
             ns.process_packet(packet)
-            cprint(f">> Packet send to [{dscp} | {packet['IP'].tos}] URLLC Slice", "blue", attrs=["bold"])
+            cprint(f">> Packet send to [{dscp} | {tos}] URLLC Slice", "blue", attrs=["bold"])
         elif dscp == 10:
             ns: NetworkSlice = self.slices["embb"]
             ns.process_packet(packet)
-            cprint(f">> Packet send to [{dscp} | {packet['IP'].tos}] eMBB Slice", "green", attrs=["bold"])
+            cprint(f">> Packet send to [{dscp} | {tos}] eMBB Slice", "green", attrs=["bold"])
         elif dscp == 0:
             ns: NetworkSlice = self.slices["mmtc"]
             ns.process_packet(packet)
-            cprint(f">> Packet send to [{dscp} | {packet['IP'].tos}] mMTC Slice", "yellow", attrs=["bold"])
+            cprint(f">> Packet send to [{dscp} | {tos}] mMTC Slice", "yellow", attrs=["bold"])
         else:
-            cprint(f">> Packet[DSCP={dscp} | {packet['IP'].tos}] is not classified! ", "grey")
+            cprint(f">> Packet[DSCP={dscp} | {tos}] is not classified! ", "grey")
 
 
 class PacketClassifier0:
@@ -176,7 +216,7 @@ class PacketClassifier0:
     forward packets
     """
 
-    def classify_packet(self, packet: Packet):
+    def classify_packet(self, packet: "Packet"):
         """
         Route a packet to the appropriate slice based on DSCP/TOS value
         """
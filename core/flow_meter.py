@@ -0,0 +1,406 @@
+"""
+Per-flow slice telemetry exported as IPFIX (RFC 7011) records instead of one row per packet.
+
+The classifier hands a FlowMeter the frames the slices forwarded (what their pipelines and
+flow queues dropped is left out; a frame a full flow queue evicts later stays counted, it
+shows in the slice's fair-queue drops) and the unclassified ones, once per batch:
+    FlowMeter     fixed-size arrays indexed by (flow hash, slice), updated once per batch:
+                  packets, bytes, first / last seen, DSCP before (first packet) and after
+                  (last packet) remarking. A sweep at least every `sweep` seconds ends the
+                  flows idle for idle_timeout or older than active_timeout; a flow colliding
+                  with another one in its slot ends the older one ("lack of resources").
+    IPFIXWriter   encodes the ended flows in bulk (one template per IP version, fixed-size
+                  records written straight from a NumPy structured array) to a file of
+                  IPFIX messages (RFC 5655) or to a UDP collector.
+
+The slice of a record is an enterprise-specific element (SLICE_ELEMENT, default under the
+documentation enterprise number) holding the slice index in configuration order, 255 for
+unclassified packets. Per-slice usage of an export file:
+    python -m core.flow_meter flows.ipfix [slices.toml]
+"""
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from core.packet_batch import BatchView
+from utils.helpers import log
+
+IPFIX_VERSION = 10
+TEMPLATE_SET = 2
+TEMPLATE_IPV4, TEMPLATE_IPV6 = 256, 257
+ENTERPRISE = 32473  # RFC 5612 documentation PEN: set your own for production collectors
+SLICE_ELEMENT = 1
+UNCLASSIFIED = 255
+# flowEndReason (IANA IE 136)
+END_IDLE, END_ACTIVE, END_FORCED, END_RESOURCES = 1, 2, 4, 5
+
+# (record field, information element id, enterprise number or 0); lengths come from the dtypes
+_FIELDS = [("flow_id", 148, 0), ("start", 152, 0), ("end", 153, 0), ("packets", 2, 0), ("octets", 1, 0),
+           ("src", None, 0), ("dst", None, 0), ("sport", 7, 0), ("dport", 11, 0), ("proto", 4, 0),
+           ("dscp", 195, 0), ("post_dscp", 98, 0), ("reason", 136, 0), ("slice", SLICE_ELEMENT, ENTERPRISE)]
+_ADDRESS_IE = {TEMPLATE_IPV4: (8, 12), TEMPLATE_IPV6: (27, 28)}
+
+
+def _record_dtype(address) -> np.dtype:
+    # Packed and big-endian: the bytes of the array are the IPFIX data records
+    return np.dtype([("flow_id", ">u8"), ("start", ">u8"), ("end", ">u8"), ("packets", ">u8"), ("octets", ">u8"),
+                     ("src", address), ("dst", address), ("sport", ">u2"), ("dport", ">u2"), ("proto", "u1"),
+                     ("dscp", "u1"), ("post_dscp", "u1"), ("reason", "u1"), ("slice", "u1")])
+
+
+RECORDS = {TEMPLATE_IPV4: _record_dtype(">u4"), TEMPLATE_IPV6: _record_dtype(("u1", 16))}
+
+
+def template_set(template_ids=(TEMPLATE_IPV4, TEMPLATE_IPV6), enterprise: int = ENTERPRISE) -> bytes:
+    """Template set describing the records of the given templates."""
+    body = b""
+    for template_id in template_ids:
+        dtype = RECORDS[template_id]
+        body += struct.pack("!HH", template_id, len(_FIELDS))
+        for name, element, pen in _FIELDS:
+            if element is None:
+                element = _ADDRESS_IE[template_id][name == "dst"]
+            length = dtype.fields[name][0].itemsize
+            if pen:
+                body += struct.pack("!HHI", element | 0x8000, length, enterprise)
+            else:
+                body += struct.pack("!HH", element, length)
+    return struct.pack("!HH", TEMPLATE_SET, 4 + len(body)) + body
+
+
+class IPFIXWriter:
+    def __init__(self, target: str, domain: Optional[int] = None, max_message: Optional[int] = None,
+                 enterprise: int = ENTERPRISE):
+        """
+        :param target: "udp://host:port" (collector) or a file path (appended to)
+        :param domain: observation domain id (default: the process id, one per capture worker)
+        :param max_message: largest IPFIX message (default: 1400 bytes over UDP, 64 KB to a file)
+        :param enterprise: enterprise number of the slice element
+        """
+        self.target = target
+        self.domain = (os.getpid() if domain is None else domain) & 0xFFFFFFFF
+        self.sequence = 0  # data records exported so far (the IPFIX sequence number)
+        self.messages = 0
+        self.templates = template_set(enterprise=enterprise)
+        if target.startswith("udp://"):
+            host, _, port = target[len("udp://"):].rpartition(":")
+            self.address = (host.strip("[]"), int(port))
+            family = socket.AF_INET6 if ":" in self.address[0] else socket.AF_INET
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+            self.fd = None
+            self.max_message = max_message or 1400
+        else:
+            self.sock = None
+            self.fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self.max_message = min(max_message or 65535, 65535)
+        self._template_sent = False
+
+    def _message(self, sets: bytes, records: int) -> bytes:
+        header = struct.pack("!HHIII", IPFIX_VERSION, 16 + len(sets), int(time.time()), self.sequence, self.domain)
+        self.sequence = (self.sequence + records) & 0xFFFFFFFF
+        return header + sets
+
+    def write(self, records: Dict[int, np.ndarray]) -> int:
+        """Export record arrays keyed by template id. Returns the number of messages sent."""
+        messages = []
+        for template_id, rows in records.items():
+            if not len(rows):
+                continue
+            # Big-endian on the wire (np.concatenate hands back native byte order)
+            rows = rows.astype(RECORDS[template_id], copy=False)
+            # UDP collectors may start (or restart) anytime: the templates ride in every message
+            templates = self.templates if self.sock is not None or not self._template_sent else b""
+            per_message = (self.max_message - 16 - len(self.templates) - 4) // rows.dtype.itemsize
+            for first in range(0, len(rows), per_message):
+                part = rows[first:first + per_message]
+                data = part.tobytes()
+                sets = templates + struct.pack("!HH", template_id, 4 + len(data)) + data
+                messages.append(self._message(sets, len(part)))
+                templates = b"" if self.sock is None else self.templates
+            self._template_sent = True
+        for message in messages:
+            if self.sock is not None:
+                self.sock.sendto(message, self.address)
+            else:
+                os.write(self.fd, message)  # one append per message: workers may share the file
+        self.messages += len(messages)
+        return len(messages)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def read_records(path: str) -> Dict[int, np.ndarray]:
+    """Records of an IPFIX file written by IPFIXWriter, keyed by template id (other sets are skipped)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    parts: Dict[int, List[np.ndarray]] = {template_id: [] for template_id in RECORDS}
+    position = 0
+    while position + 16 <= len(data):
+        version, length = struct.unpack_from("!HH", data, position)
+        if version != IPFIX_VERSION or length < 16:
+            raise ValueError(f"{path}: not an IPFIX message at byte {position}")
+        offset, end = position + 16, position + length
+        while offset + 4 <= end:
+            set_id, set_length = struct.unpack_from("!HH", data, offset)
+            if set_id in RECORDS:
+                dtype = RECORDS[set_id]
+                count = (set_length - 4) // dtype.itemsize
+                parts[set_id].append(np.frombuffer(data, dtype=dtype, count=count, offset=offset + 4))
+            offset += max(set_length, 4)
+        position = end
+    return {template_id: np.concatenate(rows) if rows else np.zeros(0, dtype=RECORDS[template_id])
+            for template_id, rows in parts.items()}
+
+
+class FlowMeter:
+    def __init__(self, writer: IPFIXWriter, capacity: int = 65536, active_timeout: float = 60.0,
+                 idle_timeout: float = 15.0, sweep: float = 1.0):
+        """
+        :param writer: where ended flows are exported
+        :param capacity: flow slots (power of two); colliding flows end each other
+        :param active_timeout: seconds after which a long flow is exported (and restarted)
+        :param idle_timeout: seconds without packets after which a flow is exported
+        :param sweep: seconds between two expiry sweeps (and bulk exports)
+        """
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError(f"capacity must be a power of two (got {capacity})")
+        self.writer = writer
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.active_timeout = active_timeout
+        self.idle_timeout = idle_timeout
+        self.sweep = sweep
+        self.used = np.zeros(capacity, dtype=bool)
+        self.key = np.zeros(capacity, dtype=np.uint32)
+        self.slice = np.zeros(capacity, dtype=np.uint8)
+        self.packets = np.zeros(capacity, dtype=np.uint64)
+        self.octets = np.zeros(capacity, dtype=np.uint64)
+        self.first = np.zeros(capacity)
+        self.last = np.zeros(capacity)
+        self.dscp = np.zeros(capacity, dtype=np.uint8)
+        self.post_dscp = np.zeros(capacity, dtype=np.uint8)
+        self.version = np.zeros(capacity, dtype=np.uint8)
+        self.proto = np.zeros(capacity, dtype=np.uint8)
+        self.sport = np.zeros(capacity, dtype=np.uint16)
+        self.dport = np.zeros(capacity, dtype=np.uint16)
+        self.src = np.zeros(capacity, dtype=np.uint32)
+        self.dst = np.zeros(capacity, dtype=np.uint32)
+        # IPv6 flows: the batch only keeps folded addresses, the full ones are read from the first frame
+        self.src6 = np.zeros((capacity, 16), dtype=np.uint8)
+        self.dst6 = np.zeros((capacity, 16), dtype=np.uint8)
+        self._mark = np.zeros(capacity, dtype=bool)  # scratch: slots with a counted packet this round
+        self._outbox: Dict[int, List[np.ndarray]] = {template_id: [] for template_id in RECORDS}
+        self._lock = threading.Lock()
+        # Meter clock: the packet timestamps, advanced by wall time while no packet comes
+        self._packet_time = None
+        self._seen_at = 0.0
+        self._swept = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.counts = {"flows": 0, "records": 0, "evicted": 0}
+
+    def now(self) -> float:
+        if self._packet_time is None:
+            return time.time()
+        return self._packet_time + time.monotonic() - self._seen_at
+
+    # === Metering ===
+    def update(self, view: BatchView, slice_ids: np.ndarray, dscp_in: np.ndarray):
+        """
+        Account the frames of a batch the slices forwarded, once they processed it.
+        :param slice_ids: slice index of every packet (-1: unclassified)
+        :param dscp_in: DSCP of every packet before remarking (view.dscp is read as the remarked one)
+        """
+        if not len(view):
+            return
+        hashes, times, sizes = view.flow_hash, view.timestamps, view.lengths.astype(np.uint64)
+        slices = np.where(slice_ids >= 0, slice_ids, UNCLASSIFIED).astype(np.uint8)
+        post_dscp = view.dscp
+        # The slice is part of the key: a flow moved to another slice is accounted there separately
+        slots = ((hashes ^ (slices.astype(np.uint32) * np.uint32(0x9E3779B1))) & self.mask).astype(np.int64)
+        with self._lock:
+            self._packet_time, self._seen_at = float(times.max()), time.monotonic()
+            if self._swept is None:
+                self._swept = self._packet_time
+            pending = np.arange(len(view))
+            while len(pending):
+                s = slots[pending]
+                mine = self.used[s] & (self.key[s] == hashes[pending]) & (self.slice[s] == slices[pending])
+                # ── New flows claim their slot (first packet wins), ending the flow holding it ──
+                # A slot whose flow also has packets here is claimed next round, once they are counted
+                new = ~mine
+                if new.any():
+                    self._mark[s[mine]] = True
+                    new &= ~self._mark[s]
+                    self._mark[s[mine]] = False
+                if new.any():
+                    claimed, first = np.unique(s[new], return_index=True)
+                    rows = pending[new][first]
+                    evicted = claimed[self.used[claimed]]
+                    if len(evicted):
+                        self.counts["evicted"] += len(evicted)
+                        self._end(evicted, END_RESOURCES)
+                    self._claim(view, claimed, rows, hashes[rows], slices[rows], dscp_in[rows], times[rows])
+                    mine = self.used[s] & (self.key[s] == hashes[pending]) & (self.slice[s] == slices[pending])
+                # ── Per-flow sums over the batch (unbuffered ufunc.at: repeated slots accumulate) ──
+                counted, flows = pending[mine], s[mine]
+                np.add.at(self.packets, flows, np.uint64(1))
+                np.add.at(self.octets, flows, sizes[counted])
+                np.minimum.at(self.first, flows, times[counted])
+                np.maximum.at(self.last, flows, times[counted])
+                self.post_dscp[flows] = post_dscp[counted]
+                pending = pending[~mine]
+            if self._packet_time - self._swept >= self.sweep:
+                self._expire(self._packet_time)
+
+    def _claim(self, view: BatchView, slots, rows, keys, slices, dscp_in, times):
+        self.used[slots] = True
+        self.key[slots] = keys
+        self.slice[slots] = slices
+        self.packets[slots] = 0
+        self.octets[slots] = 0
+        self.first[slots] = times
+        self.last[slots] = times
+        self.dscp[slots] = dscp_in
+        for column in ("version", "proto", "sport", "dport", "src", "dst"):
+            source = "ip_version" if column == "version" else column
+            getattr(self, column)[slots] = getattr(view.batch, source)[view.indices[rows]]
+        v6 = self.version[slots] == 6
+        if v6.any():
+            batch = view.batch
+            frames = view.indices[rows[v6]]
+            ip = (batch.offsets[frames] + batch.l3_offsets[frames])[:, None] + np.arange(16)
+            self.src6[slots[v6]] = batch.buffer[ip + 8]
+            self.dst6[slots[v6]] = batch.buffer[ip + 24]
+        self.counts["flows"] += len(slots)
+
+    def _end(self, slots: np.ndarray, reason):
+        """Queue the records of these flows for export and free their slots."""
+        reasons = np.broadcast_to(np.asarray(reason, dtype=np.uint8), slots.shape)
+        v6 = self.version[slots] == 6
+        for template_id, part in ((TEMPLATE_IPV4, slots[~v6]), (TEMPLATE_IPV6, slots[v6])):
+            if not len(part):
+                continue
+            records = np.zeros(len(part), dtype=RECORDS[template_id])
+            records["flow_id"] = self.key[part]
+            records["start"] = np.round(self.first[part] * 1000)
+            records["end"] = np.round(self.last[part] * 1000)
+            records["packets"] = self.packets[part]
+            records["octets"] = self.octets[part]
+            if template_id == TEMPLATE_IPV6:
+                records["src"] = self.src6[part]
+                records["dst"] = self.dst6[part]
+            else:
+                records["src"] = self.src[part]
+                records["dst"] = self.dst[part]
+            for column in ("sport", "dport", "proto", "dscp", "post_dscp", "slice"):
+                records[column] = getattr(self, column)[part]
+            records["reason"] = reasons[v6] if template_id == TEMPLATE_IPV6 else reasons[~v6]
+            self._outbox[template_id].append(records)
+        self.used[slots] = False
+        self.counts["records"] += len(slots)
+
+    # === Expiry and export ===
+    def _expire(self, now: float, force: bool = False):
+        self._swept = now
+        if force:
+            ended = np.flatnonzero(self.used)
+            self._end(ended, END_FORCED)
+        else:
+            idle = self.used & (now - self.last >= self.idle_timeout)
+            active = self.used & ~idle & (now - self.first >= self.active_timeout)
+            ended = np.flatnonzero(idle | active)
+            self._end(ended, np.where(idle[ended], END_IDLE, END_ACTIVE))
+        outbox = {template_id: np.concatenate(parts) for template_id, parts in self._outbox.items() if parts}
+        for parts in self._outbox.values():
+            parts.clear()
+        if outbox:
+            try:
+                self.writer.write(outbox)
+            except OSError as e:
+                log('red', f"Flow export to {self.writer.target} failed: {e}")
+
+    def expire(self, force: bool = False):
+        """End the idle and too long flows (all of them with force) and export the ended ones."""
+        with self._lock:
+            self._expire(self.now(), force)
+
+    def start(self):
+        """Sweep on wall time too, so flows end while no traffic drives update()."""
+        def sweeper():
+            while not self._stop.wait(self.sweep):
+                self.expire()
+
+        self._thread = threading.Thread(target=sweeper, name="flow-meter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Export every flow still open and close the writer."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.expire(force=True)
+        self.writer.close()
+        log('blue', f"Flow meter: {self.counts['records']} records in {self.writer.messages} IPFIX messages "
+                    f"to {self.writer.target}")
+
+    def stats(self) -> dict:
+        return dict(self.counts, active=int(self.used.sum()), messages=self.writer.messages)
+
+
+def load_flow_meter(args) -> Optional[FlowMeter]:
+    """Running FlowMeter exporting to args.flow_export (None without one)."""
+    target = getattr(args, "flow_export", None)
+    if not target:
+        return None
+    meter = FlowMeter(IPFIXWriter(target), active_timeout=getattr(args, "flow_active_timeout", 60.0),
+                      idle_timeout=getattr(args, "flow_idle_timeout", 15.0))
+    meter.start()
+    log('blue', f"Flow meter exporting IPFIX to {target} (active {meter.active_timeout}s, idle {meter.idle_timeout}s)")
+    return meter
+
+
+def usage(records: Dict[int, np.ndarray], names: List[str]) -> List[dict]:
+    """Per-slice flows, packets and bytes of exported records."""
+    def column(name):
+        return np.concatenate([r[name] for r in records.values()])
+
+    slices, flow_ids, packets, octets = column("slice"), column("flow_id"), column("packets"), column("octets")
+    rows = []
+    for index in np.unique(slices):
+        mine = slices == index
+        rows.append({"slice": names[index] if index < len(names) else ("unclassified" if index == UNCLASSIFIED
+                                                                          else str(index)),
+                     "records": int(mine.sum()), "flows": len(np.unique(flow_ids[mine])),
+                     "packets": int(packets[mine].sum()), "bytes": int(octets[mine].sum())})
+    return rows
+
+
+if __name__ == "__main__":
+    import config
+    from core.slice_config import ConfigError, load_config
+
+    if len(sys.argv) < 2:
+        print("usage: python -m core.flow_meter <flows.ipfix> [slices.toml]")
+        sys.exit(2)
+    try:
+        slice_names = [spec.name for spec in load_config(sys.argv[2] if len(sys.argv) > 2
+                                                         else config.DEFAULT_CONFIG).slices]
+    except ConfigError as e:
+        log('red', str(e))
+        sys.exit(1)
+    for row in usage(read_records(sys.argv[1]), slice_names):
+        print(f"{row['slice']:>14}  {row['flows']:>8} flows  {row['records']:>8} records  "
+              f"{row['packets']:>10} packets  {row['bytes']:>12} bytes")
@@ -0,0 +1,265 @@
+"""
+Learned flow classifier: slice assignment from per-flow behaviour instead of the DSCP alone.
+
+Untagged traffic (DSCP 0, or a DSCP no slice owns) otherwise always lands in the same
+slice. With --ml-model, the classifier keeps a flow table next to the DSCP table:
+    FlowTable     fixed-size arrays indexed by flow hash, updated once per batch (sorted
+                  by flow, then reduceat): packets, size moments and extremes, inter-arrival
+                  time moments, protocol and service port
+    FlowModel     a small model mapping FEATURES to slice probabilities, run on every flow
+                  that needs a verdict in one batched call: TorchScript (.pt), ONNX (.onnx)
+                  or a NumPy MLP (.npz, no extra dependency)
+    FlowClassifier
+                  caches the verdict and its confidence in the flow table. A flow is asked
+                  once it has min_packets packets, again at every power of two while the
+                  model is unsure; packets of flows without a confident verdict keep their
+                  DSCP slice.
+
+Train and benchmark a model with bench.ml_classifier.
+"""
+import json
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from core.packet_batch import BatchView
+from utils.exporter import METRICS
+from utils.helpers import log
+from utils.profiling import TIMERS
+
+FEATURES = ("log_packets", "size_mean", "size_std", "size_min", "size_max", "iat_log_mean", "iat_cv",
+            "tcp", "udp", "well_known_port", "port_log")
+MAX_SIZE = 1514.0
+UNSET = -1
+
+
+class FlowTable:
+    def __init__(self, capacity: int = 65536, idle_timeout: float = 30.0):
+        """
+        :param capacity: flow slots (power of two); colliding flows evict each other
+        :param idle_timeout: seconds after which a slot's flow is forgotten
+        """
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError(f"capacity must be a power of two (got {capacity})")
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.idle_timeout = idle_timeout
+        self.key = np.zeros(capacity, dtype=np.uint32)
+        self.packets = np.zeros(capacity, dtype=np.int64)
+        self.size_sum = np.zeros(capacity)
+        self.size_sq = np.zeros(capacity)
+        self.size_min = np.zeros(capacity)
+        self.size_max = np.zeros(capacity)
+        self.iat_sum = np.zeros(capacity)
+        self.iat_sq = np.zeros(capacity)
+        self.last = np.zeros(capacity)
+        self.proto = np.zeros(capacity, dtype=np.uint8)
+        self.port = np.zeros(capacity, dtype=np.uint16)
+        # Cached verdict: slice index (UNSET: never asked) and model confidence
+        self.verdict = np.full(capacity, UNSET, dtype=np.int16)
+        self.confidence = np.zeros(capacity, dtype=np.float32)
+        self.asked_at = np.zeros(capacity, dtype=np.int64)  # packet count at the last inference
+        self.evictions = 0
+
+    def _reset(self, slots: np.ndarray, keys: np.ndarray):
+        self.key[slots] = keys
+        for column in (self.packets, self.size_sum, self.size_sq, self.iat_sum, self.iat_sq, self.asked_at,
+                       self.confidence):
+            column[slots] = 0
+        self.verdict[slots] = UNSET
+
+    def update(self, view: BatchView):
+        """
+        Add the packets of a view to their flows. Returns (slot of every packet, mask of the
+        packets counted: a packet colliding with another flow of the same batch is not).
+        """
+        hashes, times, sizes = view.flow_hash, view.timestamps, view.lengths.astype(np.float64)
+        slots = (hashes & self.mask).astype(np.int64)
+        if not len(slots):
+            return slots, np.zeros(0, dtype=bool)
+        # ── Claim the slots of new or idle flows (the first packet of the batch wins) ──
+        stale = (self.key[slots] != hashes) | (self.packets[slots] == 0) | \
+                (times - self.last[slots] > self.idle_timeout)
+        if stale.any():
+            claimed, first = np.unique(slots[stale], return_index=True)
+            self.evictions += int(np.count_nonzero(self.packets[claimed]))
+            self._reset(claimed, hashes[stale][first])
+        owned = self.key[slots] == hashes
+        # ── Per-flow reductions over the batch, flows contiguous and in time order ──
+        order = np.flatnonzero(owned)
+        order = order[np.lexsort((times[order], slots[order]))]
+        s, t, size = slots[order], times[order], sizes[order]
+        starts = np.flatnonzero(np.r_[True, s[1:] != s[:-1]])
+        flows = s[starts]
+        previous = np.r_[0.0, t[:-1]]
+        fresh = self.packets[flows] == 0
+        previous[starts] = self.last[flows]
+        iat = t - previous
+        iat[starts[fresh]] = 0.0  # no gap before the first packet of a flow
+        if fresh.any():
+            self.size_min[flows[fresh]] = np.inf
+            self.size_max[flows[fresh]] = 0.0
+            first = order[starts[fresh]]
+            self.proto[flows[fresh]] = view.proto[first]
+            self.port[flows[fresh]] = np.minimum(view.sport[first], view.dport[first])
+        counts = np.diff(np.r_[starts, len(s)])
+        self.packets[flows] += counts
+        self.size_sum[flows] += np.add.reduceat(size, starts)
+        self.size_sq[flows] += np.add.reduceat(size * size, starts)
+        self.size_min[flows] = np.minimum(self.size_min[flows], np.minimum.reduceat(size, starts))
+        self.size_max[flows] = np.maximum(self.size_max[flows], np.maximum.reduceat(size, starts))
+        self.iat_sum[flows] += np.add.reduceat(iat, starts)
+        self.iat_sq[flows] += np.add.reduceat(iat * iat, starts)
+        self.last[flows] = np.maximum.reduceat(t, starts)
+        return slots, owned
+
+    def features(self, slots: np.ndarray) -> np.ndarray:
+        """(len(slots), len(FEATURES)) float32 feature rows."""
+        n = self.packets[slots].astype(np.float64)
+        mean = self.size_sum[slots] / n
+        std = np.sqrt(np.maximum(self.size_sq[slots] / n - mean * mean, 0.0))
+        gaps = np.maximum(n - 1, 1)
+        iat_mean = self.iat_sum[slots] / gaps
+        iat_std = np.sqrt(np.maximum(self.iat_sq[slots] / gaps - iat_mean * iat_mean, 0.0))
+        port = self.port[slots].astype(np.float64)
+        return np.stack([
+            np.log1p(n),
+            mean / MAX_SIZE,
+            std / MAX_SIZE,
+            self.size_min[slots] / MAX_SIZE,
+            self.size_max[slots] / MAX_SIZE,
+            np.log10(iat_mean + 1e-6),
+            np.minimum(iat_std / np.maximum(iat_mean, 1e-9), 10.0),
+            self.proto[slots] == 6,
+            self.proto[slots] == 17,
+            (port > 0) & (port < 1024),
+            np.log2(port + 1) / 16,
+        ], axis=1).astype(np.float32)
+
+
+class FlowModel:
+    def __init__(self, path: str, threads: int = 1):
+        """
+        :param path: .npz (NumPy MLP), .pt / .ts (TorchScript) or .onnx model; the labels
+                     (slice names, one per output) are in the .npz or in a <path>.json sidecar
+        :param threads: intra-op threads of the torch / ONNX Runtime backend
+        """
+        self.path = path
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".npz":
+            data = np.load(path)
+            self.labels: List[str] = [str(label) for label in data["labels"]]
+            self.layers = [(data[f"w{i}"], data[f"b{i}"]) for i in range(len(data.files)) if f"w{i}" in data.files]
+            self.backend = "numpy"
+        else:
+            with open(path + ".json") as f:
+                self.labels = json.load(f)["labels"]
+            if ext in (".pt", ".ts"):
+                import torch
+                torch.set_num_threads(threads)
+                self._torch = torch
+                self._module = torch.jit.load(path, map_location="cpu").eval()
+                self.backend = "torchscript"
+            elif ext == ".onnx":
+                import onnxruntime
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = threads
+                self._session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+                self._input = self._session.get_inputs()[0].name
+                self.backend = "onnx"
+            else:
+                raise ValueError(f"unknown model format {ext!r} (.npz, .pt, .ts or .onnx)")
+
+    def logits(self, features: np.ndarray) -> np.ndarray:
+        if self.backend == "numpy":
+            x = features
+            for i, (w, b) in enumerate(self.layers):
+                x = x @ w + b
+                if i < len(self.layers) - 1:
+                    np.maximum(x, 0, out=x)
+            return x
+        if self.backend == "torchscript":
+            with self._torch.inference_mode():
+                return self._module(self._torch.from_numpy(features)).numpy()
+        return self._session.run(None, {self._input: features})[0]
+
+    def predict(self, features: np.ndarray):
+        """(class index, probability) of every feature row."""
+        logits = self.logits(np.ascontiguousarray(features, dtype=np.float32))
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        return best, probabilities[np.arange(len(best)), best]
+
+
+class FlowClassifier:
+    def __init__(self, model: FlowModel, slice_names: List[str], confidence: float = 0.8, min_packets: int = 4,
+                 untagged_only: bool = True, capacity: int = 65536):
+        """
+        :param confidence: lowest probability a verdict is trusted at (below: the DSCP decides)
+        :param min_packets: packets of a flow before it is first classified
+        :param untagged_only: only reassign packets with DSCP 0 or a DSCP no slice owns
+        """
+        self.model = model
+        self.table = FlowTable(capacity)
+        self.confidence = confidence
+        self.min_packets = max(min_packets, 1)
+        self.untagged_only = untagged_only
+        # Model output -> classifier slice index (-1: a label no slice has)
+        self.label_index = np.array([slice_names.index(label) if label in slice_names else -1
+                                     for label in model.labels], dtype=np.int16)
+        self.inferences = 0
+        METRICS.enable_ml()
+        log('blue', f"Flow classifier: {model.backend} model {os.path.basename(model.path)} "
+                    f"({', '.join(model.labels)}), confidence {confidence}")
+
+    def assign(self, view: BatchView, dscp_ids: np.ndarray) -> np.ndarray:
+        """Slice index of every packet: the cached verdict of its flow when confident, else dscp_ids."""
+        start = time.perf_counter_ns()
+        table = self.table
+        slots, owned = table.update(view)
+        eligible = owned & (view.l3_offsets >= 0)
+        if self.untagged_only:
+            eligible &= (view.dscp == 0) | (dscp_ids < 0)
+        # ── Flows due for a verdict: first at min_packets, then at every power of two while unsure ──
+        candidates = np.unique(slots[eligible])
+        packets = table.packets[candidates]
+        unsure = table.confidence[candidates] < self.confidence
+        due = unsure & (packets >= self.min_packets) & (packets >= 2 * table.asked_at[candidates])
+        ask = candidates[due]
+        if len(ask):
+            best, probability = self.model.predict(table.features(ask))
+            table.verdict[ask] = self.label_index[best]
+            table.confidence[ask] = np.where(self.label_index[best] >= 0, probability, 0.0)
+            table.asked_at[ask] = table.packets[ask]
+            self.inferences += len(ask)
+        decided = eligible & (table.confidence[slots] >= self.confidence) & (table.verdict[slots] >= 0)
+        slice_ids = np.where(decided, table.verdict[slots], dscp_ids)
+        model_packets = int(decided.sum())
+        METRICS.add_ml(model_packets, int(eligible.sum()) - model_packets, len(ask))
+        TIMERS.add("classifier.ml", time.perf_counter_ns() - start)
+        return slice_ids
+
+    def stats(self) -> dict:
+        table = self.table
+        active = table.packets > 0
+        return {"flows": int(active.sum()), "decided": int((active & (table.confidence >= self.confidence)).sum()),
+                "inferences": self.inferences, "evictions": table.evictions}
+
+
+def load_flow_classifier(args, slice_names: List[str]) -> Optional[FlowClassifier]:
+    """FlowClassifier for args.ml_model (None without one, or when its backend is not installed)."""
+    path = getattr(args, "ml_model", None)
+    if not path:
+        return None
+    try:
+        model = FlowModel(path)
+    except ImportError as e:
+        log('yellow', f"{path}: {e.name} is not installed, classifying on the DSCP only")
+        return None
+    return FlowClassifier(model, slice_names, confidence=getattr(args, "ml_confidence", 0.8),
+                          min_packets=getattr(args, "ml_min_packets", 4),
+                          untagged_only=not getattr(args, "ml_all", False))
@@ -0,0 +1,283 @@
+"""
+Shared-memory frame ring between the capture process and the classifier process.
+
+With --split, the Sniffer only captures: its frames are staged in a PacketBatch and
+published in batches to a single-producer/single-consumer ring over shared memory; a
+separate process consumes them, classifies and forwards. A slow send then backs up the
+ring instead of the capture socket, and frames cross the process boundary as raw bytes
+instead of pickled Scapy packets.
+
+Layout of the shared block (one cache line per control word, so producer and consumer
+never write the same line):
+    head | tail | closed, slots, slot_size, dropped     control words (int64)
+    timestamps f64[slots] | lengths u32[slots] | dscp u8[slots]    fixed slot headers
+    data u8[slots * slot_size]                                     frames, one per slot
+
+Only the producer writes head, only the consumer writes tail. A frame is written before
+head moves past it and its slot is reused only after tail has moved past it. Weakly ordered
+CPUs (ARM64, e.g. Jetson) may make a store to head visible before the frame bytes, so head,
+tail and closed are written and read under a process-shared lock: its acquire / release are
+full memory barriers. It is taken once per published or consumed batch, never per frame.
+"""
+import signal
+import threading
+import time
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+import numpy as np
+
+import config
+from core.classifier import gpu_frontend
+from core.packet_batch import PacketBatch
+from utils.exporter import METRICS, SLICE_COLUMNS
+from utils.helpers import log
+
+CONTROL = 192
+# Control word indices (int64): head, tail and the rest each on their own 64-byte line
+HEAD, TAIL, CLOSED, SLOTS, SLOT_SIZE, DROPPED = 0, 8, 16, 17, 18, 19
+NOT_IP = 0xFF  # dscp header of frames without an IP header
+
+
+class FrameRing:
+    def __init__(self, slots: int = 4096, slot_size: int = 2048, name: Optional[str] = None, lock=None):
+        """
+        :param slots: ring capacity in frames (power of two)
+        :param slot_size: largest frame a slot holds (B); larger frames are dropped and counted
+        :param name: attach to the ring created under this name instead of creating one
+        :param lock: the creator's FrameRing.lock, required to attach
+        """
+        if name is not None and lock is None:
+            raise ValueError("attaching to a ring needs the lock of its creator (FrameRing.lock)")
+        self.lock = lock if lock is not None else get_context("spawn").Lock()
+        if name is None:
+            if slots <= 0 or slots & (slots - 1):
+                raise ValueError(f"slots must be a power of two (got {slots})")
+            self._shm = SharedMemory(create=True, size=CONTROL + slots * (8 + 4 + 1) + 64 + slots * slot_size)
+            self.control = np.ndarray(CONTROL // 8, dtype=np.int64, buffer=self._shm.buf)
+            self.control[:] = 0
+            self.control[SLOTS], self.control[SLOT_SIZE] = slots, slot_size
+        else:
+            self._shm = SharedMemory(name=name)
+            self.control = np.ndarray(CONTROL // 8, dtype=np.int64, buffer=self._shm.buf)
+            slots, slot_size = int(self.control[SLOTS]), int(self.control[SLOT_SIZE])
+        self.owner = name is None
+        self.slots = slots
+        self.slot_size = slot_size
+        self.mask = slots - 1
+        buf = self._shm.buf
+        offset = CONTROL
+        self.timestamps = np.ndarray(slots, dtype=np.float64, buffer=buf, offset=offset)
+        offset += slots * 8
+        self.lengths = np.ndarray(slots, dtype=np.uint32, buffer=buf, offset=offset)
+        offset += slots * 4
+        self.dscp = np.ndarray(slots, dtype=np.uint8, buffer=buf, offset=offset)
+        offset = (offset + slots + 63) // 64 * 64
+        self.data = np.ndarray(slots * slot_size, dtype=np.uint8, buffer=buf, offset=offset)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def __len__(self):
+        with self.lock:
+            return int(self.control[HEAD] - self.control[TAIL])
+
+    @property
+    def dropped(self) -> int:
+        """Frames the producer could not publish (ring full or frame larger than a slot)."""
+        return int(self.control[DROPPED])
+
+    @property
+    def closed(self) -> bool:
+        # Under the lock: a consumer seeing closed also sees the last head
+        with self.lock:
+            return bool(self.control[CLOSED])
+
+    # === Producer side ==========================================================
+
+    def publish_batch(self, batch: PacketBatch) -> int:
+        """Copy the frames of a sealed batch into the free slots. Returns how many were published."""
+        n = len(batch)
+        with self.lock:  # acquire: the consumer's reads of released slots are done
+            head, tail = int(self.control[HEAD]), int(self.control[TAIL])
+        free = self.slots - (head - tail)
+        fits = np.flatnonzero(batch.lengths[:n] <= self.slot_size)[:free]
+        count = len(fits)
+        slots = (head + np.arange(count)) & self.mask
+        self.timestamps[slots] = batch.timestamps[fits]
+        self.lengths[slots] = batch.lengths[fits]
+        self.dscp[slots] = np.where(batch.ip_version[fits] > 0, batch.dscp[fits], NOT_IP)
+        # All the frames in one gather / scatter: byte k of a frame goes from offset + k to slot start + k
+        lengths = batch.lengths[fits].astype(np.int64)
+        firsts = np.zeros(count, dtype=np.int64)
+        np.cumsum(lengths[:-1], out=firsts[1:])
+        within = np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(firsts, lengths)
+        self.data[np.repeat(slots * self.slot_size, lengths) + within] = \
+            batch.buffer[np.repeat(batch.offsets[fits], lengths) + within]
+        # Publish after the frames are in place (release: the frame stores are visible first)
+        with self.lock:
+            self.control[HEAD] = head + count
+        if count < n:
+            self.control[DROPPED] += n - count
+        return count
+
+    def close_producer(self):
+        """Tell the consumer no more frames will come."""
+        with self.lock:
+            self.control[CLOSED] = 1
+
+    # === Consumer side ==========================================================
+
+    def consume(self, max_frames: int = 256) -> Optional[PacketBatch]:
+        """
+        Batch of the oldest published frames, decoded in place (no copy). The slots stay
+        reserved until release(len(batch)): stages may rewrite the frames meanwhile. Consumers
+        that only need the DSCP can read ring.dscp for the same slots without decoding.
+        """
+        with self.lock:  # acquire: the frames up to head are visible
+            head, tail = int(self.control[HEAD]), int(self.control[TAIL])
+        count = min(head - tail, max_frames)
+        if count <= 0:
+            return None
+        slots = (tail + np.arange(count)) & self.mask
+        return PacketBatch.from_buffer(self.data, slots * self.slot_size, self.lengths[slots], self.timestamps[slots])
+
+    def release(self, count: int):
+        with self.lock:  # release: done reading the slots before the producer may reuse them
+            self.control[TAIL] += count
+
+    def close(self):
+        # Views into the block must be gone before it can be closed
+        self.control = self.timestamps = self.lengths = self.dscp = self.data = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+class RingWriter:
+    """
+    Stands in for the PacketClassifier in the capture process: packets are staged in a
+    PacketBatch (same batch_size / time_limit rules as the classifier) and published to the ring.
+    """
+
+    def __init__(self, ring: FrameRing, batch_size: int = 1, time_limit: float = 0.0):
+        self.ring = ring
+        self.batch_size = batch_size
+        self.time_limit = time_limit
+        self._batch = PacketBatch(capacity=max(batch_size, 1))
+        self._spare: List[PacketBatch] = []  # published batches, recycled
+        self._lock = threading.Lock()
+        self._timer = None
+        self._generation = 0
+        self._flush_lock = threading.Lock()  # the ring has a single producer: one publish at a time
+
+    @gpu_frontend
+    def classify_packet(self, packet):
+        pass
+
+    def _flush_buffer(self, generation: Optional[int] = None):
+        with self._flush_lock:
+            with self._lock:
+                if generation is not None and generation != self._generation:
+                    return
+                batch = self._batch
+                self._batch = self._spare.pop() if self._spare else PacketBatch(capacity=max(self.batch_size, 1))
+                self._generation += 1
+                self._timer = None
+            if len(batch):
+                self.ring.publish_batch(batch.seal())
+        batch.clear()
+        with self._lock:
+            self._spare.append(batch)
+
+    def flush(self):
+        if self._timer:
+            self._timer.cancel()
+        self._flush_buffer()
+
+
+def _terminate(*_):
+    raise SystemExit(0)
+
+
+def _consumer(ring_name: str, ring_lock, counters_name: str, interface: str, specs, args, max_batch: int):
+    """Entry point of the classifier process: consume, classify and forward until the ring closes."""
+    from core.classifier import PacketClassifier
+    from core.slices_setup import build_slices
+
+    config.args = args
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # stopped by the capture process, after the last frames
+    signal.signal(signal.SIGTERM, _terminate)
+    ring = FrameRing(name=ring_name, lock=ring_lock)
+    shm = SharedMemory(name=counters_name)
+    classifier = None
+    try:
+        slices = build_slices(interface, specs)  # the capture process already installed the tc plan
+        classifier = PacketClassifier(slices=slices, args=args)
+        METRICS.register_slices(classifier.slice_names,
+                                counters=np.ndarray((len(slices), len(SLICE_COLUMNS)), dtype=np.int64, buffer=shm.buf))
+        idle = 0
+        while True:
+            batch = ring.consume(max_batch)
+            if batch is None:
+                if ring.closed and not len(ring):
+                    break  # closed is read first: the frames published before it are counted
+                # Spin briefly, then back off up to 1 ms
+                idle += 1
+                time.sleep(0 if idle < 64 else min(1e-5 * (idle - 63), 1e-3))
+                continue
+            idle = 0
+            classifier.classify_batch(batch)
+            ring.release(len(batch))
+    finally:
+        if classifier is not None:
+            classifier.close()
+        METRICS.register_slices([])
+        ring.close()
+        shm.close()
+
+
+class RingSplit:
+    def __init__(self, interface: str, specs: List, args, batch_size: int = 1, time_limit: float = 0.0,
+                 slots: int = 4096, slot_size: int = 2048, max_batch: int = 256):
+        """
+        Capture in this process, classify and forward in a spawned one.
+        :param batch_size: frames staged before a publish (time_limit bounds their wait)
+        :param max_batch: most frames the consumer takes from the ring at once
+        """
+        self.interface = interface
+        self.specs = specs
+        self.args = args
+        self.slice_names = [spec.name for spec in specs]
+        self.ring = FrameRing(slots, slot_size)
+        self.writer = RingWriter(self.ring, batch_size, time_limit)
+        self.max_batch = max_batch
+        self._counters = SharedMemory(create=True, size=max(len(specs) * len(SLICE_COLUMNS) * 8, 1))
+        self.counters = np.ndarray((1, len(specs), len(SLICE_COLUMNS)), dtype=np.int64, buffer=self._counters.buf)
+        self.counters[:] = 0
+        self.process = None
+
+    def start(self):
+        METRICS.merge_shards(self.slice_names, self.counters)
+        self.process = get_context("spawn").Process(
+            target=_consumer, name="classifier", daemon=True,
+            args=(self.ring.name, self.ring.lock, self._counters.name, self.interface, self.specs, self.args, self.max_batch))
+        self.process.start()
+        log('cyan', f"Classifier process started, ring of {self.ring.slots} x {self.ring.slot_size} B")
+
+    def stop(self, timeout: float = 5.0):
+        """Publish the staged frames, let the consumer drain the ring, then release the shared memory."""
+        self.writer.flush()
+        self.ring.close_producer()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        log('cyan', f"Ring: {self.ring.dropped} frames dropped (ring full or larger than a slot)")
+        self.counters = self.counters.copy()
+        METRICS.merge_shards(self.slice_names, self.counters)
+        self.ring.close()
+        self._counters.close()
+        self._counters.unlink()
@@ -1,27 +1,65 @@
 import subprocess
-from typing import Optional, Dict, List
+import time
+from typing import TYPE_CHECKING, Any, Optional, Dict, List
 
-import torch
-from scapy.all import Packet, sendp
+import numpy as np
 from termcolor import cprint
 
-from core.policy import Policy
+from core.packet_batch import BatchView
+from core.pipeline import PacketStage, Pipeline
+from core.policy import Policy, parse_rate
 from utils import log
+from utils.exporter import METRICS
+from utils.profiling import TIMERS
+
+if TYPE_CHECKING:
+    # Scapy and torch are heavy: they are imported where the data path first needs them
+    from scapy.packet import Packet
+    from core.scheduler import PacedScheduler
+
+
+def run_tc_command(cmd: List[str]) -> None:
+    """
+    Run one tc command of a slice plan. The 802.1Q filters need the flower classifier,
+    which some kernels do not ship: those are skipped with a warning instead of aborting.
+    """
+    if "flower" not in cmd:
+        subprocess.run(cmd, check=True)
+        return
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        log('yellow', f"Skipping VLAN filter ({result.stderr.strip().splitlines()[0] if result.stderr else 'tc error'})")
 
 
 class NetworkSlice:
     def __init__(self, name: str, dscp: int, interface, policy: Policy, packet_handler=None, packet_handler_args=None,
-                 args=None):
+                 args=None, pipeline: Optional[Pipeline] = None):
+        """
+        :param packet_handler: legacy per-packet handler, appended to the pipeline as a PacketStage
+        :param pipeline: stages run on every packet after DSCP marking (see core.pipeline)
+        """
         self.name = name
         self.dscp = dscp
         self.policy = policy
         self.handler = packet_handler
         self.handler_args = {} if packet_handler_args is None else packet_handler_args
+        self.pipeline = Pipeline() if pipeline is None else pipeline
+        if packet_handler is not None:
+            self.pipeline.append(PacketStage(packet_handler, **self.handler_args))
         self.args = args
         self.interface = interface
         self.packet_counter = 0
         self.byte_counter = 0
-        self.current_packet: Optional[Packet] = None
+        self.current_packet: Optional["Packet"] = None
+        self._l2socket = None  # opened on first batch transmission
+        # Per-flow DRR between the pipeline and the wire (see core.scheduler)
+        self.scheduler: Optional["PacedScheduler"] = None
+        if policy.fair_queue is not None:
+            from core.scheduler import DRRScheduler, PacedScheduler
+            fq = policy.fair_queue
+            drr = DRRScheduler(buckets=fq.get("buckets", 1024), quantum=fq.get("quantum", 1514),
+                               flow_limit=fq.get("flow_limit", 64), limit=fq.get("limit", 4096))
+            self.scheduler = PacedScheduler(drr, parse_rate(fq.get("rate", policy.ceil)), self._send_frame)
 
         # TC-specific attributes
         self.tc_handle = f"1:"  # Default root qdisc handle
@@ -41,30 +79,45 @@ class NetworkSlice:
                 "root", "handle", self.tc_handle, "htb"
             ], check=True)
 
-        # Create class for this slice
-        subprocess.run([
-            "tc", "class", "add", "dev", self.interface,
-            "parent", self.tc_handle, "classid", self.tc_classid,
-            "htb", "rate", self.policy.rate, "ceil", self.policy.ceil, "burst", self.policy.burst
-        ], check=True)
-
-        # Add leaf qdisc
-        subprocess.run([
-            "tc", "qdisc", "add", "dev", self.interface,
-            "parent", self.tc_classid, "handle", self.tc_qdisc,
-            "pfifo", "limit", str(self.policy.qsize)
-        ], check=True)
-
-        # Add DSCP filter
-        subprocess.run([
-            "tc", "filter", "add", "dev", self.interface,
-            "protocol", "ip", "parent", "1:",
-            "prio", "1", "u32",
-            "match", "ip", "tos", hex(self.dscp), "0xff",
-            "flowid", self.tc_classid
-        ], check=True)
-
-    def process_packet(self, packet: Packet) -> None:
+        for cmd in self.tc_commands():
+            run_tc_command(cmd)
+
+    def tc_commands(self) -> List[List[str]]:
+        """tc commands installing this slice under the root HTB qdisc: class, leaf qdisc and filters"""
+        return [
+            # Create class for this slice
+            ["tc", "class", "add", "dev", self.interface,
+             "parent", self.tc_handle, "classid", self.tc_classid,
+             "htb", "rate", self.policy.rate, "ceil", self.policy.ceil, "burst", self.policy.burst,
+             "prio", str(self.policy.prio)],
+            # Add leaf qdisc (pfifo or an AQM such as fq_codel)
+            ["tc", "qdisc", "add", "dev", self.interface,
+             "parent", self.tc_classid, "handle", self.tc_qdisc, *self.policy.leaf_qdisc()],
+            # Add DSCP filters (IPv4, IPv6 and 802.1Q-tagged frames)
+            *self.tc_filter_commands(),
+        ]
+
+    def tc_filter_commands(self) -> List[List[str]]:
+        """
+        tc filters steering this slice's DSCP into its class. Filters of different protocols
+        cannot share a priority, hence one prio per protocol.
+        """
+        tos, mask = hex(self.dscp << 2), "0xfc"
+        base = ["tc", "filter", "add", "dev", self.interface, "parent", self.tc_handle]
+        return [
+            base + ["protocol", "ip", "prio", "1", "u32",
+                    "match", "ip", "tos", tos, mask, "flowid", self.tc_classid],
+            # The IPv6 traffic class is what u32 calls "ip6 priority"
+            base + ["protocol", "ipv6", "prio", "2", "u32",
+                    "match", "ip6", "priority", tos, mask, "flowid", self.tc_classid],
+            # Tagged frames whose VLAN header was not offloaded keep an 802.1Q skb protocol
+            base + ["protocol", "802.1q", "prio", "3", "flower",
+                    "vlan_ethtype", "ipv4", "ip_tos", f"{tos}/{mask}", "classid", self.tc_classid],
+            base + ["protocol", "802.1q", "prio", "4", "flower",
+                    "vlan_ethtype", "ipv6", "ip_tos", f"{tos}/{mask}", "classid", self.tc_classid],
+        ]
+
+    def process_packet(self, packet: "Packet") -> None:
         """
         Process and forward a packet through this slice
         Args:
@@ -74,89 +127,122 @@ class NetworkSlice:
         self.packet_counter += 1
         self.byte_counter += len(packet)
 
-        # Apply slice-specific processing
-        if self.handler is not None:
-            self.handler(self.current_packet, **self.handler_args)
-
-        # Mark packet with slice's DSCP
+        # Mark packet with slice's DSCP (keeping the ECN bits)
+        timed = TIMERS.enabled  # no clock reads per packet unless profiling
+        start = time.perf_counter_ns() if timed else 0
         if packet.haslayer("IP"):
-            packet["IP"].tos = self.dscp
-
-        # Forward packet
-        sendp(packet, iface=self.interface, verbose=False)
+            packet["IP"].tos = (self.dscp << 2) | (packet["IP"].tos & 0x03)
+            del packet["IP"].chksum
+        elif packet.haslayer("IPv6"):
+            packet["IPv6"].tc = (self.dscp << 2) | (packet["IPv6"].tc & 0x03)
+        if timed:
+            stop = time.perf_counter_ns()
+            TIMERS.add("slice.mark", stop - start)
+
+        # Apply slice-specific processing, then forward what the pipeline kept
+        keep = self.pipeline.run_packet(packet)
+        if timed:
+            start, stop = stop, time.perf_counter_ns()
+            TIMERS.add("slice.pipeline", stop - start)
+        if keep:
+            from scapy.sendrecv import sendp
+            sendp(packet, iface=self.interface, verbose=False)
+            if timed:
+                TIMERS.add("slice.send", time.perf_counter_ns() - stop)
         self.current_packet = None
 
-    def process_packet_batch_gpu(self, packets: List[Packet]) -> None:
-        if not packets:
-            return
-        # ── Step 1: Update byte_counter and packet_counter in batch on GPU ─────────────
-        lengths = [len(pkt) for pkt in packets]
-        lengths_tensor = torch.tensor(lengths, dtype=torch.int32, device="cuda")
-        total_bytes = int(torch.sum(lengths_tensor).item())
-        self.byte_counter += total_bytes
-        self.packet_counter += len(packets)
-        # ── Step 2: Build a ByteTensor of all IP headers to modify TOS and recompute checksum
-        HEADER_LEN = 20
-        header_bytes_list = []
-        for pkt in packets:
-            ip_layer = pkt.getlayer("IP")
-            if ip_layer is None:
-                header_bytes_list.append([0] * HEADER_LEN)
-                continue
-            raw_ip = bytes(ip_layer)[:HEADER_LEN]
-            header_bytes_list.append(list(raw_ip))
-
-        headers_tensor = torch.tensor(header_bytes_list, dtype=torch.uint8, device="cuda")
-        batch_size = headers_tensor.size(0)
-        # ── Step 3: Modify the TOS (byte offset 1) for all headers in parallel ─────────
-        tos_byte = self.dscp & 0xFF
-        headers_tensor[:, 1] = tos_byte
-        # ── Step 4: Zero out the existing checksum bytes (offsets 10 and 11) ───────────
-        headers_tensor[:, 10] = 0
-        headers_tensor[:, 11] = 0
-        # ── Step 5: Compute new IP checksums in parallel ───────────────────────────────
-        words = headers_tensor.view(batch_size, HEADER_LEN // 2, 2)
-        high_bytes = words[:, :, 0].to(torch.int32)
-        low_bytes = words[:, :, 1].to(torch.int32)
-        word16 = (high_bytes << 8) + low_bytes
-        sum16 = torch.sum(word16, dim=1)
-        def fold_carry(x: torch.Tensor) -> torch.Tensor:
-            carry = x >> 16
-            lower = x & 0xFFFF
-            return lower + carry
-        sum16 = fold_carry(sum16)
-        checksum16 = (~sum16) & 0xFFFF
-        checksum_hi = ((checksum16 >> 8) & 0xFF).to(torch.uint8)
-        checksum_lo = (checksum16 & 0xFF).to(torch.uint8)
-        headers_tensor[:, 10] = checksum_hi
-        headers_tensor[:, 11] = checksum_lo
-        # ── Step 6: Pull header updates back to CPU and apply to each Packet ───────────
-        headers_cpu = headers_tensor.to("cpu").tolist()
-        for i, pkt in enumerate(packets):
-            ip_layer = pkt.getlayer("IP")
-            if ip_layer is None:
-                continue
-            pkt["IP"].tos = tos_byte
-            pkt["IP"].chksum = int(checksum16[i].item())
-        # ── Step 7: Invoke any slice‐specific handler (on CPU) ─────────────────────────
-        if self.handler is not None:
-            for pkt in packets:
-                self.handler(pkt, **self.handler_args)
-        # ── Step 8: Forward all packets via sendp (CPU) ────────────────────────────────
-
-        for pkt in packets:
-            sendp(pkt, iface=self.interface, verbose=False)
-
-    def get_stats(self) -> Dict[str, int]:
+    def process_batch(self, view: BatchView) -> BatchView:
+        """
+        Process and forward an index view of a PacketBatch through this slice (CPU path).
+        Counters and DSCP marking are applied to the whole view at once.
+        Returns the view of the frames forwarded (or queued for it), see _handle_and_send.
+        """
+        if not len(view):
+            return view
+        self.packet_counter += len(view)
+        self.byte_counter += view.total_bytes()
+        start = time.perf_counter_ns()
+        view.set_dscp(self.dscp)
+        TIMERS.add("slice.mark", time.perf_counter_ns() - start)
+        return self._handle_and_send(view)
+
+    def process_packet_batch_gpu(self, view: BatchView) -> BatchView:
+        if not len(view):
+            return view
+        from core.tensor_engine import get_engine
+        started = time.perf_counter_ns()
+        batch = view.batch
+        # ── Step 1: Update the counters (the lengths are host columns: no device round trip) ──
+        self.byte_counter += view.total_bytes()
+        self.packet_counter += len(view)
+        # ── Step 2: Select the option-less IPv4 headers ─────────────────────────────────
+        version = view.ip_version
+        first_byte = batch.buffer[np.maximum(view.offsets + view.l3_offsets, 0)]
+        simple_v4 = (version == 4) & (first_byte == 0x45)
+        # IPv6 has no header checksum and IPv4 with options is rare: rewrite those in place on CPU
+        view.select((version > 0) & ~simple_v4).set_dscp(self.dscp)
+        ip_view = view.select(simple_v4)
+        if len(ip_view):
+            # ── Step 3: Remark and re-checksum them in the engine's preallocated tensors ──
+            engine = get_engine(len(ip_view))
+            if engine is None:
+                ip_view.set_dscp(self.dscp)
+            else:
+                engine.mark_ipv4(batch.buffer, ip_view.offsets + ip_view.l3_offsets, self.dscp)
+                batch.dscp[ip_view.indices] = self.dscp & 0x3F
+        TIMERS.add("slice.gpu_mark", time.perf_counter_ns() - started)
+        # ── Step 4: Run the slice pipeline and forward (CPU) ────────────────────────────
+        return self._handle_and_send(view)
+
+    def _handle_and_send(self, view: BatchView) -> BatchView:
+        """
+        Run the slice pipeline and forward the (already marked) frames of a view. Returns the
+        view of the frames sent or queued on the flow queues, as they left the pipeline: its
+        batch columns (dscp, ...) describe the frames on the wire.
+        """
+        # Pipeline stages, in order (batch stages: one call per stage for the whole view)
+        start, size = time.perf_counter_ns(), len(view)
+        view = self.pipeline.run_batch(view)
+        stop = time.perf_counter_ns()
+        TIMERS.add("slice.pipeline", stop - start)
+        if len(view) < size:
+            METRICS.add_drops(METRICS.slice_index(self.name), size - len(view))
+        if not len(view):
+            return view
+        frames = [frame.tobytes() for frame in view.frames()]
+        if self.scheduler is not None:
+            # Flow queues: frames leave in DRR order at the slice rate, the backlog on a timer
+            queued = self.scheduler.push(frames, view.flow_hash.tolist())
+            TIMERS.add("slice.fair_queue", time.perf_counter_ns() - stop)
+            return view.select(np.asarray(queued, dtype=bool))
+        for frame in frames:
+            self._send_frame(frame)
+        TIMERS.add("slice.send", time.perf_counter_ns() - stop)
+        return view
+
+    def _send_frame(self, frame: bytes) -> None:
+        if self._l2socket is None:
+            from scapy.config import conf
+            import scapy.arch  # noqa: F401 (sets conf.L2socket for this platform)
+            self._l2socket = conf.L2socket(iface=self.interface)
+        self._l2socket.send(frame)
+
+    def get_stats(self) -> Dict[str, Any]:
         """Return current slice statistics"""
         return {
             "packets": self.packet_counter,
             "bytes": self.byte_counter,
-            "dscp": self.dscp
+            "dscp": self.dscp,
+            "pipeline": self.pipeline.stats(),
+            "scheduler": self.scheduler.scheduler.stats() if self.scheduler is not None else None,
         }
 
     def __del__(self):
         """Clean up TC rules when slice is destroyed"""
+        if getattr(self, "scheduler", None) is not None:
+            self.scheduler.stop()
+        if getattr(self, "_l2socket", None) is not None:
+            self._l2socket.close()
         if hasattr(self, "qdisc_handle"):
             subprocess.run([
                 "tc", "qdisc", "del", "dev", self.interface,
@@ -192,7 +278,7 @@ class NetworkSlice2:
     def cleanup(self):
         pass
 
-    def handle_packet(self, packet: Packet, sid: int):
+    def handle_packet(self, packet: "Packet", sid: int):
         if sid == 0:
             self.URLLC_slice(packet)
         elif sid == 1:
@@ -0,0 +1,434 @@
+"""
+tc clsact eBPF offload of the slice classification.
+
+For pure DSCP (re)marking the Python data path is overhead. In offload mode the slice table
+(port, prefix and DSCP rules) is compiled into BPF maps read by a small eBPF program attached
+to the clsact egress hook: it picks the slice of every packet, rewrites its DSCP (patching the
+IPv4 checksum), sets skb->priority to the slice's HTB class and counts packets/bytes per slice
+in a per-CPU map. Python stays the control plane: it builds and loads the program, rewrites
+the maps on reconfiguration and reads the counters.
+
+Rules are tried from the most specific one: TCP/UDP port (destination then source), address
+prefix (destination then source), then the DSCP the packet already carries.
+
+Requires clang (BPF target), bpftool, iproute2 with libbpf support and root.
+
+Usage:
+    python -m core.offload load slices.toml --interface eth0
+    python -m core.offload stats --interface eth0
+    python -m core.offload unload --interface eth0
+"""
+import argparse
+import ipaddress
+import json
+import os
+import platform
+import struct
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.helpers import log
+
+MAX_SLICES = 16
+MAX_PORT_RULES = 4096
+MAX_PREFIX_RULES = 1024
+PIN_DIR = "/sys/fs/bpf/tc/globals"
+MAPS = ("ns_slices", "ns_dscp", "ns_ports", "ns_prefix4", "ns_prefix6", "ns_stats")
+
+# Self-contained program: helpers are declared by ID so only the kernel UAPI headers are needed
+BPF_SOURCE = r"""
+#include <linux/bpf.h>
+#include <linux/pkt_cls.h>
+#include <linux/if_ether.h>
+#include <linux/ip.h>
+#include <linux/ipv6.h>
+#include <linux/in.h>
+
+#define SEC(name) __attribute__((section(name), used))
+#define __uint(name, val) int (*name)[val]
+#define __type(name, val) typeof(val) *name
+#define LIBBPF_PIN_BY_NAME 1
+
+#if __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+#define htons(x) __builtin_bswap16(x)
+#define ntohs(x) __builtin_bswap16(x)
+#else
+#define htons(x) (x)
+#define ntohs(x) (x)
+#endif
+
+static void *(*bpf_map_lookup_elem)(void *map, const void *key) = (void *) 1;
+static long (*bpf_skb_store_bytes)(struct __sk_buff *skb, __u32 off, const void *from, __u32 len,
+                                   __u64 flags) = (void *) 9;
+static long (*bpf_l3_csum_replace)(struct __sk_buff *skb, __u32 off, __u64 from, __u64 to,
+                                   __u64 size) = (void *) 10;
+static long (*bpf_skb_load_bytes)(const struct __sk_buff *skb, __u32 off, void *to, __u32 len) = (void *) 26;
+
+#define MAX_SLICES %(max_slices)d
+
+struct slice { __u32 priority; __u32 dscp; };
+struct counters { __u64 packets; __u64 bytes; };
+struct lpm4 { __u32 prefixlen; __u32 addr; };
+struct lpm6 { __u32 prefixlen; __u8 addr[16]; };
+
+/* Slice index -> HTB class (skb->priority) and DSCP */
+struct {
+    __uint(type, BPF_MAP_TYPE_ARRAY);
+    __uint(max_entries, MAX_SLICES);
+    __type(key, __u32);
+    __type(value, struct slice);
+    __uint(pinning, LIBBPF_PIN_BY_NAME);
+} ns_slices SEC(".maps");
+
+/* Rules: value is the slice index + 1 (0 = no rule) */
+struct {
+    __uint(type, BPF_MAP_TYPE_ARRAY);
+    __uint(max_entries, 64);
+    __type(key, __u32);
+    __type(value, __u32);
+    __uint(pinning, LIBBPF_PIN_BY_NAME);
+} ns_dscp SEC(".maps");
+
+struct {
+    __uint(type, BPF_MAP_TYPE_HASH);
+    __uint(max_entries, %(max_ports)d);
+    __type(key, __u32);
+    __type(value, __u32);
+    __uint(pinning, LIBBPF_PIN_BY_NAME);
+} ns_ports SEC(".maps");
+
+struct {
+    __uint(type, BPF_MAP_TYPE_LPM_TRIE);
+    __uint(max_entries, %(max_prefixes)d);
+    __type(key, struct lpm4);
+    __type(value, __u32);
+    __uint(map_flags, BPF_F_NO_PREALLOC);
+    __uint(pinning, LIBBPF_PIN_BY_NAME);
+} ns_prefix4 SEC(".maps");
+
+struct {
+    __uint(type, BPF_MAP_TYPE_LPM_TRIE);
+    __uint(max_entries, %(max_prefixes)d);
+    __type(key, struct lpm6);
+    __type(value, __u32);
+    __uint(map_flags, BPF_F_NO_PREALLOC);
+    __uint(pinning, LIBBPF_PIN_BY_NAME);
+} ns_prefix6 SEC(".maps");
+
+/* Per-slice counters; the last entry counts unclassified packets */
+struct {
+    __uint(type, BPF_MAP_TYPE_PERCPU_ARRAY);
+    __uint(max_entries, MAX_SLICES + 1);
+    __type(key, __u32);
+    __type(value, struct counters);
+    __uint(pinning, LIBBPF_PIN_BY_NAME);
+} ns_stats SEC(".maps");
+
+static __u32 rule(void *map, const void *key)
+{
+    __u32 *value = bpf_map_lookup_elem(map, key);
+    return value ? *value : 0;
+}
+
+SEC("tc")
+int ns_classify(struct __sk_buff *skb)
+{
+    __u32 off = ETH_HLEN, l4 = 0, id = 0, key;
+    __u16 proto;
+    __u8 l4proto = 0, tos, word[2];
+
+    /* Read the EtherType from the frame: offloaded VLAN tags are not in it, in-band ones are skipped */
+    if (bpf_skb_load_bytes(skb, 12, &proto, 2) < 0)
+        return TC_ACT_OK;
+    if (proto == htons(0x8100) || proto == htons(0x88A8)) {
+        if (bpf_skb_load_bytes(skb, off + 2, &proto, 2) < 0)
+            return TC_ACT_OK;
+        off += 4;
+    }
+
+    if (proto == htons(ETH_P_IP)) {
+        struct iphdr ip;
+        struct lpm4 k4 = { .prefixlen = 32 };
+        if (bpf_skb_load_bytes(skb, off, &ip, sizeof(ip)) < 0)
+            return TC_ACT_OK;
+        tos = ip.tos;
+        /* Only the first fragment carries the ports */
+        if (!(ip.frag_off & htons(0x1FFF)))
+            l4proto = ip.protocol;
+        l4 = off + ip.ihl * 4;
+        k4.addr = ip.daddr;
+        id = rule(&ns_prefix4, &k4);
+        if (!id) {
+            k4.addr = ip.saddr;
+            id = rule(&ns_prefix4, &k4);
+        }
+    } else if (proto == htons(ETH_P_IPV6)) {
+        struct ipv6hdr ip6;
+        struct lpm6 k6 = { .prefixlen = 128 };
+        if (bpf_skb_load_bytes(skb, off, &ip6, sizeof(ip6)) < 0)
+            return TC_ACT_OK;
+        tos = (ip6.priority << 4) | (ip6.flow_lbl[0] >> 4);
+        l4proto = ip6.nexthdr;
+        l4 = off + sizeof(ip6);
+        __builtin_memcpy(k6.addr, &ip6.daddr, 16);
+        id = rule(&ns_prefix6, &k6);
+        if (!id) {
+            __builtin_memcpy(k6.addr, &ip6.saddr, 16);
+            id = rule(&ns_prefix6, &k6);
+        }
+    } else {
+        return TC_ACT_OK;
+    }
+
+    /* Ports are more specific than prefixes */
+    if (l4proto == IPPROTO_TCP || l4proto == IPPROTO_UDP) {
+        __u16 ports[2];
+        if (bpf_skb_load_bytes(skb, l4, ports, 4) == 0) {
+            __u32 port_id;
+            key = ntohs(ports[1]);
+            port_id = rule(&ns_ports, &key);
+            if (!port_id) {
+                key = ntohs(ports[0]);
+                port_id = rule(&ns_ports, &key);
+            }
+            if (port_id)
+                id = port_id;
+        }
+    }
+    if (!id) {
+        key = tos >> 2;
+        id = rule(&ns_dscp, &key);
+    }
+
+    key = id ? id - 1 : MAX_SLICES;
+    if (key > MAX_SLICES)
+        return TC_ACT_OK;
+    struct counters *c = bpf_map_lookup_elem(&ns_stats, &key);
+    if (c) {
+        c->packets++;
+        c->bytes += skb->len;
+    }
+    if (!id)
+        return TC_ACT_OK;
+    struct slice *s = bpf_map_lookup_elem(&ns_slices, &key);
+    if (!s)
+        return TC_ACT_OK;
+    skb->priority = s->priority;
+
+    /* Rewrite the DSCP, keeping ECN */
+    if ((tos >> 2) == s->dscp || bpf_skb_load_bytes(skb, off, word, 2) < 0)
+        return TC_ACT_OK;
+    __u8 new_tos = (s->dscp << 2) | (tos & 0x03);
+    if (proto == htons(ETH_P_IP)) {
+        __u8 new_word[2] = { word[0], new_tos };
+        bpf_l3_csum_replace(skb, off + __builtin_offsetof(struct iphdr, check),
+                            *(__u16 *)word, *(__u16 *)new_word, 2);
+        bpf_skb_store_bytes(skb, off + 1, &new_tos, 1, 0);
+    } else {
+        /* IPv6 traffic class: low nibble of byte 0 and high nibble of byte 1, no checksum */
+        word[0] = (word[0] & 0xF0) | (new_tos >> 4);
+        word[1] = (word[1] & 0x0F) | ((new_tos & 0x0F) << 4);
+        bpf_skb_store_bytes(skb, off, word, 2, 0);
+    }
+    return TC_ACT_OK;
+}
+
+char _license[] SEC("license") = "GPL";
+"""
+
+U32 = struct.Struct("=I")
+SLICE_VALUE = struct.Struct("=II")
+COUNTERS = struct.Struct("=QQ")
+
+
+def _hex(data: bytes) -> List[str]:
+    return [f"{b:02x}" for b in data]
+
+
+def _ports(port) -> range:
+    if isinstance(port, str):
+        low, _, high = port.partition("-")
+        return range(int(low), int(high) + 1)
+    return range(port, port + 1)
+
+
+def compile_rules(specs, handle: int = 1) -> Dict[str, Dict[bytes, bytes]]:
+    """
+    Slice specs -> BPF map contents ({map: {key bytes: value bytes}}).
+    :param specs: list of SliceSpec, in slice index order
+    :param handle: major number of the root HTB qdisc the classids belong to
+    """
+    if len(specs) > MAX_SLICES:
+        raise ValueError(f"at most {MAX_SLICES} slices can be offloaded (got {len(specs)})")
+    maps = {name: {} for name in MAPS if name != "ns_stats"}
+    for index, spec in enumerate(specs):
+        slice_id = U32.pack(index + 1)
+        maps["ns_slices"][U32.pack(index)] = SLICE_VALUE.pack((handle << 16) | spec.classid, spec.dscp)
+        maps["ns_dscp"][U32.pack(spec.dscp)] = slice_id
+        for port in spec.ports:
+            for number in _ports(port):
+                maps["ns_ports"][U32.pack(number)] = slice_id
+        for prefix in spec.prefixes:
+            network = ipaddress.ip_network(prefix)
+            name = "ns_prefix4" if network.version == 4 else "ns_prefix6"
+            maps[name][U32.pack(network.prefixlen) + network.network_address.packed] = slice_id
+    if len(maps["ns_ports"]) > MAX_PORT_RULES:
+        raise ValueError(f"at most {MAX_PORT_RULES} ports can be offloaded (got {len(maps['ns_ports'])})")
+    for name in ("ns_prefix4", "ns_prefix6"):
+        if len(maps[name]) > MAX_PREFIX_RULES:
+            raise ValueError(f"at most {MAX_PREFIX_RULES} prefixes per family can be offloaded")
+    return maps
+
+
+class TcOffload:
+    ARRAY_MAPS = {"ns_slices": SLICE_VALUE.size, "ns_dscp": U32.size}
+
+    def __init__(self, interface: str, specs, direction: str = "egress", workdir: Optional[str] = None):
+        """
+        :param specs: list of SliceSpec (see core.slice_config)
+        :param direction: clsact hook, "egress" (before the HTB root qdisc) or "ingress"
+        :param workdir: where the program source and object are written (default: a temp dir)
+        """
+        self.interface = interface
+        self.specs = list(specs)
+        self.direction = direction
+        self.workdir = workdir or tempfile.mkdtemp(prefix="netslicer-bpf-")
+        self._installed: Dict[str, Dict[bytes, bytes]] = {}
+
+    # === Program ===============================================================
+
+    def source(self) -> str:
+        return BPF_SOURCE % {"max_slices": MAX_SLICES, "max_ports": MAX_PORT_RULES,
+                             "max_prefixes": MAX_PREFIX_RULES}
+
+    def build(self) -> str:
+        """Compile the program with clang. Returns the object file path."""
+        src = os.path.join(self.workdir, "netslicer.bpf.c")
+        obj = os.path.join(self.workdir, "netslicer.bpf.o")
+        with open(src, "w") as f:
+            f.write(self.source())
+        # asm/types.h lives in the multiarch include directory on Debian-based systems
+        arch_include = f"/usr/include/{platform.machine()}-linux-gnu"
+        subprocess.run(["clang", "-O2", "-g", "-target", "bpf", "-I", arch_include, "-c", src, "-o", obj],
+                       check=True)
+        return obj
+
+    def load(self):
+        """Build, attach to the clsact hook and fill the maps."""
+        obj = self.build()
+        log('yellow', f"Attaching slice classifier to {self.interface} {self.direction}...")
+        subprocess.run(["tc", "qdisc", "replace", "dev", self.interface, "clsact"], check=True)
+        subprocess.run(["tc", "filter", "replace", "dev", self.interface, self.direction,
+                        "prio", "1", "handle", "1", "bpf", "direct-action", "obj", obj, "sec", "tc"], check=True)
+        self._installed = {}
+        self.update(self.specs)
+
+    def unload(self):
+        subprocess.run(["tc", "filter", "del", "dev", self.interface, self.direction, "prio", "1"], check=False)
+        for name in MAPS:
+            path = os.path.join(PIN_DIR, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # === Control plane =========================================================
+
+    def _bpftool(self, *args) -> subprocess.CompletedProcess:
+        return subprocess.run(["bpftool", *args], check=True, capture_output=True, text=True)
+
+    def update(self, specs):
+        """Reconfigure the running program: write the new rules and remove the stale ones."""
+        maps = compile_rules(specs)
+        for name, entries in maps.items():
+            path = os.path.join(PIN_DIR, name)
+            for key in self._installed.get(name, {}).keys() - entries.keys():
+                if name in self.ARRAY_MAPS:
+                    # Array entries cannot be deleted: zero means "no rule"
+                    self._bpftool("map", "update", "pinned", path, "key", "hex", *_hex(key),
+                                  "value", "hex", *_hex(bytes(self.ARRAY_MAPS[name])))
+                else:
+                    self._bpftool("map", "delete", "pinned", path, "key", "hex", *_hex(key))
+            for key, value in entries.items():
+                if self._installed.get(name, {}).get(key) != value:
+                    self._bpftool("map", "update", "pinned", path, "key", "hex", *_hex(key),
+                                  "value", "hex", *_hex(value))
+        self._installed = maps
+        self.specs = list(specs)
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        """Per-slice packet/byte counters summed over CPUs (plus "unclassified")."""
+        dump = json.loads(self._bpftool("-j", "map", "dump", "pinned", os.path.join(PIN_DIR, "ns_stats")).stdout)
+        names = [spec.name for spec in self.specs]
+        stats = {}
+        for entry in dump:
+            index, packets, bytes_ = _parse_stats_entry(entry)
+            name = names[index] if index < len(names) else ("unclassified" if index == MAX_SLICES else None)
+            if name is not None:
+                stats[name] = {"packets": packets, "bytes": bytes_}
+        return stats
+
+    def serve(self, period: float = 1.0):
+        """Load the program and print the per-slice counters until Ctrl+C, then unload it."""
+        self.load()
+        log('green', f"Slice classification offloaded to the kernel on {self.interface}. Press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(period)
+                log('magenta', " | ".join(f"{name}: {c['packets']} pkts {c['bytes'] / 1024:.1f} KB"
+                                          for name, c in self.counters().items()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.unload()
+
+
+def _parse_stats_entry(entry) -> Tuple[int, int, int]:
+    """Decode one bpftool -j dump entry of ns_stats, with or without BTF formatting."""
+    if "formatted" in entry:
+        entry = entry["formatted"]
+    key = entry["key"]
+    index = key if isinstance(key, int) else U32.unpack(bytes(int(b, 16) for b in key))[0]
+    packets = bytes_ = 0
+    for cpu in entry["values"]:
+        value = cpu["value"]
+        if isinstance(value, dict):
+            packets += value["packets"]
+            bytes_ += value["bytes"]
+        else:
+            p, b = COUNTERS.unpack(bytes(int(x, 16) for x in value))
+            packets += p
+            bytes_ += b
+    return index, packets, bytes_
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSlicer tc eBPF offload control plane")
+    parser.add_argument("action", choices=("load", "update", "stats", "unload", "source"))
+    parser.add_argument("config", nargs="?", default=None, help="Slicer configuration file")
+    parser.add_argument("--interface", default=None)
+    parser.add_argument("--direction", choices=("egress", "ingress"), default="egress")
+    opts = parser.parse_args()
+
+    import config
+    from core.slice_config import load_config
+    cfg = load_config(opts.config or config.DEFAULT_CONFIG)
+    interface = opts.interface or cfg.interface
+    offload = TcOffload(interface, cfg.slices, direction=opts.direction)
+    if opts.action == "source":
+        print(offload.source())
+    elif opts.action == "load":
+        offload.load()
+    elif opts.action == "update":
+        # A fresh process does not know what was installed: every rule is rewritten
+        offload._installed = {name: {} for name in MAPS}
+        offload.update(cfg.slices)
+    elif opts.action == "stats":
+        for name, c in offload.counters().items():
+            print(f"  {name:<12} {c['packets']:>10} pkts {c['bytes']:>14} B")
+    else:
+        offload.unload()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Struct-of-arrays packet batch shared by the sniffer, classifier, slices, metrics and writers.
+
+A PacketBatch keeps every frame in one contiguous byte buffer plus NumPy columns (offset,
+length, DSCP, protocol, ports, flow hash, ...). Frames are only copied when appended; their
+headers are decoded for the whole batch at once by seal() (protocols.batch.decode_headers).
+Stages then work on index views (BatchView) instead of per-packet Scapy objects.
+"""
+import time
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from protocols.batch import decode_headers
+
+
+def flow_hash(src, dst, sport, dport, proto):
+    """Vectorized 32-bit hash of the directional 5-tuple (murmur3 finalizer)."""
+    h = (src.astype(np.uint64) * np.uint64(0x9E3779B1)) ^ (dst.astype(np.uint64) * np.uint64(0x85EBCA77))
+    h ^= ((sport.astype(np.uint64) << np.uint64(16)) | dport.astype(np.uint64)) * np.uint64(0xC2B2AE3D)
+    h ^= proto.astype(np.uint64) * np.uint64(0x27D4EB2F)
+    h &= np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(16)
+    h = (h * np.uint64(0x85EBCA6B)) & np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(13)
+    h = (h * np.uint64(0xC2B2AE35)) & np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(16)
+    return h.astype(np.uint32)
+
+
+class PacketBatch:
+    def __init__(self, capacity: int = 1024, buffer_size: Optional[int] = None):
+        """
+        :param capacity: number of frames the columns can hold before growing
+        :param buffer_size: initial size of the byte buffer (default: 2 KB per frame)
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(buffer_size or capacity * 2048, dtype=np.uint8)
+        self.size = 0  # number of frames
+        self.used = 0  # bytes used in buffer
+        self._alloc_columns(capacity)
+
+    def _alloc_columns(self, capacity):
+        self.offsets = np.zeros(capacity, dtype=np.int64)  # frame start in buffer
+        self.lengths = np.zeros(capacity, dtype=np.int32)  # frame length
+        self.timestamps = np.zeros(capacity, dtype=np.float64)  # capture time (s)
+        self.l3_offsets = np.full(capacity, -1, dtype=np.int32)  # IP header start in frame (-1: not IP)
+        self.vlan = np.zeros(capacity, dtype=np.uint16)  # outer VLAN ID (0: untagged)
+        self.ip_version = np.zeros(capacity, dtype=np.uint8)  # 4, 6 or 0 (not IP)
+        self.dscp = np.zeros(capacity, dtype=np.uint8)
+        self.proto = np.zeros(capacity, dtype=np.uint8)
+        self.src = np.zeros(capacity, dtype=np.uint32)
+        self.dst = np.zeros(capacity, dtype=np.uint32)
+        self.sport = np.zeros(capacity, dtype=np.uint16)
+        self.dport = np.zeros(capacity, dtype=np.uint16)
+        self.flow_hash = np.zeros(capacity, dtype=np.uint32)
+
+    _COLUMNS = ("offsets", "lengths", "timestamps", "l3_offsets", "vlan", "ip_version", "dscp", "proto", "src",
+                "dst", "sport", "dport", "flow_hash")
+
+    def _grow(self, frames: int, nbytes: int):
+        if self.size + frames > self.capacity:
+            capacity = max(self.capacity * 2, self.size + frames)
+            for name in self._COLUMNS:
+                column = getattr(self, name)
+                grown = np.full(capacity, -1, dtype=column.dtype) if name == "l3_offsets" else \
+                    np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                setattr(self, name, grown)
+            self.capacity = capacity
+        if self.used + nbytes > len(self.buffer):
+            buffer = np.zeros(max(len(self.buffer) * 2, self.used + nbytes), dtype=np.uint8)
+            buffer[:self.used] = self.buffer[:self.used]
+            self.buffer = buffer
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+        self.used = 0
+        self.l3_offsets[:] = -1
+
+    # === Filling ===============================================================
+
+    def append(self, frame: bytes, timestamp: Optional[float] = None) -> int:
+        """Copy one Ethernet frame into the buffer. Returns its index."""
+        length = len(frame)
+        self._grow(1, length)
+        i = self.size
+        self.buffer[self.used:self.used + length] = np.frombuffer(frame, dtype=np.uint8)
+        self.offsets[i] = self.used
+        self.lengths[i] = length
+        self.timestamps[i] = time.time() if timestamp is None else timestamp
+        self.used += length
+        self.size += 1
+        return i
+
+    def seal(self):
+        """Decode the headers of every frame in one vectorized pass and derive the flow hash."""
+        self._decode(slice(0, self.size))
+        return self
+
+    def _decode(self, rows):
+        """Decode the frames `rows` (a slice or index array) into the columns."""
+        headers = decode_headers(self.buffer[:self.used], self.offsets[rows], self.lengths[rows])
+        self.l3_offsets[rows] = headers.l3
+        self.vlan[rows] = headers.vlan
+        self.ip_version[rows] = np.where(headers.ipv4, 4, np.where(headers.ipv6, 6, 0))
+        self.dscp[rows] = headers.tos >> 2
+        self.proto[rows] = headers.proto
+        self.src[rows] = headers.src
+        self.dst[rows] = headers.dst
+        self.sport[rows] = headers.sport
+        self.dport[rows] = headers.dport
+        self.flow_hash[rows] = flow_hash(headers.src, headers.dst, headers.sport, headers.dport, headers.proto)
+
+    def rewrite(self, indices: np.ndarray, frames: List[bytes]):
+        """
+        Write frames changed outside the batch (e.g. Scapy packets of per-packet stages) back
+        over the frames `indices` and decode them again. Indices keep their meaning, so views
+        of the batch stay valid. A frame that grew is moved to the end of the buffer.
+        """
+        for i, frame in zip(indices.tolist(), frames):
+            length = len(frame)
+            if length > self.lengths[i]:
+                self._grow(0, length)
+                self.offsets[i] = self.used
+                self.used += length
+            start = int(self.offsets[i])
+            self.buffer[start:start + length] = np.frombuffer(frame, dtype=np.uint8)
+            self.lengths[i] = length
+        if len(indices):
+            self._decode(indices)
+
+    @classmethod
+    def from_buffer(cls, buffer, offsets, lengths, timestamps=None):
+        """
+        Wrap frames already laid out in a contiguous buffer (e.g. a capture ring block). Stages
+        rewrite frames in place, so a read-only buffer (bytes, a read-only mapping) is copied.
+        """
+        buffer = buffer if isinstance(buffer, np.ndarray) else np.frombuffer(buffer, dtype=np.uint8)
+        if not buffer.flags.writeable:
+            buffer = buffer.copy()
+        n = len(offsets)
+        batch = cls(capacity=max(n, 1), buffer_size=1)
+        batch.buffer = buffer
+        batch.used = len(buffer)
+        batch.size = n
+        batch.offsets[:n] = offsets
+        batch.lengths[:n] = lengths
+        batch.timestamps[:n] = time.time() if timestamps is None else timestamps
+        return batch.seal()
+
+    @classmethod
+    def from_frames(cls, frames: Iterable[bytes], timestamps: Optional[Iterable[float]] = None):
+        """Copy a list of frames into one buffer with a single join and decode them."""
+        frames = list(frames)
+        lengths = np.fromiter(map(len, frames), dtype=np.int64, count=len(frames))
+        offsets = np.zeros(len(frames), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        buffer = np.frombuffer(bytearray(b"".join(frames)), dtype=np.uint8)
+        timestamps = None if timestamps is None else np.fromiter(timestamps, dtype=np.float64,
+                                                                 count=len(frames))
+        return cls.from_buffer(buffer, offsets, lengths, timestamps)
+
+    @classmethod
+    def from_packets(cls, packets):
+        """Serialize a list of Scapy packets once into a batch."""
+        return cls.from_frames([bytes(pkt) for pkt in packets], [float(pkt.time) for pkt in packets])
+
+    # === Access ================================================================
+
+    def frame(self, i: int) -> memoryview:
+        start = self.offsets[i]
+        return memoryview(self.buffer)[start:start + self.lengths[i]]
+
+    def select(self, indices) -> "BatchView":
+        return BatchView(self, np.asarray(indices, dtype=np.int64))
+
+    def view(self) -> "BatchView":
+        return BatchView(self, np.arange(self.size, dtype=np.int64))
+
+
+class BatchView:
+    """Index view over a PacketBatch; columns are gathered on access, frames are not copied."""
+
+    def __init__(self, batch: PacketBatch, indices: np.ndarray):
+        self.batch = batch
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getattr__(self, name):
+        if name in PacketBatch._COLUMNS:
+            return getattr(self.batch, name)[self.indices]
+        raise AttributeError(name)
+
+    def select(self, mask_or_indices) -> "BatchView":
+        """Sub-view from a boolean mask or positions relative to this view."""
+        return BatchView(self.batch, self.indices[mask_or_indices])
+
+    def frames(self):
+        for i in self.indices:
+            yield self.batch.frame(i)
+
+    def total_bytes(self) -> int:
+        return int(self.batch.lengths[self.indices].sum())
+
+    def set_dscp(self, dscp: int):
+        """
+        Rewrite the DSCP of every IP frame in place, keeping the ECN bits. IPv4 header
+        checksums are patched incrementally (RFC 1624); IPv6 has no header checksum and
+        the traffic class is not part of the transport pseudo-header, so it is a plain write.
+        """
+        batch = self.batch
+        buf = batch.buffer
+        dscp &= 0x3F
+        version = batch.ip_version[self.indices]
+
+        idx = self.indices[version == 4]
+        if len(idx):
+            ip = batch.offsets[idx] + batch.l3_offsets[idx]
+            _write_ipv4_tos(buf, ip, (dscp << 2) | (buf[ip + 1] & 0x03))
+
+        idx6 = self.indices[version == 6]
+        if len(idx6):
+            # Traffic class = low nibble of byte 0 + high nibble of byte 1; ECN is its low 2 bits
+            ip = batch.offsets[idx6] + batch.l3_offsets[idx6]
+            ecn = (buf[ip + 1] >> 4) & 0x03
+            traffic_class = (dscp << 2) | ecn
+            buf[ip] = (buf[ip] & 0xF0) | (traffic_class >> 4)
+            buf[ip + 1] = (buf[ip + 1] & 0x0F) | ((traffic_class & 0x0F) << 4)
+
+        batch.dscp[self.indices[version > 0]] = dscp
+
+    def set_ce(self) -> np.ndarray:
+        """
+        Mark ECN Congestion Experienced on the ECN-capable (ECT) IP frames of the view.
+        Returns the mask (relative to the view) of the frames now carrying CE.
+        """
+        batch = self.batch
+        buf = batch.buffer
+        version = batch.ip_version[self.indices]
+        ip = batch.offsets[self.indices] + np.maximum(batch.l3_offsets[self.indices], 0)
+        ecn = np.where(version == 4, buf[ip + 1] & 0x03, (buf[ip + 1] >> 4) & 0x03)
+        capable = (version > 0) & (ecn != 0)  # ECT(0), ECT(1) or already CE
+        v4 = capable & (version == 4) & (ecn != 0x03)
+        if v4.any():
+            _write_ipv4_tos(buf, ip[v4], buf[ip[v4] + 1] | 0x03)
+        v6 = ip[capable & (version == 6)]
+        buf[v6 + 1] |= 0x30
+        return capable
+
+
+def _write_ipv4_tos(buf: np.ndarray, ip: np.ndarray, new_tos: np.ndarray):
+    """Write the TOS byte of IPv4 headers starting at `ip`, patching their checksum (RFC 1624)."""
+    old_word = (buf[ip].astype(np.uint32) << 8) | buf[ip + 1]
+    new_word = (buf[ip].astype(np.uint32) << 8) | new_tos
+    checksum = (buf[ip + 10].astype(np.uint32) << 8) | buf[ip + 11]
+    # HC' = ~(~HC + ~m + m')
+    total = (~checksum & 0xFFFF) + (~old_word & 0xFFFF) + new_word
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    checksum = ~total & 0xFFFF
+    buf[ip + 1] = new_tos
+    buf[ip + 10] = checksum >> 8
+    buf[ip + 11] = checksum & 0xFF
@@ -0,0 +1,167 @@
+"""
+Kernel-side capture filter compiled from the slice definitions.
+
+Instead of letting every IP packet cross into Python, build_filter() turns the configured
+slices (DSCP, optional prefixes and ports) into one BPF expression. check_filter() compiles
+it with libpcap before the capture starts, and the Sniffer attaches it to its packet socket
+so packets matching no slice are dropped in the kernel. KernelFilterStats reports how many
+packets the kernel accepted, dropped for lack of buffer space, and filtered out.
+
+Usage:
+    python -m core.packet_filter slices.toml [interface]   # print and compile the filter
+"""
+import socket
+import struct
+import sys
+from typing import Dict, List, Optional
+
+from utils.helpers import log
+
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+# struct tpacket_stats: packets delivered to the socket, packets dropped (buffer full)
+TPACKET_STATS = struct.Struct("II")
+# struct tpacket_stats_v3 (TPACKET_V3 rings) adds the number of times the ring froze
+TPACKET_STATS_V3 = struct.Struct("III")
+
+
+class FilterError(ValueError):
+    """The BPF expression does not compile."""
+
+
+def _slice_clauses(spec) -> List[str]:
+    """One clause per IP family the slice can match."""
+    tos = spec.dscp << 2
+    families = {
+        "ip": f"(ip[1] & 0xfc) = {tos:#04x}",
+        # The IPv6 traffic class sits in bits 4-11 of the first 16-bit word
+        "ip6": f"(ip6[0:2] & 0x0fc0) = {tos << 4:#06x}",
+    }
+    prefixes = {family: [p for p in spec.prefixes if (":" in p) == (family == "ip6")] for family in families}
+    if spec.prefixes:
+        # A slice restricted to prefixes of one family does not match the other one
+        families = {family: match for family, match in families.items() if prefixes[family]}
+    ports = " or ".join(f"portrange {p}" if isinstance(p, str) and "-" in p else f"port {p}" for p in spec.ports)
+    clauses = []
+    for family, match in families.items():
+        terms = [family, match]
+        if prefixes[family]:
+            terms.append("(" + " or ".join(f"net {p}" for p in prefixes[family]) + ")")
+        if ports:
+            terms.append(f"({ports})")
+        clauses.append("(" + " and ".join(terms) + ")")
+    return clauses
+
+
+def build_filter(specs, vlan: bool = True) -> str:
+    """
+    BPF expression accepting exactly the packets of the given slices.
+    :param specs: list of SliceSpec
+    :param vlan: also accept the same packets inside an 802.1Q tag
+    """
+    expression = " or ".join(clause for spec in specs for clause in _slice_clauses(spec))
+    if vlan:
+        # "vlan" shifts every following offset by the tag length, so it must come last
+        expression = f"{expression} or (vlan and ({expression}))"
+    return expression
+
+
+def check_filter(expression: str, interface: Optional[str] = None) -> int:
+    """
+    Compile a BPF expression with libpcap. Returns the number of BPF instructions.
+    Raises FilterError if it does not compile, ImportError if libpcap is not available.
+    """
+    from scapy.arch.common import compile_filter
+    from scapy.error import Scapy_Exception
+
+    try:
+        program = compile_filter(expression, iface=interface)
+    except Scapy_Exception as e:
+        raise FilterError(f"Invalid BPF filter {expression!r}: {e}")
+    return program.bf_len
+
+
+class KernelFilterStats:
+    def __init__(self, sock: socket.socket, interface: str):
+        """
+        Accept/drop counters of a filtered AF_PACKET socket.
+        :param sock: the capture socket the filter is attached to
+        :param interface: capture interface, whose counters give the packets the filter saw
+        Reading PACKET_STATISTICS resets the kernel counters, so they are accumulated here.
+        """
+        self.sock = sock
+        self.interface = interface
+        self.accepted = 0
+        self.queue_drops = 0
+        self.freezes = 0
+        self._seen_start = self._interface_packets()
+
+    def _interface_packets(self) -> Optional[int]:
+        import psutil
+        counters = psutil.net_io_counters(pernic=True).get(self.interface)
+        # A packet socket bound to ETH_P_ALL sees both directions
+        return None if counters is None else counters.packets_recv + counters.packets_sent
+
+    def read(self) -> Dict[str, Optional[int]]:
+        """
+        accepted: packets that passed the filter (including queue_drops)
+        queue_drops: accepted packets dropped because the socket buffer was full
+        freezes: times a TPACKET_V3 ring froze its queue (always 0 for other sockets)
+        filtered: packets dropped by the filter (estimated from the interface counters)
+        """
+        try:
+            # The kernel only fills the freeze count for TPACKET_V3 sockets (and returns 8 bytes otherwise)
+            raw = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, TPACKET_STATS_V3.size)
+        except OSError:
+            raw = b""
+        if len(raw) >= TPACKET_STATS_V3.size:
+            packets, drops, freezes = TPACKET_STATS_V3.unpack(raw)
+        elif len(raw) >= TPACKET_STATS.size:
+            (packets, drops), freezes = TPACKET_STATS.unpack(raw[:TPACKET_STATS.size]), 0
+        else:
+            packets, drops, freezes = 0, 0, 0
+        self.accepted += packets
+        self.queue_drops += drops
+        self.freezes += freezes
+        seen = self._interface_packets()
+        filtered = None
+        if seen is not None and self._seen_start is not None:
+            filtered = max(seen - self._seen_start - self.accepted, 0)
+        return {"accepted": self.accepted, "queue_drops": self.queue_drops, "freezes": self.freezes,
+                "filtered": filtered}
+
+    def summary(self) -> str:
+        stats = self.read()
+        if stats["filtered"] is None:
+            return f"Kernel filter: {stats['accepted']} accepted | {stats['queue_drops']} queue drops"
+        total = stats["accepted"] + stats["filtered"]
+        share = 100.0 * stats["filtered"] / total if total else 0.0
+        return (f"Kernel filter: {stats['accepted']} accepted | {stats['filtered']} filtered "
+                f"({share:.1f}% kept out of userspace) | {stats['queue_drops']} queue drops")
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python -m core.packet_filter <config.toml|config.yaml> [interface]")
+        sys.exit(2)
+    from core.slice_config import ConfigError, load_config
+    try:
+        cfg = load_config(sys.argv[1])
+    except ConfigError as e:
+        print(e)
+        sys.exit(1)
+    expression = build_filter(cfg.slices)
+    print(expression)
+    try:
+        length = check_filter(expression, sys.argv[2] if len(sys.argv) == 3 else cfg.interface)
+    except ImportError as e:
+        log('yellow', f"Filter not compiled: {e}")
+        return
+    except FilterError as e:
+        log('red', str(e))
+        sys.exit(1)
+    log('green', f"Filter compiles to {length} BPF instructions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,7 @@
 import argparse
 import random
 from dataclasses import dataclass
-from typing import Literal
-
-import numpy as np
+from typing import Literal, Optional
 
 import config
 
@@ -14,13 +12,40 @@ class Args:
     display_packets: bool
     display_metrics: bool
     store_packets: bool
-    interface: str
+    interface: Optional[str]
+    config: Optional[str]
     rate_limit: str
+    probe_target: Optional[str]
+    probe_port: int
+    keep_dscp: bool
     # System configuration
     gpu: bool
     verbose: Literal['DEBUG', 'INFO', 'WARNING', 'ERROR']
     seed: int
     fix_seed: bool
+    # Profiling (see utils.profiling)
+    profile: Optional[str] = None
+    profile_seconds: float = 10.0
+    # Prometheus exporter (see utils.exporter)
+    metrics_port: Optional[int] = None
+    # Capture backpressure (see Sniffer.monitor_capture)
+    capture_stats_interval: float = 1.0
+    adapt_capture: bool = False
+    # Capture worker processes (see core.workers)
+    workers: int = 1
+    # Capture / classifier process split (see core.frame_ring)
+    split: bool = False
+    # Runtime driving capture and control (see core.async_runtime)
+    runtime: str = "threads"
+    # Learned flow classifier for untagged traffic (see core.flow_model)
+    ml_model: Optional[str] = None
+    ml_confidence: float = 0.8
+    ml_min_packets: int = 4
+    ml_all: bool = False
+    # Per-flow IPFIX telemetry (see core.flow_meter)
+    flow_export: Optional[str] = None
+    flow_active_timeout: float = 60.0
+    flow_idle_timeout: float = 15.0
 
 
 def parse_args() -> Args:
@@ -30,8 +55,14 @@ def parse_args() -> Args:
     parser.add_argument(
         '--interface',
         type=str,
-        default='en1',
-        help='Output interface'
+        default=None,
+        help='Output interface (overrides the configuration file)'
+    )
+    parser.add_argument(
+        '--config',
+        type=str,
+        default=None,
+        help='Slicer configuration file (TOML or YAML, default: slices.toml)'
     )
     parser.add_argument(
         '--display-packets',
@@ -46,7 +77,7 @@ def parse_args() -> Args:
     parser.add_argument(
         '--store-packets',
         action='store_true',
-        help='Store sniffed packets in database'
+        help='Store sniffed packets in database (one row per packet; see --flow-export for per-flow records)'
     )
 
     parser.add_argument(
@@ -56,6 +87,24 @@ def parse_args() -> Args:
         help='Rate limit'
     )
 
+    parser.add_argument(
+        '--probe-target',
+        type=str,
+        default=None,
+        help='Run the per-slice active prober towards this reflector address'
+    )
+    parser.add_argument(
+        '--probe-port',
+        type=int,
+        default=7000,
+        help='UDP port of the probe reflector'
+    )
+    parser.add_argument(
+        '--keep-dscp',
+        action='store_true',
+        help='Classify packets on the DSCP they carry instead of assigning a random one'
+    )
+
     # System configuration
     # parser.add_argument('--gpu', action='store_true', help='Enable GPU training')
     parser.add_argument('--no-gpu', action='store_false', dest='gpu', help='Disable GPU training')
@@ -63,10 +112,40 @@ def parse_args() -> Args:
                         default='DEBUG', help='Logging level')
     parser.add_argument('--seed', type=int, default=42, help='Random seed')
     parser.add_argument('--fix-seed', action='store_true', help='Fix the randomness seed')
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], default=None,
+                        help='Profile the first --profile-seconds of sniffing and time the data path stages '
+                             '(SIGUSR1 opens a window on demand, SIGUSR2 turns the stage timers on)')
+    parser.add_argument('--profile-seconds', type=float, default=10.0, help='Length of a profile window')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus/OpenMetrics metrics on this port (/metrics)')
+    parser.add_argument('--capture-stats-interval', type=float, default=1.0,
+                        help='Seconds between two reads of the kernel capture drop counters')
+    parser.add_argument('--adapt-capture', action='store_true',
+                        help='When the kernel drops packets, grow the socket buffer, then sample the display')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Capture worker processes, sharing the traffic by flow hash (PACKET_FANOUT, Linux)')
+    parser.add_argument('--split', action='store_true',
+                        help='Classify and forward in a separate process fed through a shared-memory ring')
+    parser.add_argument('--runtime', choices=['threads', 'asyncio'], default='threads',
+                        help='threads: scapy sniff loop and timer threads; asyncio: one event loop for everything')
+    parser.add_argument('--ml-model', type=str, default=None,
+                        help='Flow classifier model (.npz, .pt or .onnx) assigning untagged traffic to slices')
+    parser.add_argument('--ml-confidence', type=float, default=0.8,
+                        help='Lowest model probability trusted; below it the DSCP decides')
+    parser.add_argument('--ml-min-packets', type=int, default=4, help='Packets of a flow before it is classified')
+    parser.add_argument('--ml-all', action='store_true',
+                        help='Let the model reassign DSCP-tagged traffic too, not only untagged traffic')
+    parser.add_argument('--flow-export', type=str, default=None,
+                        help='Export per-flow slice records as IPFIX to a file or to udp://collector:4739')
+    parser.add_argument('--flow-active-timeout', type=float, default=60.0,
+                        help='Seconds after which a long-lived flow is exported')
+    parser.add_argument('--flow-idle-timeout', type=float, default=15.0,
+                        help='Seconds without packets after which a flow is exported')
 
     args = Args(**vars(parser.parse_args()))
     config.args = args
     if args.fix_seed:
+        import numpy as np
         random.seed(args.seed)
         np.random.seed(args.seed)
 
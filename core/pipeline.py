@@ -0,0 +1,611 @@
+"""
+Per-slice handler pipeline.
+
+A slice runs an ordered list of stages on the packets it forwards. Stages that declare
+`batch = True` get the whole BatchView at once and work on its NumPy columns, so a batch
+costs one call per stage instead of one Python call per packet. Other stages (e.g. legacy
+per-packet handlers) run on Scapy packets. Stages always run in their configured order: a
+run of per-packet stages decodes the surviving frames, and the frames they keep are written
+back into the same PacketBatch (same indices, headers decoded again) for the next stage.
+
+Built-in stages, also available from the configuration file by type name:
+    police      drop, log or remark packets larger than max_size
+    timestamp   stamp packets entering the slice and track capture -> slice latency
+    sample      hand 1 packet out of N (or a random fraction) to a sink / pcap file
+    mark        rewrite the DSCP of every packet
+    rewrite     set the Ethernet source/destination (forwarding to the next hop)
+    codel       CoDel active queue management on the time packets spent in the slicer
+    trtcm       two-rate three-color policer (RFC 2698): pass, remark or drop yellow / red packets
+"""
+import math
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from core.packet_batch import BatchView
+from core.policy import parse_rate, parse_size
+from utils.helpers import log
+
+
+class Stage:
+    """
+    Base stage. process_packet returns False to drop the packet. Stages with batch = True
+    also define process_batch(view), which returns the view of the kept frames.
+    """
+    name = "stage"
+    batch = False
+
+    def __init__(self):
+        self.dropped = 0
+
+    def process_packet(self, packet) -> bool:
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        return {"dropped": self.dropped}
+
+
+class PacketStage(Stage):
+    """Wrap a legacy per-packet handler `handler(packet, **kwargs)`; it never drops packets."""
+    name = "packet"
+
+    def __init__(self, handler: Callable, **kwargs):
+        super().__init__()
+        self.handler = handler
+        self.kwargs = kwargs
+        self.name = getattr(handler, "__name__", self.name)
+
+    def process_packet(self, packet) -> bool:
+        self.handler(packet, **self.kwargs)
+        return True
+
+
+class SizePolicer(Stage):
+    name = "police"
+    batch = True
+    ACTIONS = ("drop", "log", "mark")
+
+    def __init__(self, max_size: int = 1500, action: str = "drop", dscp: int = 0):
+        """
+        :param max_size: largest accepted frame (B)
+        :param action: "drop" oversized packets, only "log" them, or "mark" them with dscp
+        """
+        super().__init__()
+        if action not in self.ACTIONS:
+            raise ValueError(f"action must be one of {', '.join(self.ACTIONS)} (got {action!r})")
+        self.max_size = max_size
+        self.action = action
+        self.dscp = dscp
+        self.oversized = 0
+
+    def process_packet(self, packet) -> bool:
+        if len(packet) <= self.max_size:
+            return True
+        self.oversized += 1
+        if self.action == "log":
+            log('red', f"Packet too large! Size: {len(packet)}B > {self.max_size}B")
+        elif self.action == "mark":
+            if packet.haslayer("IP"):
+                packet["IP"].tos = (self.dscp << 2) | (packet["IP"].tos & 0x03)
+                del packet["IP"].chksum
+            elif packet.haslayer("IPv6"):
+                packet["IPv6"].tc = (self.dscp << 2) | (packet["IPv6"].tc & 0x03)
+        else:
+            self.dropped += 1
+            return False
+        return True
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        over = view.lengths > self.max_size
+        count = int(over.sum())
+        if not count:
+            return view
+        self.oversized += count
+        if self.action == "log":
+            log('red', f"{count} packets larger than {self.max_size}B (largest {int(view.lengths.max())}B)")
+        elif self.action == "mark":
+            view.select(over).set_dscp(self.dscp)
+        else:
+            self.dropped += count
+            return view.select(~over)
+        return view
+
+    def stats(self):
+        return {"dropped": self.dropped, "oversized": self.oversized}
+
+
+class Timestamper(Stage):
+    name = "timestamp"
+    batch = True
+
+    def __init__(self, attribute: str = "slice_timestamp"):
+        """:param attribute: packet attribute set to the slice entry time (per-packet path)"""
+        super().__init__()
+        self.attribute = attribute
+        self.last = 0.0
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def _record(self, latencies):
+        self.count += len(latencies)
+        self.latency_sum += float(np.sum(latencies))
+        self.latency_max = max(self.latency_max, float(np.max(latencies)))
+
+    def process_packet(self, packet) -> bool:
+        self.last = time.time()
+        setattr(packet, self.attribute, self.last)
+        self._record([self.last - float(getattr(packet, "time", self.last))])
+        return True
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        if len(view):
+            self.last = time.time()
+            self._record(self.last - view.timestamps)
+        return view
+
+    def stats(self):
+        mean = self.latency_sum / self.count if self.count else 0.0
+        return {"dropped": 0, "latency_mean_ms": round(mean * 1e3, 3),
+                "latency_max_ms": round(self.latency_max * 1e3, 3)}
+
+
+class Sampler(Stage):
+    name = "sample"
+    batch = True
+
+    def __init__(self, every: int = 0, fraction: float = 0.0, pcap: Optional[str] = None,
+                 sink: Optional[Callable[[BatchView], None]] = None):
+        """
+        :param every: sample 1 packet out of every N (deterministic)
+        :param fraction: otherwise sample each packet with this probability
+        :param pcap: write the samples to this pcap file
+        :param sink: or hand the sampled view to this callable
+        Sampling never drops packets: every packet continues through the pipeline.
+        """
+        super().__init__()
+        if every < 0 or not 0.0 <= fraction <= 1.0:
+            raise ValueError("every must be >= 0 and fraction in [0, 1]")
+        self.every = every
+        self.fraction = fraction
+        self.sink = sink
+        self._pcap = None
+        if pcap:
+            from protocols.pcap import Pcap
+            self._pcap = Pcap(pcap)
+        self._seen = 0
+        self.sampled = 0
+
+    def _pick(self, n: int) -> np.ndarray:
+        if self.every:
+            positions = np.arange(self._seen, self._seen + n)
+            picked = positions % self.every == 0
+        else:
+            picked = np.random.random(n) < self.fraction
+        self._seen += n
+        return picked
+
+    def process_packet(self, packet) -> bool:
+        if self.every:
+            picked = self._seen % self.every == 0
+            self._seen += 1
+        else:
+            picked = random.random() < self.fraction
+        if picked:
+            self.sampled += 1
+            if self._pcap:
+                self._pcap.write(bytes(packet))
+        return True
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        sample = view.select(self._pick(len(view)))
+        if len(sample):
+            self.sampled += len(sample)
+            if self._pcap:
+                self._pcap.write_batch(sample)
+            if self.sink:
+                self.sink(sample)
+        return view
+
+    def stats(self):
+        return {"dropped": 0, "sampled": self.sampled}
+
+
+class Marker(Stage):
+    name = "mark"
+    batch = True
+
+    def __init__(self, dscp: int):
+        super().__init__()
+        if not 0 <= dscp <= 63:
+            raise ValueError(f"dscp must be 0-63 (got {dscp!r})")
+        self.dscp = dscp
+
+    def process_packet(self, packet) -> bool:
+        if packet.haslayer("IP"):
+            packet["IP"].tos = (self.dscp << 2) | (packet["IP"].tos & 0x03)
+            del packet["IP"].chksum
+        elif packet.haslayer("IPv6"):
+            packet["IPv6"].tc = (self.dscp << 2) | (packet["IPv6"].tc & 0x03)
+        return True
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        view.set_dscp(self.dscp)
+        return view
+
+
+class L2Rewrite(Stage):
+    name = "rewrite"
+    batch = True
+
+    def __init__(self, dst: Optional[str] = None, src: Optional[str] = None):
+        """
+        :param dst: next-hop MAC address written into every frame
+        :param src: MAC address of the output interface
+        """
+        super().__init__()
+        self.dst, self.src = dst, src
+        self._header = [(0, bytes.fromhex(dst.replace(":", "")))] if dst else []
+        self._header += [(6, bytes.fromhex(src.replace(":", "")))] if src else []
+        for _, mac in self._header:
+            if len(mac) != 6:
+                raise ValueError(f"invalid MAC address {mac.hex(':')!r}")
+
+    def process_packet(self, packet) -> bool:
+        if self.dst:
+            packet.dst = self.dst
+        if self.src:
+            packet.src = self.src
+        return True
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        buf = view.batch.buffer
+        for start, mac in self._header:
+            buf[view.offsets[:, None] + start + np.arange(6)] = np.frombuffer(mac, dtype=np.uint8)
+        return view
+
+
+SOJOURN_BUCKETS = 32  # log2 buckets of microseconds: bucket i counts sojourns in [2^(i-1), 2^i) us
+
+
+class CoDel(Stage):
+    name = "codel"
+    batch = True
+
+    def __init__(self, target: float = 5.0, interval: float = 100.0, ecn: bool = False):
+        """
+        CoDel (RFC 8289) on the in-process queueing of a slice. The sojourn time of a packet
+        is the time since its capture: classifier batching, the frame ring and earlier stages.
+        Once it stays above target for an interval, packets are dropped at intervals shrinking
+        as interval / sqrt(count) until it falls back below target.
+        :param target: acceptable standing sojourn time (ms)
+        :param interval: sliding window, about a worst-case RTT (ms)
+        :param ecn: mark ECN-capable packets CE instead of dropping them
+        """
+        super().__init__()
+        if target <= 0 or interval <= 0:
+            raise ValueError("target and interval must be positive (ms)")
+        self.target = target / 1e3
+        self.interval = interval / 1e3
+        self.ecn = ecn
+        self.marked = 0
+        self.dropping = False
+        self.count = 0
+        self.last_count = 0
+        self.first_above_time = 0.0
+        self.drop_next = 0.0
+        # The dropping state and histograms take no lock: PacketClassifier's flush lock runs one
+        # batch at a time through the slices, so process_batch never overlaps itself
+        # Sojourn times of the packets dropped / marked
+        self.drop_sojourn = np.zeros(SOJOURN_BUCKETS, dtype=np.int64)
+        self.mark_sojourn = np.zeros(SOJOURN_BUCKETS, dtype=np.int64)
+        self.sojourn_sum = np.zeros(2, dtype=np.float64)  # seconds: dropped, marked
+
+    def _control_law(self, t: float) -> float:
+        return t + self.interval / math.sqrt(self.count)
+
+    def _ok_to_drop(self, sojourn: float, now: float) -> bool:
+        if sojourn < self.target:
+            self.first_above_time = 0.0
+            return False
+        if not self.first_above_time:
+            self.first_above_time = now + self.interval
+            return False
+        return now >= self.first_above_time
+
+    def _signal(self, sojourn: float, now: float) -> bool:
+        if self.dropping:
+            if not self._ok_to_drop(sojourn, now):
+                self.dropping = False
+                return False
+            if now < self.drop_next:
+                return False
+            self.count += 1
+            self.drop_next = self._control_law(self.drop_next)
+            return True
+        if not self._ok_to_drop(sojourn, now):
+            return False
+        self.dropping = True
+        # Resume near the previous drop rate if the last dropping episode ended recently
+        delta = self.count - self.last_count
+        self.count = delta if delta > 1 and now - self.drop_next < 16 * self.interval else 1
+        self.last_count = self.count
+        self.drop_next = self._control_law(now)
+        return True
+
+    def _record(self, histogram: np.ndarray, column: int, sojourns: np.ndarray):
+        micros = np.maximum(sojourns * 1e6, 0).astype(np.int64)
+        buckets = np.minimum(np.ceil(np.log2(micros + 1)).astype(np.int64), SOJOURN_BUCKETS - 1)
+        np.add.at(histogram, buckets, 1)
+        self.sojourn_sum[column] += float(sojourns.sum())
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        now = time.time()
+        sojourns = now - view.timestamps
+        if not self.dropping and sojourns.max(initial=0.0) < self.target:
+            self.first_above_time = 0.0  # fast path: no standing queue
+            return view
+        signalled = np.fromiter((self._signal(float(sojourn), now) for sojourn in sojourns), dtype=bool,
+                                count=len(view))
+        if not signalled.any():
+            return view
+        drop = signalled
+        if self.ecn:
+            marked = np.zeros(len(view), dtype=bool)
+            marked[signalled] = view.select(signalled).set_ce()
+            if marked.any():
+                self.marked += int(marked.sum())
+                self._record(self.mark_sojourn, 1, sojourns[marked])
+            drop = signalled & ~marked
+        if drop.any():
+            self.dropped += int(drop.sum())
+            self._record(self.drop_sojourn, 0, sojourns[drop])
+        return view.select(~drop)
+
+    def process_packet(self, packet) -> bool:
+        now = time.time()
+        sojourn = now - float(getattr(packet, "time", now))
+        if not self._signal(sojourn, now):
+            return True
+        self.dropped += 1
+        self._record(self.drop_sojourn, 0, np.array([sojourn]))
+        return False
+
+    def stats(self):
+        mean_drop = float(self.sojourn_sum[0]) / self.dropped if self.dropped else 0.0
+        return {"dropped": self.dropped, "marked": self.marked, "dropping": self.dropping,
+                "drop_sojourn_mean_ms": round(mean_drop * 1e3, 3)}
+
+
+MAX_METER_PASSES = 8  # vectorized passes per token bucket and batch before finishing packet by packet
+
+
+def meter(times: np.ndarray, lengths: np.ndarray, tokens: float, last: float, rate: float, depth: float):
+    """
+    Token bucket (rate B/s, depth B) over a batch of arrivals: a packet conforms if the bucket
+    holds its length, which is then taken out. Returns (conform mask, tokens, last update time).
+
+    Runs of conforming packets are solved in one pass: with every packet of the run taking its
+    length, the tokens before packet i are
+        x_i - S_i + min(T_0, min_{j<=i} (depth - x_j + S_j))
+    (x: credit earned since the run started, S: bytes taken before, the min: the depth cap),
+    a cumsum and a minimum.accumulate. The first packet short of tokens ends the run; the
+    following run of non-conforming packets only refills the bucket, one more pass. Traffic
+    alternating too often (heavy overload) finishes with the scalar loop.
+    """
+    n = len(times)
+    conform = np.zeros(n, dtype=bool)
+    start = passes = 0
+    while start < n and passes < MAX_METER_PASSES:
+        passes += 1
+        # ── Conforming run ─────────────────────────────────────────────────────────
+        t, size = times[start:], lengths[start:]
+        tokens = min(depth, tokens + rate * max(t[0] - last, 0.0))
+        credit = rate * (t - t[0])
+        spent = np.zeros(len(t))
+        np.cumsum(size[:-1], out=spent[1:])
+        available = credit - spent + np.minimum(tokens, np.minimum.accumulate(depth - credit + spent))
+        short = available < size
+        run = int(np.argmax(short)) if short.any() else len(t)
+        conform[start:start + run] = True
+        if run == len(t):
+            return conform, float(available[-1] - size[-1]), float(t[-1])
+        tokens, last = float(available[run]), float(t[run])
+        start += run + 1
+        if start == n:
+            break
+        # ── Non-conforming run: nothing taken, the bucket only refills ─────────────
+        t, size = times[start:], lengths[start:]
+        fits = np.minimum(depth, tokens + rate * (t - last)) >= size
+        start += int(np.argmax(fits)) if fits.any() else len(t)
+    for i in range(start, n):
+        t = float(times[i])
+        tokens, last = min(depth, tokens + rate * max(t - last, 0.0)), t
+        if tokens >= lengths[i]:
+            tokens -= float(lengths[i])
+            conform[i] = True
+    return conform, tokens, last
+
+
+class TrTCM(Stage):
+    name = "trtcm"
+    batch = True
+    ACTIONS = ("pass", "mark", "drop")
+    COLORS = ("green", "yellow", "red")
+    # Rates and burst sizes default to the slice policy (see make_stage)
+    POLICY_DEFAULTS = {"cir": "rate", "pir": "ceil", "cbs": "burst", "pbs": "burst"}
+
+    def __init__(self, cir: str, pir: str, cbs="15k", pbs="15k", yellow: str = "mark", red: str = "drop",
+                 yellow_dscp: int = 0, red_dscp: int = 0):
+        """
+        Color-blind two-rate three-color marker (RFC 2698): packets above the peak rate are red,
+        above the committed rate yellow, the others green.
+        :param cir: committed information rate, e.g. "10mbit" (default: the slice rate)
+        :param pir: peak information rate, at least cir (default: the slice ceil)
+        :param cbs: committed burst size, e.g. "15k" (default: the slice burst)
+        :param pbs: peak burst size (default: the slice burst)
+        :param yellow: "pass", "mark" with yellow_dscp (e.g. 0 to downgrade to best effort) or "drop"
+        :param red: same choices for red packets, with red_dscp
+        """
+        super().__init__()
+        for action in (yellow, red):
+            if action not in self.ACTIONS:
+                raise ValueError(f"actions must be one of {', '.join(self.ACTIONS)} (got {action!r})")
+        self.cir, self.pir = parse_rate(cir), parse_rate(pir)
+        self.cbs, self.pbs = parse_size(cbs), parse_size(pbs)
+        if self.pir < self.cir:
+            raise ValueError(f"pir ({pir}) must not be below cir ({cir})")
+        if not 0 <= yellow_dscp <= 63 or not 0 <= red_dscp <= 63:
+            raise ValueError("yellow_dscp and red_dscp must be 0-63")
+        self.actions = {1: (yellow, yellow_dscp), 2: (red, red_dscp)}
+        # Both buckets start full (RFC 2698)
+        self.committed, self.peak = float(self.cbs), float(self.pbs)
+        self.last_committed = self.last_peak = 0.0
+        # The buckets and counters take no lock: PacketClassifier's flush lock runs one batch at a
+        # time through the slices, so process_batch never overlaps itself
+        # Conformance counters per color: packets, bytes
+        self.colors = np.zeros((3, 2), dtype=np.int64)
+
+    def color(self, times: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Color of every packet (0 green, 1 yellow, 2 red), updating both buckets."""
+        times = np.maximum.accumulate(times)  # a bucket never refills backwards
+        if not self.last_peak:
+            self.last_committed = self.last_peak = float(times[0])
+        lengths = lengths.astype(np.float64)
+        under_peak, self.peak, self.last_peak = meter(times, lengths, self.peak, self.last_peak, self.pir, self.pbs)
+        # The committed bucket only sees the packets that were not red
+        colors = np.full(len(times), 2, dtype=np.uint8)
+        under_committed, self.committed, self.last_committed = meter(
+            times[under_peak], lengths[under_peak], self.committed, self.last_committed, self.cir, self.cbs)
+        colors[under_peak] = np.where(under_committed, 0, 1)
+        return colors
+
+    def _count(self, colors: np.ndarray, lengths: np.ndarray):
+        self.colors[:, 0] += np.bincount(colors, minlength=3)
+        self.colors[:, 1] += np.bincount(colors, weights=lengths, minlength=3).astype(np.int64)
+
+    def process_batch(self, view: BatchView) -> BatchView:
+        if not len(view):
+            return view
+        lengths = view.lengths
+        colors = self.color(view.timestamps, lengths)
+        self._count(colors, lengths)
+        keep = np.ones(len(view), dtype=bool)
+        for color, (action, dscp) in self.actions.items():
+            hit = colors == color
+            if action == "pass" or not hit.any():
+                continue
+            if action == "mark":
+                view.select(hit).set_dscp(dscp)
+            else:
+                keep &= ~hit
+        dropped = len(view) - int(keep.sum())
+        if not dropped:
+            return view
+        self.dropped += dropped
+        return view.select(keep)
+
+    def process_packet(self, packet) -> bool:
+        now = float(getattr(packet, "time", time.time()))
+        color = int(self.color(np.array([now]), np.array([len(packet)]))[0])
+        self._count(np.array([color]), np.array([len(packet)]))
+        action, dscp = self.actions.get(color, ("pass", 0))
+        if action == "drop":
+            self.dropped += 1
+            return False
+        if action == "mark":
+            if packet.haslayer("IP"):
+                packet["IP"].tos = (dscp << 2) | (packet["IP"].tos & 0x03)
+                del packet["IP"].chksum
+            elif packet.haslayer("IPv6"):
+                packet["IPv6"].tc = (dscp << 2) | (packet["IPv6"].tc & 0x03)
+        return True
+
+    def stats(self):
+        return {"dropped": self.dropped, **{color: int(self.colors[i, 0]) for i, color in enumerate(self.COLORS)}}
+
+
+# Stage types a slice can reference by name in the configuration file
+STAGES = {stage.name: stage for stage in (SizePolicer, Timestamper, Sampler, Marker, L2Rewrite, CoDel, TrTCM)}
+
+
+def make_stage(spec: dict, policy=None) -> Stage:
+    """
+    Build a stage from a configuration mapping such as {"type": "police", "max_size": 1500}.
+    :param policy: slice Policy filling the parameters a stage takes from it (POLICY_DEFAULTS)
+    """
+    kwargs = dict(spec)
+    kind = kwargs.pop("type", None)
+    if kind not in STAGES:
+        raise ValueError(f"unknown stage type {kind!r} (known: {', '.join(STAGES)})")
+    if policy is not None:
+        for key, attribute in getattr(STAGES[kind], "POLICY_DEFAULTS", {}).items():
+            kwargs.setdefault(key, getattr(policy, attribute))
+    return STAGES[kind](**kwargs)
+
+
+class Pipeline:
+    def __init__(self, stages: Optional[List[Stage]] = None):
+        self.stages: List[Stage] = list(stages or [])
+
+    def __len__(self):
+        return len(self.stages)
+
+    def append(self, stage: Stage):
+        self.stages.append(stage)
+
+    @property
+    def batch_stages(self) -> List[Stage]:
+        return [stage for stage in self.stages if stage.batch]
+
+    @property
+    def packet_stages(self) -> List[Stage]:
+        return [stage for stage in self.stages if not stage.batch]
+
+    def run_packet(self, packet) -> bool:
+        """Run every stage, in order, on one Scapy packet. Returns False if it was dropped."""
+        for stage in self.stages:
+            if not stage.process_packet(packet):
+                return False
+        return True
+
+    def run_batch(self, view: BatchView) -> BatchView:
+        """
+        Run every stage on a view, in order (one call per batch stage). Returns the view of
+        the kept frames, over the same batch: frames changed by per-packet stages are written
+        back into it, so the batch columns (dscp, ...) describe the frames as they leave.
+        """
+        first = 0
+        while first < len(self.stages) and len(view):
+            stage = self.stages[first]
+            if stage.batch:
+                view = stage.process_batch(view)
+                first += 1
+                continue
+            last = first
+            while last < len(self.stages) and not self.stages[last].batch:
+                last += 1
+            view = self._run_packets(view, self.stages[first:last])
+            first = last
+        return view
+
+    @staticmethod
+    def _run_packets(view: BatchView, stages: List[Stage]) -> BatchView:
+        """Run consecutive per-packet stages on Scapy packets and write the kept frames back."""
+        from scapy.layers.l2 import Ether
+
+        kept, frames = [], []
+        for position, (frame, timestamp) in enumerate(zip(view.frames(), view.timestamps.tolist())):
+            packet = Ether(frame.tobytes())
+            packet.time = timestamp
+            if all(stage.process_packet(packet) for stage in stages):
+                kept.append(position)
+                frames.append(bytes(packet))
+        view = view.select(np.asarray(kept, dtype=np.int64))
+        view.batch.rewrite(view.indices, frames)
+        return view
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {f"{i}:{stage.name}": stage.stats() for i, stage in enumerate(self.stages)}
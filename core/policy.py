@@ -1,5 +1,40 @@
+import re
+
 from config import HANDLE
 
+_QUANTITY = re.compile(r"^\s*([0-9]+(?:\.[0-9]+)?)\s*([kmgt]i?)?(bit|bps|b)?\s*$", re.IGNORECASE)
+_PREFIX = {None: 1, "k": 1e3, "m": 1e6, "g": 1e9, "t": 1e12, "ki": 2 ** 10, "mi": 2 ** 20, "gi": 2 ** 30, "ti": 2 ** 40}
+
+# Leaf qdiscs a slice can use and the tc parameters each accepts. Boolean parameters are
+# flags: ecn = true -> "ecn", ecn = false -> "noecn".
+AQM_PARAMS = {
+    "pfifo": (),
+    "fq_codel": ("target", "interval", "flows", "quantum", "ce_threshold", "memory_limit", "ecn"),
+    "codel": ("target", "interval", "ce_threshold", "ecn"),
+    "pie": ("target", "tupdate", "alpha", "beta", "ecn", "bytemode"),
+    "sfq": ("perturb", "quantum", "divisor", "flows", "depth", "headdrop"),
+}
+# Keys of a slice's fair_queue table (per-flow DRR in the slicer, see core.scheduler)
+FAIR_QUEUE_KEYS = ("buckets", "quantum", "flow_limit", "limit", "rate")
+
+
+def parse_rate(rate) -> float:
+    """tc rate ("10mbit", "1gbit", "500kbps") in bytes per second."""
+    match = _QUANTITY.match(str(rate))
+    if not match or (match.group(3) or "").lower() not in ("bit", "bps"):
+        raise ValueError(f"invalid rate {rate!r}")
+    value = float(match.group(1)) * _PREFIX[(match.group(2) or "").lower() or None]
+    return value / 8 if match.group(3).lower() == "bit" else value
+
+
+def parse_size(size) -> int:
+    """tc size ("15k", "1mb", 1500) in bytes; as in tc, k/m/g are powers of 1024 here."""
+    match = _QUANTITY.match(str(size))
+    if not match or (match.group(3) or "b").lower() != "b":
+        raise ValueError(f"invalid size {size!r}")
+    prefix = (match.group(2) or "").lower().rstrip("i")
+    return int(float(match.group(1)) * _PREFIX[f"{prefix}i" if prefix else None])
+
 
 class Policy:
     def __init__(self, classid, **kwargs):
@@ -16,7 +51,33 @@ class Policy:
         # Priority (lower = higher priority)
         self.prio = kwargs.get('prio', 0)
         # Maximum packet size for this class
-        self.mtu = kwargs.get('prio', 1500)
+        self.mtu = kwargs.get('mtu', 1500)
+        # SLA targets checked by the active slice prober (None = not enforced)
+        self.max_delay = kwargs.get('max_delay', None)  # one-way delay (ms)
+        self.max_jitter = kwargs.get('max_jitter', None)  # RFC 3550 jitter (ms)
+        self.max_loss = kwargs.get('max_loss', None)  # loss (%)
+        # Leaf qdisc: plain FIFO, an AQM (fq_codel, codel, pie) or sfq with its tc parameters
+        self.aqm = kwargs.get('aqm', "pfifo")
+        self.aqm_params = dict(kwargs.get('aqm_params', {}))
+        # Per-flow fair queuing (None = forward in arrival order)
+        self.fair_queue = kwargs.get('fair_queue', None)
+
+    def leaf_qdisc(self):
+        """tc arguments of the leaf qdisc, e.g. ["fq_codel", "limit", "100", "target", "1ms"]"""
+        if self.fair_queue is not None and self.aqm == "pfifo":
+            # The kernel leaf mirrors the slicer's flow queues: sfq with the same quantum and hash size
+            aqm = "sfq"
+            aqm_params = {"quantum": self.fair_queue.get("quantum", 1514),
+                          "divisor": self.fair_queue.get("buckets", 1024), "perturb": 10}
+        else:
+            aqm, aqm_params = self.aqm, self.aqm_params
+        args = [aqm, "limit", str(self.qsize)]
+        for key, value in aqm_params.items():
+            if isinstance(value, bool):
+                args.append(key if value else f"no{key}")
+            else:
+                args += [key, str(value)]
+        return args
 
     def __str__(self):
         attributes = ", ".join(f"{key}={value!r}" for key, value in self.__dict__.items())
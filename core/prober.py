@@ -0,0 +1,245 @@
+"""
+Per-slice active prober.
+
+SliceProber sends timestamped, sequence-numbered UDP probe trains marked with the DSCP of
+every slice. ProbeReflector receives them on the far end, computes per-slice one-way delay,
+RFC 3550 jitter, reordering and loss in real time into a ProbeMetrics engine, and echoes the
+probes back so the prober also tracks the RTT/2 delay without clock synchronization.
+
+Usage:
+    python -m core.prober reflect --port 7000
+    python -m core.prober probe 10.0.0.2 --port 7000 --period 1 --train 20
+"""
+import argparse
+import socket
+import struct
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+import config
+from utils.helpers import log
+from utils.metrics import ProbeMetrics
+
+PROBE_MAGIC = 0x4E53  # "NS"
+# magic, DSCP, flags, sequence number, send timestamp (ns, wall clock)
+PROBE_HEADER = struct.Struct("!HBBIQ")
+FLAG_ECHO = 0x01
+
+
+class SliceProber:
+    def __init__(self, slices: Dict[str, int], target: str, port: int = 7000, period: float = 1.0,
+                 train_size: int = 10, spacing: float = 0.001, payload: int = 64, policies=None):
+        """
+        :param slices: mapping slice name -> DSCP (see from_slices for NetworkSlice instances)
+        :param period: seconds between the start of two probe trains
+        :param train_size: probes per slice and train
+        :param spacing: seconds between two probes of a train
+        :param payload: UDP payload size (B) of each probe
+        :param policies: mapping slice name -> Policy whose SLA is checked after every train
+        """
+        self.slices = slices
+        self.target = (target, port)
+        self.period = period
+        self.train_size = train_size
+        self.spacing = spacing
+        self.padding = bytes(max(payload - PROBE_HEADER.size, 0))
+        self.policies = policies
+        # Statistics of the echoed probes, delays taken as RTT/2
+        self.metrics = ProbeMetrics(slices, delay_scale=0.5)
+        self._sockets = {}
+        for dscp in slices.values():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, dscp << 2)
+            sock.settimeout(0.5)
+            self._sockets[dscp] = sock
+        self._seq = {dscp: 0 for dscp in slices.values()}
+        self._running = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_slices(cls, slices, target: str, **kwargs):
+        """Build a prober (checking each slice SLA) for a dict of NetworkSlice instances."""
+        kwargs.setdefault("policies", {name: ns.policy for name, ns in slices.items()})
+        return cls({name: ns.dscp for name, ns in slices.items()}, target, **kwargs)
+
+    def start(self):
+        self._running.set()
+        self._threads = [threading.Thread(target=self._send_loop, daemon=True)]
+        self._threads += [threading.Thread(target=self._echo_loop, args=(sock,), daemon=True)
+                          for sock in self._sockets.values()]
+        for thread in self._threads:
+            thread.start()
+        log('blue', f"Slice prober started towards {self.target[0]}:{self.target[1]}")
+
+    def stop(self):
+        self._running.clear()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        for sock in self._sockets.values():
+            sock.close()
+
+    def send_train(self):
+        """Send one probe train, interleaving slices so they see the same network state."""
+        for _ in range(self.train_size):
+            for dscp, sock in self._sockets.items():
+                seq = self._seq[dscp]
+                self._seq[dscp] = (seq + 1) & 0xFFFFFFFF
+                probe = PROBE_HEADER.pack(PROBE_MAGIC, dscp, 0, seq, time.time_ns()) + self.padding
+                try:
+                    sock.sendto(probe, self.target)
+                except OSError as e:
+                    log('red', f"Probe send failed: {e}")
+            time.sleep(self.spacing)
+
+    def _send_loop(self):
+        while self._running.is_set():
+            started = time.monotonic()
+            self.send_train()
+            if self.policies:
+                for violation in self.metrics.check_sla(self.policies):
+                    log('red', f"SLA violation {violation}")
+            time.sleep(max(self.period - (time.monotonic() - started), 0))
+
+    def _echo_loop(self, sock):
+        while self._running.is_set():
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            probe = parse_probe(data)
+            if probe is not None and probe[2] & FLAG_ECHO:
+                dscp, _, seq, sent_ns = probe[1:]
+                self.metrics.update(dscp, seq, time.time_ns() - sent_ns)
+
+
+class ProbeReflector:
+    def __init__(self, port: int = 7000, slices: Optional[Dict[str, int]] = None, echo: bool = True,
+                 metrics: Optional[ProbeMetrics] = None):
+        """
+        :param slices: mapping slice name -> DSCP (default: the slices of config.DEFAULT_CONFIG)
+        :param echo: send every probe back to the prober for RTT measurement
+        :param metrics: metrics engine to feed (a new one is created if None)
+        """
+        if slices is None:
+            from core.slice_config import load_config
+            slices = load_config(config.DEFAULT_CONFIG).slice_dscp()
+        self.slices = slices
+        self.metrics = ProbeMetrics(self.slices) if metrics is None else metrics
+        self.echo = echo
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Report the received TOS so we can see if the network remarked the probes
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_RECVTOS, 1)
+        self.sock.bind(("0.0.0.0", port))
+        self.sock.settimeout(0.5)
+        self._tos = 0
+        self._running = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+        log('blue', f"Probe reflector listening on port {self.sock.getsockname()[1]}")
+
+    def stop(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self.sock.close()
+
+    def serve(self):
+        self._running.set()
+        while self._running.is_set():
+            try:
+                data, ancdata, _, addr = self.sock.recvmsg(65535, socket.CMSG_SPACE(1))
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            received_ns = time.time_ns()
+            probe = parse_probe(data)
+            if probe is None or probe[2] & FLAG_ECHO:
+                continue
+            _, dscp, flags, seq, sent_ns = probe
+            tos = None
+            for level, kind, value in ancdata:
+                if level == socket.IPPROTO_IP and kind == socket.IP_TOS and value:
+                    tos = value[0]
+            self.metrics.update(dscp, seq, received_ns - sent_ns, tos)
+            if self.echo:
+                self._reflect(data, dscp, addr)
+
+    def _reflect(self, data, dscp, addr):
+        if self._tos != dscp << 2:
+            self._tos = dscp << 2
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, self._tos)
+        reply = bytearray(data)
+        reply[3] |= FLAG_ECHO
+        try:
+            self.sock.sendto(reply, addr)
+        except OSError:
+            pass
+
+
+def parse_probe(data: bytes):
+    """Return (magic, dscp, flags, seq, sent_ns) or None if data is not a probe."""
+    if len(data) < PROBE_HEADER.size:
+        return None
+    probe = PROBE_HEADER.unpack_from(data)
+    return probe if probe[0] == PROBE_MAGIC else None
+
+
+def _display(report, title):
+    log('magenta', title)
+    for name, stats in report.items():
+        print(f"  {name:<6} " + " | ".join(f"{key}={value}" for key, value in stats.items() if key != "slice"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSlicer per-slice active prober")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    reflect = sub.add_parser("reflect", help="Receive probes, compute metrics and echo them back")
+    reflect.add_argument("--port", type=int, default=7000)
+    reflect.add_argument("--no-echo", action="store_false", dest="echo")
+    reflect.add_argument("--report", type=float, default=5.0, help="Seconds between two reports")
+    probe = sub.add_parser("probe", help="Send probe trains for every slice")
+    probe.add_argument("target")
+    probe.add_argument("--port", type=int, default=7000)
+    probe.add_argument("--period", type=float, default=1.0)
+    probe.add_argument("--train", type=int, default=10)
+    probe.add_argument("--spacing", type=float, default=0.001)
+    probe.add_argument("--payload", type=int, default=64)
+    probe.add_argument("--report", type=float, default=5.0, help="Seconds between two reports")
+    parser.add_argument("--config", default=config.DEFAULT_CONFIG, help="Slice configuration (names and DSCPs)")
+    opts = parser.parse_args()
+
+    from core.slice_config import ConfigError, load_config
+    try:
+        slices = load_config(opts.config).slice_dscp()
+    except ConfigError as e:
+        log('red', str(e))
+        sys.exit(1)
+    if opts.mode == "reflect":
+        endpoint = ProbeReflector(port=opts.port, slices=slices, echo=opts.echo)
+    else:
+        endpoint = SliceProber(slices, opts.target, port=opts.port, period=opts.period,
+                               train_size=opts.train, spacing=opts.spacing, payload=opts.payload)
+    endpoint.start()
+    try:
+        while True:
+            time.sleep(opts.report)
+            title = "One-way probe metrics" if opts.mode == "reflect" else "RTT/2 probe metrics"
+            _display(endpoint.metrics.snapshot(), title)
+    finally:
+        endpoint.stop()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        log("red", "Prober stopped by KeyboardInterrupt!")
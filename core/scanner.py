@@ -1,8 +1,6 @@
 import socket
 
 import psutil
-import questionary
-from questionary import Choice
 
 from utils.helpers import log
 
@@ -14,6 +12,7 @@ class Scanner:
 
     @staticmethod
     def _get_interfaces():
+        from questionary import Choice
         log('blue', "Scanning for available network interfaces...")
         interfaces = psutil.net_if_addrs()
         stats = psutil.net_if_stats()  # Retrieve interface statistics
@@ -36,6 +35,8 @@ class Scanner:
         return inter_list
 
     def select_interface(self):
+        # questionary is only needed for the interactive prompts
+        import questionary
         # Create an instance to obtain the list of interfaces.
         selected = questionary.select(
             "Select a network interface:",
@@ -53,8 +54,11 @@ class Scanner:
         return selected
 
     def packet_filter(self):
+        import questionary
+        from questionary import Choice
         protocols = [
             Choice("IP", checked=True),
+            Choice("IP6", checked=True),
             Choice("TCP", checked=True),
             Choice("UDP", checked=True),
             Choice("ICMP", checked=True)
@@ -0,0 +1,178 @@
+"""
+Per-flow fair queuing inside a slice: deficit round robin over hashed flow queues.
+
+A slice with a fair_queue table no longer forwards a batch as soon as its pipeline is done.
+The frames are spread over a fixed array of flow queues by their 5-tuple flow hash, and a
+DRR scheduler takes them out: each backlogged flow may send `quantum` bytes per round. The
+output is paced at the slice rate, so a single elephant flow only gets its share and the
+other flows of the slice keep theirs. Memory is bounded: at most `flow_limit` frames per
+queue and `limit` frames in total. Enqueue and dequeue are O(1): the active flows form a
+round-robin deque. When the total limit is hit, the head of the fattest queue is dropped.
+
+The tc leaf of such a slice becomes sfq (same hashing and quantum in the kernel) unless an
+AQM that already queues per flow (fq_codel) was chosen; see Policy.leaf_qdisc.
+"""
+import collections
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional
+
+class DRRScheduler:
+    def __init__(self, buckets: int = 1024, quantum: int = 1514, flow_limit: int = 64, limit: int = 4096):
+        """
+        :param buckets: flow queues (flows are hashed onto them)
+        :param quantum: bytes a flow may send per round (at least one MTU)
+        :param flow_limit: frames one flow queue holds before tail-dropping
+        :param limit: frames all queues hold together
+        """
+        if buckets < 1 or quantum < 1 or flow_limit < 1 or limit < 1:
+            raise ValueError("buckets, quantum, flow_limit and limit must be positive")
+        self.buckets = buckets
+        self.quantum = quantum
+        self.flow_limit = flow_limit
+        self.limit = limit
+        self.queues: List[Deque[bytes]] = [collections.deque() for _ in range(buckets)]
+        self.deficit = [0] * buckets
+        self.active: Deque[int] = collections.deque()  # backlogged buckets, in round-robin order
+        self._visiting = False  # the bucket at active[0] already got this round's quantum
+        self._fattest = 0  # approximate longest queue, for overflow drops
+        self.backlog = 0
+        self.backlog_bytes = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def __len__(self):
+        return self.backlog
+
+    def enqueue(self, frame: bytes, flow_hash: int) -> bool:
+        """Queue one frame on its flow's queue. Returns False if it was dropped."""
+        bucket = flow_hash % self.buckets
+        queue = self.queues[bucket]
+        if len(queue) >= self.flow_limit:
+            self.dropped += 1
+            return False
+        if self.backlog >= self.limit and not self._drop_fattest():
+            self.dropped += 1
+            return False
+        if not queue:
+            self.active.append(bucket)
+        queue.append(frame)
+        self.backlog += 1
+        self.backlog_bytes += len(frame)
+        if len(queue) > len(self.queues[self._fattest]):
+            self._fattest = bucket
+        return True
+
+    def enqueue_many(self, frames: List[bytes], flow_hashes: List[int]) -> int:
+        """Queue frames with their flow hashes (BatchView.flow_hash). Returns how many were kept."""
+        return sum(self.enqueue(frame, flow) for frame, flow in zip(frames, flow_hashes))
+
+    def _drop_fattest(self) -> bool:
+        queue = self.queues[self._fattest]
+        if not queue:
+            # The cached queue drained meanwhile: rescan the backlogged ones (only on overflow)
+            self._fattest = max(self.active, key=lambda bucket: len(self.queues[bucket]), default=0)
+            queue = self.queues[self._fattest]
+            if not queue:
+                return False
+        frame = queue.popleft()
+        self.backlog -= 1
+        self.backlog_bytes -= len(frame)
+        self.dropped += 1
+        if not queue:
+            # Rare: the fattest queue had a single frame. Only the head bucket owns _visiting
+            if self.active[0] == self._fattest:
+                self._visiting = False
+            self.active.remove(self._fattest)
+            self.deficit[self._fattest] = 0
+        return True
+
+    def dequeue(self, budget: float) -> List[bytes]:
+        """
+        Frames to send now, in DRR order, while the byte budget lasts (the last frame may overdraw it).
+        """
+        out = []
+        while self.active and budget > 0:
+            bucket = self.active[0]
+            queue = self.queues[bucket]
+            if not self._visiting:
+                self.deficit[bucket] += self.quantum
+                self._visiting = True
+            while queue and self.deficit[bucket] >= len(queue[0]) and budget > 0:
+                frame = queue.popleft()
+                self.deficit[bucket] -= len(frame)
+                budget -= len(frame)
+                self.backlog -= 1
+                self.backlog_bytes -= len(frame)
+                out.append(frame)
+            if not queue:
+                self.deficit[bucket] = 0
+                self.active.popleft()
+                self._visiting = False
+            elif self.deficit[bucket] < len(queue[0]):
+                self.active.rotate(-1)
+                self._visiting = False
+            # else: the budget ran out in the middle of this flow's turn
+        self.sent += len(out)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"backlog": self.backlog, "backlog_bytes": self.backlog_bytes, "flows": len(self.active),
+                "sent": self.sent, "dropped": self.dropped}
+
+
+class PacedScheduler:
+    """
+    DRR scheduler drained at a fixed rate (token bucket). Frames are handed to `send`;
+    a timer drains the backlog left when no new batch arrives.
+    """
+
+    def __init__(self, scheduler: DRRScheduler, rate: float, send: Callable[[bytes], None], burst: float = 0.0):
+        """
+        :param rate: output rate (bytes/s)
+        :param burst: bytes that may leave back to back (default: 10 ms at rate, at least 2 quanta)
+        """
+        self.scheduler = scheduler
+        self.rate = rate
+        self.burst = burst or max(rate * 0.01, 2 * scheduler.quantum)
+        self.send = send
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None  # at most one pending wake-up
+        self._stopped = False
+
+    def push(self, frames: List[bytes], flow_hashes: List[int]) -> List[bool]:
+        """Queue frames and send what the rate allows. Returns which frames were queued (False: dropped)."""
+        with self._lock:
+            queued = [self.scheduler.enqueue(frame, flow) for frame, flow in zip(frames, flow_hashes)]
+        self.drain()
+        return queued
+
+    def _wake(self):
+        with self._lock:
+            self._timer = None
+        self.drain()
+
+    def drain(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._last) * self.rate, self.burst)
+            self._last = now
+            frames = self.scheduler.dequeue(self._tokens)
+            self._tokens -= sum(map(len, frames))
+            if len(self.scheduler) and self._timer is None and not self._stopped:
+                # Wake up once the bucket holds about one quantum again (pushes meanwhile reuse this timer)
+                wait = max((self.scheduler.quantum - self._tokens) / self.rate, 0.001)
+                self._timer = threading.Timer(wait, self._wake)
+                self._timer.daemon = True
+                self._timer.start()
+        for frame in frames:
+            self.send(frame)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
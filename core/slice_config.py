@@ -0,0 +1,376 @@
+"""
+Declarative slicer configuration (TOML or YAML).
+
+The file describes the interface, the BPF filter, the engine and the slices. It is
+validated as a whole (every problem is reported at once) and compiled once at startup
+into the slice specs, the classifier DSCP table and the tc plan.
+
+Usage:
+    python -m core.slice_config slices.toml     # validate and print the tc plan
+"""
+import inspect
+import ipaddress
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+from core.policy import AQM_PARAMS, FAIR_QUEUE_KEYS, Policy
+
+ENGINES = ("cpu", "gpu", "offload")
+DSCP_NAMES = {"BE": 0, "DF": 0, "EF": 46, "VA": 44}
+DSCP_NAMES.update({f"CS{x}": 8 * x for x in range(8)})
+DSCP_NAMES.update({f"AF{x}{y}": 8 * x + 2 * y for x in range(1, 5) for y in range(1, 4)})
+
+_RATE = re.compile(r"^\d+(\.\d+)?([kmgt]i?)?(bit|bps)$", re.IGNORECASE)
+_SIZE = re.compile(r"^\d+(\.\d+)?([kmg]i?)?b?$", re.IGNORECASE)
+_NAME = re.compile(r"^[a-z][a-z0-9_]*$")
+
+
+class ConfigError(ValueError):
+    """Invalid slicer configuration; `errors` lists every problem found."""
+
+    def __init__(self, source, errors):
+        self.errors = errors
+        super().__init__(f"Invalid configuration {source}:\n  - " + "\n  - ".join(errors))
+
+
+@dataclass
+class SliceSpec:
+    name: str
+    dscp: int
+    classid: int
+    rate: str = "10mbit"
+    ceil: str = "20mbit"
+    burst: str = "15k"
+    qsize: int = 100
+    prio: int = 0
+    mtu: int = 1500
+    handler: Optional[str] = None
+    handler_args: Dict[str, Any] = field(default_factory=dict)
+    # Handler pipeline stages, e.g. {"type": "police", "max_size": 1500} (see core.pipeline)
+    stages: List[Dict[str, Any]] = field(default_factory=list)
+    # Optional capture restrictions used by the kernel filter (see core.packet_filter)
+    prefixes: List[str] = field(default_factory=list)
+    ports: List[Union[int, str]] = field(default_factory=list)
+    max_delay: Optional[float] = None
+    max_jitter: Optional[float] = None
+    max_loss: Optional[float] = None
+    # Leaf qdisc: "pfifo" or an AQM ("fq_codel", "codel", "pie") with its tc parameters
+    aqm: str = "pfifo"
+    aqm_params: Dict[str, Any] = field(default_factory=dict)
+    # Per-flow DRR inside the slice, e.g. {"quantum": 1514, "rate": "20mbit"} (see core.scheduler)
+    fair_queue: Optional[Dict[str, Any]] = None
+
+    def policy(self) -> Policy:
+        return Policy(self.classid, qsize=self.qsize, rate=self.rate, ceil=self.ceil, burst=self.burst,
+                      prio=self.prio, mtu=self.mtu, max_delay=self.max_delay, max_jitter=self.max_jitter,
+                      max_loss=self.max_loss, aqm=self.aqm, aqm_params=self.aqm_params,
+                      fair_queue=self.fair_queue)
+
+
+@dataclass
+class SlicerConfig:
+    interface: Optional[str]
+    filter: Optional[str]
+    engine: str
+    batch_size: int
+    time_limit: float
+    slices: List[SliceSpec]
+    source: str = "<defaults>"
+
+    def dscp_table(self) -> Dict[int, str]:
+        """DSCP -> slice name, as used by the classifier."""
+        return {spec.dscp: spec.name for spec in self.slices}
+
+    def slice_dscp(self) -> Dict[str, int]:
+        """Slice name -> DSCP, as used by the probers and the metrics CLI."""
+        return {spec.name: spec.dscp for spec in self.slices}
+
+    def tc_plan(self, slices) -> List[List[str]]:
+        """:param slices: mapping name -> NetworkSlice built from this configuration"""
+        return compile_tc_plan(self.interface, slices)
+
+
+def compile_tc_plan(interface: str, slices) -> List[List[str]]:
+    """
+    Every tc command needed to install the slices on an interface, in order.
+    :param slices: mapping name -> NetworkSlice
+    """
+    plan = [["tc", "qdisc", "add", "dev", interface, "root", "handle", "1:", "htb"]]
+    for ns in slices.values():
+        plan += ns.tc_commands()
+    return plan
+
+
+_SLICE_KEYS = {"name", "dscp", "rate", "ceil", "burst", "qsize", "prio", "mtu", "handler", "handler_args",
+               "stages", "prefixes", "ports", "max_delay", "max_jitter", "max_loss", "aqm", "aqm_params",
+               "fair_queue"}
+_TOP_KEYS = {"interface", "filter", "engine", "batch_size", "time_limit", "slices"}
+
+
+def _read(path: str) -> Dict[str, Any]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ConfigError(path, ["PyYAML is required for YAML configurations (pip install pyyaml)"])
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+    else:
+        import tomllib
+        with open(path, "rb") as f:
+            try:
+                data = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ConfigError(path, [str(e)])
+    if not isinstance(data, dict):
+        raise ConfigError(path, ["top level must be a table/mapping"])
+    return data
+
+
+def _dscp(value, where, errors) -> Optional[int]:
+    if isinstance(value, str):
+        if value.upper() in DSCP_NAMES:
+            return DSCP_NAMES[value.upper()]
+        try:
+            value = int(value, 0)
+        except ValueError:
+            errors.append(f"{where}: unknown DSCP {value!r}")
+            return None
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= 63:
+        errors.append(f"{where}: DSCP must be 0-63 or a name such as EF, AF11, CS1 (got {value!r})")
+        return None
+    return value
+
+
+def _slice(raw, index, errors) -> Optional[SliceSpec]:
+    from core.slices_setup import HANDLERS
+
+    where = f"slices[{index}]"
+    if not isinstance(raw, dict):
+        errors.append(f"{where}: must be a table/mapping")
+        return None
+    for key in sorted(set(raw) - _SLICE_KEYS):
+        errors.append(f"{where}: unknown key {key!r}")
+    name = raw.get("name")
+    if not isinstance(name, str) or not _NAME.match(name):
+        errors.append(f"{where}: name must be a lowercase identifier (got {name!r})")
+        return None
+    where = f"slice {name!r}"
+    spec = SliceSpec(name=name, dscp=0, classid=index + 1)
+    if "dscp" not in raw:
+        errors.append(f"{where}: dscp is required")
+    else:
+        spec.dscp = _dscp(raw["dscp"], where, errors)
+    for key, pattern, example in (("rate", _RATE, "10mbit"), ("ceil", _RATE, "1gbit"), ("burst", _SIZE, "15k")):
+        if key in raw:
+            if not isinstance(raw[key], str) or not pattern.match(raw[key].strip()):
+                errors.append(f"{where}: {key} must look like {example!r} (got {raw[key]!r})")
+            else:
+                setattr(spec, key, raw[key].strip())
+    for key, low, high in (("qsize", 1, 1_000_000), ("prio", 0, 7), ("mtu", 68, 65535)):
+        if key in raw:
+            value = raw[key]
+            if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+                errors.append(f"{where}: {key} must be an integer in [{low}, {high}] (got {value!r})")
+            else:
+                setattr(spec, key, value)
+    for key in ("max_delay", "max_jitter", "max_loss"):
+        if key in raw:
+            value = raw[key]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                errors.append(f"{where}: {key} must be a non-negative number (got {value!r})")
+            else:
+                setattr(spec, key, value)
+    if "handler" in raw:
+        if raw["handler"] not in HANDLERS:
+            errors.append(f"{where}: unknown handler {raw['handler']!r} (known: {', '.join(HANDLERS)})")
+        else:
+            spec.handler = raw["handler"]
+    if "handler_args" in raw:
+        if not isinstance(raw["handler_args"], dict):
+            errors.append(f"{where}: handler_args must be a table/mapping")
+        else:
+            spec.handler_args = dict(raw["handler_args"])
+    if "aqm" in raw:
+        if raw["aqm"] not in AQM_PARAMS:
+            errors.append(f"{where}: aqm must be one of {', '.join(AQM_PARAMS)} (got {raw['aqm']!r})")
+        else:
+            spec.aqm = raw["aqm"]
+    if "aqm_params" in raw:
+        params = raw["aqm_params"]
+        if not isinstance(params, dict):
+            errors.append(f"{where}: aqm_params must be a table/mapping")
+        else:
+            for key in sorted(set(params) - set(AQM_PARAMS.get(spec.aqm, ()))):
+                errors.append(f"{where}: {spec.aqm} has no parameter {key!r} "
+                              f"(known: {', '.join(AQM_PARAMS.get(spec.aqm, ())) or 'none'})")
+            for key, value in params.items():
+                if not isinstance(value, (str, int, float, bool)):
+                    errors.append(f"{where}: aqm_params.{key} must be a string, number or boolean")
+            spec.aqm_params = dict(params)
+    if "fair_queue" in raw:
+        spec.fair_queue = _fair_queue(raw["fair_queue"], spec.aqm, where, errors)
+    for stage in _list(raw, "stages", where, errors):
+        problem = _stage_problem(stage)
+        if problem:
+            errors.append(f"{where}: {problem}")
+        else:
+            spec.stages.append(dict(stage))
+    for prefix in _list(raw, "prefixes", where, errors):
+        try:
+            spec.prefixes.append(str(ipaddress.ip_network(str(prefix), strict=False)))
+        except ValueError:
+            errors.append(f"{where}: invalid prefix {prefix!r}")
+    for port in _list(raw, "ports", where, errors):
+        port = _port(port)
+        if port is None:
+            errors.append(f"{where}: ports must be 1-65535 or ranges such as '5000-5100'")
+        else:
+            spec.ports.append(port)
+    return spec
+
+
+def _fair_queue(table, aqm, where, errors) -> Optional[Dict[str, Any]]:
+    if not isinstance(table, dict):
+        errors.append(f"{where}: fair_queue must be a table/mapping")
+        return None
+    for key in sorted(set(table) - set(FAIR_QUEUE_KEYS)):
+        errors.append(f"{where}: fair_queue has no key {key!r} (known: {', '.join(FAIR_QUEUE_KEYS)})")
+    for key, low, high in (("buckets", 1, 65536), ("quantum", 64, 65535), ("flow_limit", 1, 65535),
+                           ("limit", 1, 1_000_000)):
+        value = table.get(key, low)
+        if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+            errors.append(f"{where}: fair_queue.{key} must be an integer in [{low}, {high}] (got {value!r})")
+    buckets = table.get("buckets", 1024)
+    if isinstance(buckets, int) and buckets & (buckets - 1):
+        errors.append(f"{where}: fair_queue.buckets must be a power of two (sfq divisor, got {buckets})")
+    if "rate" in table and (not isinstance(table["rate"], str) or not _RATE.match(table["rate"].strip())):
+        errors.append(f"{where}: fair_queue.rate must look like '10mbit' (got {table['rate']!r})")
+    if aqm in ("codel", "pie", "sfq"):
+        # Their kernel leaf would not be mirroring the flow queues: sfq is generated from fair_queue itself
+        errors.append(f"{where}: fair_queue needs aqm = \"pfifo\" (sfq leaf) or \"fq_codel\" (got {aqm!r})")
+    return dict(table)
+
+
+def _list(raw, key, where, errors) -> list:
+    value = raw.get(key, [])
+    if not isinstance(value, list):
+        errors.append(f"{where}: {key} must be a list")
+        return []
+    return value
+
+
+def _stage_problem(stage) -> Optional[str]:
+    """Check a stage table against the stage constructor without building it (stages may open files)."""
+    from core.pipeline import STAGES
+
+    if not isinstance(stage, dict):
+        return "stages entries must be tables/mappings"
+    kwargs = dict(stage)
+    kind = kwargs.pop("type", None)
+    if kind not in STAGES:
+        return f"unknown stage type {kind!r} (known: {', '.join(STAGES)})"
+    for key in getattr(STAGES[kind], "POLICY_DEFAULTS", {}):
+        kwargs.setdefault(key, None)  # filled from the slice policy by make_stage
+    try:
+        inspect.signature(STAGES[kind]).bind(**kwargs)
+    except TypeError as e:
+        return f"stage {kind!r}: {e}"
+    return None
+
+
+def _port(value) -> Optional[Union[int, str]]:
+    """A port number or a 'low-high' range string, None if invalid."""
+    if isinstance(value, str) and "-" in value:
+        low, _, high = value.partition("-")
+        low, high = _port(low.strip()), _port(high.strip())
+        return f"{low}-{high}" if low is not None and high is not None and low <= high else None
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= 65535:
+        return None
+    return value
+
+
+def parse_config(data: Dict[str, Any], source: str = "<dict>") -> SlicerConfig:
+    """Validate a configuration mapping and compile it into a SlicerConfig."""
+    errors: List[str] = []
+    for key in sorted(set(data) - _TOP_KEYS):
+        errors.append(f"unknown key {key!r}")
+
+    interface = data.get("interface") or None
+    if interface is not None and not isinstance(interface, str):
+        errors.append(f"interface must be a string (got {interface!r})")
+    # "auto" generates the kernel filter from the slices (core.packet_filter)
+    bpf = data.get("filter") or None
+    if bpf is not None and not isinstance(bpf, str):
+        errors.append(f"filter must be a string (got {bpf!r})")
+    engine = data.get("engine", "cpu")
+    if engine not in ENGINES:
+        errors.append(f"engine must be one of {', '.join(ENGINES)} (got {engine!r})")
+    batch_size = data.get("batch_size", 1)
+    if isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size < 1:
+        errors.append(f"batch_size must be a positive integer (got {batch_size!r})")
+    time_limit = data.get("time_limit", 0.0)
+    if isinstance(time_limit, bool) or not isinstance(time_limit, (int, float)) or time_limit < 0:
+        errors.append(f"time_limit must be a non-negative number (got {time_limit!r})")
+
+    raw_slices = data.get("slices")
+    slices: List[SliceSpec] = []
+    if not isinstance(raw_slices, list) or not raw_slices:
+        errors.append("at least one [[slices]] entry is required")
+    else:
+        for index, raw in enumerate(raw_slices):
+            spec = _slice(raw, index, errors)
+            if spec is not None:
+                slices.append(spec)
+        seen_names, seen_dscp = {}, {}
+        for spec in slices:
+            if spec.name in seen_names:
+                errors.append(f"slice {spec.name!r} is defined twice")
+            seen_names[spec.name] = spec
+            if spec.dscp is not None and spec.dscp in seen_dscp:
+                errors.append(f"slices {seen_dscp[spec.dscp]!r} and {spec.name!r} share DSCP {spec.dscp}")
+            seen_dscp.setdefault(spec.dscp, spec.name)
+
+    if errors:
+        raise ConfigError(source, errors)
+    return SlicerConfig(interface=interface, filter=bpf, engine=engine, batch_size=batch_size,
+                        time_limit=float(time_limit), slices=slices, source=source)
+
+
+def load_config(path: str) -> SlicerConfig:
+    """Read, validate and compile a TOML or YAML configuration file."""
+    if not os.path.isfile(path):
+        raise ConfigError(path, ["file not found"])
+    return parse_config(_read(path), source=path)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python -m core.slice_config <config.toml|config.yaml>")
+        sys.exit(2)
+    try:
+        cfg = load_config(sys.argv[1])
+    except ConfigError as e:
+        print(e)
+        sys.exit(1)
+    from core.slices_setup import build_slices
+    cfg.interface = cfg.interface or "<interface>"
+    slices = build_slices(cfg.interface, cfg.slices)
+    print(f"{cfg.source}: OK ({len(cfg.slices)} slices, engine={cfg.engine})")
+    for dscp, name in cfg.dscp_table().items():
+        print(f"  DSCP {dscp:>2} -> {name} ({slices[name].policy})")
+        for stage in slices[name].pipeline.stages:
+            print(f"           stage {stage.name}{' (batch)' if stage.batch else ''}")
+    print("tc plan:")
+    for cmd in cfg.tc_plan(slices):
+        print("  " + " ".join(cmd))
+
+
+if __name__ == "__main__":
+    main()
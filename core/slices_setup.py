@@ -1,79 +1,64 @@
 import subprocess
 import time
+from typing import Dict, List, Optional
 
 from termcolor import colored
 
 import config
-from core.network_slice import NetworkSlice
-from core.policy import Policy
+from core.network_slice import NetworkSlice, run_tc_command
+from core.pipeline import Pipeline, make_stage
 from utils import log
 
 
-def setup_slices(interface):
-    try:
-        subprocess.run(["tc", "qdisc", "del", "dev", interface, "root"], stderr=subprocess.DEVNULL, check=True)
-    except subprocess.CalledProcessError as e:
-        # log('yellow', f"Skipping qdisc delete on {interface}")
-        pass
+def urllc_packet_handler(packet, max_latency=10):
+    packet.urllc_timestamp = time.time()
+    if len(packet) > 1500:
+        print(colored(f"URLLC packet too large! Size: {len(packet)}B", color="red", attrs=["bold"]))
 
-    # === URLLC ==============================================================>
-    ns_urllc = NetworkSlice(
-        "urllc",
-        0x2E,  # DSCP 46 (Expedited Forwarding for URLLC)
-        interface=interface,
-        policy=Policy(
-            classid=1,
-            qsize=100, # Max number of packets in the FIFO queue
-            rate="10mbit",  # Guaranteed minimum bandwidth
-            ceil="20mbit",  # Can burst up to 2x rate
-            burst="15k",  # Buffer for ~10 packets (1500B each)
-            prio=0,  # Highest priority (0-7, 0=highest)
-            mtu=1500  # Standard Ethernet MTU
-        ),
-        args=config.args
-    )
-    ns_urllc.configure()
 
-    # === eMBB ===============================================================>
+# Per-packet handlers a slice can reference by name in the configuration file. Prefer
+# pipeline stages (core.pipeline), which run once per batch.
+HANDLERS = {
+    "urllc": urllc_packet_handler,
+}
 
-    ns_embb = NetworkSlice(
-        "embb",
-        0x0A,  # DSCP AF11 (Assured Forwarding class 1, low drop)
-        interface=interface,
-        policy=Policy(
-            classid=2,  # Different class ID
-            qsize=1000,  # Max number of packets in the FIFO queue
-            rate="10mbit",  # Baseline guaranteed bandwidth
-            ceil="1gbit",  # Can burst up to 1Gbps if available
-            burst="50k",  # Larger burst buffer for throughput
-            prio=1  # Slightly lower priority than URLLC
-        ),
-        args=config.args
-    )
-    ns_embb.configure()
 
-    # === mMTC ===============================================================>
+def build_slices(interface, specs) -> Dict[str, NetworkSlice]:
+    """Create (without configuring tc) one NetworkSlice per SliceSpec."""
+    return {
+        spec.name: NetworkSlice(
+            spec.name,
+            spec.dscp,
+            interface=interface,
+            policy=spec.policy(),
+            packet_handler=HANDLERS[spec.handler] if spec.handler else None,
+            packet_handler_args=spec.handler_args,
+            args=config.args,
+            pipeline=Pipeline([make_stage(stage, spec.policy()) for stage in spec.stages])
+        )
+        for spec in specs
+    }
 
-    ns_mmtc = NetworkSlice(
-        "mmtc",
-        0x00,  # DSCP BE (Best Effort)
-        interface=interface,
-        policy=Policy(
-            classid=3,
-            qsize=1000,  # Max number of packets in the FIFO queue
-            rate="1mbit",  # Low baseline rate (IoT devices)
-            ceil="10mbit",  # Can borrow unused bandwidth
-            burst="5k",  # Small bursts (IoT sends tiny packets)
-            prio=2  # Lowest priority
-        ),
-        args=config.args
-    )
-    ns_mmtc.configure()
 
-    return ns_urllc, ns_embb, ns_mmtc
+def setup_slices(interface, specs: Optional[List] = None) -> Dict[str, NetworkSlice]:
+    """
+    Build the slices and install their tc plan on the interface.
+    :param specs: list of SliceSpec (default: the slices of config.DEFAULT_CONFIG)
+    """
+    from core.slice_config import compile_tc_plan, load_config
 
+    if specs is None:
+        specs = load_config(config.DEFAULT_CONFIG).slices
+    slices = build_slices(interface, specs)
+    plan = compile_tc_plan(interface, slices)
 
-def urllc_packet_handler(packet, max_latency=10):
-    packet.urllc_timestamp = time.time()
-    if len(packet) > 1500:
-        print(colored(f"URLLC packet too large! Size: {len(packet)}B", color="red", attrs=["bold"]))
+    try:
+        subprocess.run(["tc", "qdisc", "del", "dev", interface, "root"], stderr=subprocess.DEVNULL, check=True)
+    except subprocess.CalledProcessError as e:
+        # log('yellow', f"Skipping qdisc delete on {interface}")
+        pass
+    for name in slices:
+        log('yellow', f"Configuring slice {name}...")
+    for cmd in plan:
+        run_tc_command(cmd)
+    return slices
@@ -1,46 +1,154 @@
 import platform
 import random
+import socket
+import threading
 import time
 import traceback
+from typing import Dict, Optional
 
 from prettytable import PrettyTable
-from scapy.all import sniff
-from scapy.fields import ShortField
-from scapy.layers.inet import IP, TCP, UDP
-from scapy.packet import Packet
 # from scapy.all import sniff, IP, TCP, UDP, ICMP, Ether
 from termcolor import colored
 
+from core.packet_filter import KernelFilterStats
 from core.parser import Args
 from utils.helpers import log
 from utils.metrics import PacketMetrics
+from utils.profiling import TIMERS
+
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+# Backpressure: an interval losing more than DROP_RATIO of the accepted packets counts as congested
+DROP_RATIO = 0.01
+MAX_RCVBUF = 64 * 1024 * 1024
+MAX_DISPLAY_EVERY = 1024
 
 
 class Sniffer:
-    def __init__(self, args, scanner, classifier):
+    def __init__(self, args, scanner, classifier, fanout: Optional[int] = None):
+        """:param fanout: PACKET_FANOUT group the capture socket joins (core.workers)"""
         self.args: Args = args
         self.interface = scanner.interface
         self.filters = scanner.filters
         self.classifier = classifier
         self.platform = platform.system()
+        self.fanout = fanout
         self.socket = None
+        self.filter_stats: Optional[KernelFilterStats] = None
         self.metrics = PacketMetrics()
+        # Latest capture socket counters (read by the monitor thread) and display sampling rate
+        self.capture: Dict[str, Optional[int]] = {}
+        self.display_every = 1
+        self._monitor_stop = threading.Event()
 
     def start_sniffing(self):
         log('cyan', "Sniffing starts in 1 seconds on Linux... Press Ctrl+C to stop.")
         time.sleep(1)
-        sniff(prn=self.process_packet, store=0, iface=self.interface, filter=self.filters)
+        # Only the dissectors the slicer inspects are loaded, not the whole of scapy.all
+        import scapy.layers.inet  # noqa: F401
+        import scapy.layers.inet6  # noqa: F401
+        from scapy.sendrecv import sniff
+        if self.platform != "Linux":
+            sniff(prn=self.process_packet, store=0, iface=self.interface, filter=self.filters)
+            return
+        # Open the capture socket ourselves so the kernel filter counters can be read
+        from scapy.config import conf
+        import scapy.arch  # noqa: F401 (sets conf.L2listen for this platform)
+        self.socket = conf.L2listen(iface=self.interface, filter=self.filters)
+        if self.fanout is not None:
+            from core.workers import join_fanout
+            join_fanout(self.socket.ins, self.fanout)
+        # sniff() calls recv() once the socket is readable: it times the recvfrom and Scapy dissection
+        self.socket.recv = TIMERS.timed("capture.recv_dissect")(self.socket.recv)
+        # Fanout members only get their share of the interface traffic: no filtered estimate for them
+        self.filter_stats = KernelFilterStats(self.socket.ins, self.interface if self.fanout is None else None)
+        monitor = threading.Thread(target=self.monitor_capture, daemon=True)
+        monitor.start()
+        try:
+            sniff(prn=self.process_packet, store=0, opened_socket=self.socket)
+        finally:
+            self._monitor_stop.set()
+            monitor.join()
+            log('cyan', self.filter_stats.summary())
+            if self.capture.get("freezes"):
+                log('yellow', f"Capture ring froze {self.capture['freezes']} times")
+
+    # === Capture backpressure ==================================================
+
+    def monitor_capture(self):
+        """
+        Read the socket counters every capture_stats_interval seconds. PACKET_STATISTICS is
+        reset on read, so this thread is its only reader; everything else uses self.capture.
+        """
+        interval = getattr(self.args, "capture_stats_interval", 1.0)
+        previous = self.filter_stats.read()
+        self.capture = previous
+        clean = 0
+        while not self._monitor_stop.wait(interval):
+            current = self.filter_stats.read()
+            self.capture = current
+            accepted = current["accepted"] - previous["accepted"]
+            drops = current["queue_drops"] - previous["queue_drops"]
+            previous = current
+            if not drops:
+                clean += 1
+                # Drops gone for a while: give back one step of display sampling
+                if clean >= 10 and self.display_every > 1:
+                    self.display_every //= 2
+                    clean = 0
+                continue
+            clean = 0
+            log('red', f"Kernel dropped {drops} of {accepted} packets in the last {interval:g}s")
+            if getattr(self.args, "adapt_capture", False) and drops > DROP_RATIO * max(accepted, 1):
+                self.relieve_backpressure()
+
+    def relieve_backpressure(self):
+        """Grow the socket buffer first; once it is at MAX_RCVBUF, display fewer packets."""
+        sock = self.socket.ins
+        size = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if size < MAX_RCVBUF:
+            # getsockopt reports twice the requested size, so requesting it doubles the buffer
+            target = min(size, MAX_RCVBUF)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, target)  # CAP_NET_ADMIN: above rmem_max
+            except OSError:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, target)
+            grown = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            if grown > size:
+                log('yellow', f"Capture socket buffer grown {size // 1024} KB -> {grown // 1024} KB")
+                return
+        if (self.args.display_packets or self.args.display_metrics) and self.display_every < MAX_DISPLAY_EVERY:
+            self.display_every *= 4
+            log('yellow', f"Display sampled: 1 packet out of {self.display_every}")
 
     def process_packet(self, packet):
         try:
+            timed = TIMERS.enabled  # no clock reads per packet unless profiling
+            start = time.perf_counter_ns() if timed else 0
             self.metrics.update(packet_size=len(packet))
-            packet = self.add_slice_info(packet)
-            if self.args.display_metrics:
+            if getattr(self.args, "keep_dscp", False):
+                packet = packet if packet.haslayer("IP") or packet.haslayer("IPv6") else None
+            else:
+                packet = self.add_slice_info(packet)
+            if packet is None:
+                return  # not IP: nothing to slice
+            if timed:
+                stop = time.perf_counter_ns()
+                TIMERS.add("sniffer.prepare", stop - start)
+            display = self.display_every == 1 or self.metrics.packet_count % self.display_every == 0
+            if self.args.display_metrics and display:
                 self.display_metrics()
-            if self.args.display_packets:
+                if timed:
+                    start, stop = stop, time.perf_counter_ns()
+                    TIMERS.add("display.metrics", stop - start)
+            if self.args.display_packets and display:
                 self.display_packet(packet)
+                if timed:
+                    start, stop = stop, time.perf_counter_ns()
+                    TIMERS.add("display.packet", stop - start)
             if self.classifier:
                 self.classifier.classify_packet(packet)
+                if timed:
+                    TIMERS.add("classifier.total", time.perf_counter_ns() - stop)
         except KeyboardInterrupt:
             log("cyan", "Sniffing interrupted by Ctrl+C")
         except Exception as e:
@@ -51,15 +159,20 @@ class Sniffer:
     def add_slice_info(cls, packet):
         """Change the value of TOS of the IP packet"""
         # packet_with_slice_id = packet / SliceLayer(SID=slice_id)
-        if IP not in packet:
-            return None
+        # Layers are looked up by name so the sniffer does not import Scapy's layers itself
         tos = random.randint(1, 4)
-        packet[IP].tos = tos
-        del packet[IP].chksum
-        if TCP in packet:
-            del packet[TCP].chksum
-        elif UDP in packet:
-            del packet[UDP].chksum
+        if packet.haslayer("IP"):
+            packet["IP"].tos = tos
+            del packet["IP"].chksum
+        elif packet.haslayer("IPv6"):
+            # IPv6 has no header checksum: only the transport checksum below is refreshed
+            packet["IPv6"].tc = tos
+        else:
+            return None
+        if packet.haslayer("TCP"):
+            del packet["TCP"].chksum
+        elif packet.haslayer("UDP"):
+            del packet["UDP"].chksum
 
         return packet
 
@@ -69,10 +182,10 @@ class Sniffer:
         Only layers whose protocol name is mentioned in self.filters are displayed.
         If self.filters is empty, all layers are shown.
         """
-        if self.filters and self.filters.strip():
-            requested = {token.strip().lower() for token in self.filters.split("or")}
-            requested.add('ether')
-            requested.add('slice')
+        # Only plain protocol lists ("ip or tcp") restrict the layers; compiled expressions show all
+        tokens = {token.strip().lower() for token in (self.filters or "").split(" or ")}
+        if tokens and all(token.isalnum() for token in tokens):
+            requested = tokens | {'ether', 'slice'}
         else:
             requested = None  # means show all layers
 
@@ -157,10 +270,15 @@ class Sniffer:
         if data > 1024:
             unit = "MB"
             data /= 1024
+        kernel = ""
+        if self.capture:
+            kernel = f" | Kernel drops: {self.capture['queue_drops']}"
+            if self.display_every > 1:
+                kernel += f" | Display 1/{self.display_every}"
         print(
             colored(
                 f"Packets/s: {pps} | Throughput: {throughput} KB/s | Total Packets: {count} | "
-                f"Total data: {round(data, 2)} {unit}",
+                f"Total data: {round(data, 2)} {unit}{kernel}",
                 "magenta",
                 attrs=["bold"],
             )
@@ -0,0 +1,112 @@
+"""
+Torch batch engine for the GPU slice path (engine = "gpu").
+
+The engine keeps its tensors between batches, sized to the largest batch seen so far:
+    staging   (max_batch, 20) uint8, pinned when the device is CUDA
+    headers   (max_batch, 20) uint8 on the device
+    words     (max_batch, 10) int32 on the device, the 16-bit words of the checksum
+A batch is gathered from the PacketBatch buffer into the staging rows with one NumPy take.
+It then crosses to the device in one copy, is remarked and re-checksummed there, and
+comes back in one copy. Nothing is read back per packet. The device is CUDA when torch
+sees one and CPU otherwise; on CPU the staging rows are the device tensor, so both copies
+disappear and the same code runs (and can be tested) on hosts without a GPU.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+from utils.helpers import log
+
+HEADER_LEN = 20  # option-less IPv4 header
+_COLUMNS = np.arange(HEADER_LEN)
+
+
+def select_device(preferred: Optional[str] = None) -> str:
+    """
+    :param preferred: "cpu" or "cuda" (default: $NETSLICER_DEVICE, else CUDA when available)
+    """
+    import torch
+    preferred = preferred or os.environ.get("NETSLICER_DEVICE")
+    if preferred:
+        if preferred.startswith("cuda") and not torch.cuda.is_available():
+            log('yellow', f"{preferred} requested but CUDA is not available: using the CPU")
+            return "cpu"
+        return preferred
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class TensorEngine:
+    def __init__(self, max_batch: int = 1024, device: Optional[str] = None):
+        """
+        :param max_batch: rows allocated up front (grown by doubling when a larger batch comes)
+        :param device: torch device (default: select_device())
+        """
+        import torch
+        self.torch = torch
+        self.device = torch.device(device or select_device())
+        self.max_batch = 0
+        self._allocate(max(max_batch, 1))
+        log('blue', f"Tensor engine on {self.device} ({self.max_batch} rows)")
+
+    def _allocate(self, rows: int):
+        torch = self.torch
+        on_cuda = self.device.type == "cuda"
+        self.max_batch = rows
+        self._staging = torch.empty((rows, HEADER_LEN), dtype=torch.uint8, pin_memory=on_cuda)
+        self._staging_np = self._staging.numpy()
+        self._headers = torch.empty((rows, HEADER_LEN), dtype=torch.uint8, device=self.device) if on_cuda \
+            else self._staging
+        self._words = torch.empty((rows, HEADER_LEN // 2), dtype=torch.int32, device=self.device)
+        self._sums = torch.empty(rows, dtype=torch.int32, device=self.device)
+
+    def mark_ipv4(self, buffer: np.ndarray, starts: np.ndarray, dscp: int) -> None:
+        """
+        Rewrite the DSCP (keeping ECN) and the header checksum of option-less IPv4 headers in place.
+        :param buffer: PacketBatch.buffer
+        :param starts: buffer offset of every IPv4 header
+        """
+        torch = self.torch
+        n = len(starts)
+        if not n:
+            return
+        if n > self.max_batch:
+            self._allocate(max(n, 2 * self.max_batch))
+        positions = starts[:, None] + _COLUMNS
+        staging = self._staging_np[:n]
+        np.take(buffer, positions, out=staging)
+        headers = self._headers[:n]
+        if headers.data_ptr() != self._staging.data_ptr():
+            headers.copy_(self._staging[:n], non_blocking=True)  # one host-to-device copy
+        # ── DSCP in the upper 6 bits of the TOS byte, checksum field zeroed ──────────
+        headers[:, 1] = (headers[:, 1] & 0x03) | ((dscp & 0x3F) << 2)
+        headers[:, 10:12] = 0
+        # ── Ones' complement sum of the ten 16-bit words ─────────────────────────────
+        words = self._words[:n]
+        words.copy_(headers[:, 0::2])
+        words.mul_(256).add_(headers[:, 1::2])
+        sums = torch.sum(words, dim=1, dtype=torch.int32, out=self._sums[:n])
+        for _ in range(2):
+            sums.copy_((sums & 0xFFFF) + (sums >> 16))
+        checksum = ~sums & 0xFFFF
+        headers[:, 10] = checksum >> 8
+        headers[:, 11] = checksum & 0xFF
+        if headers.data_ptr() != self._staging.data_ptr():
+            self._staging[:n].copy_(headers)  # one device-to-host copy (synchronizes the stream)
+        buffer[positions] = staging
+
+
+_ENGINE: Optional[TensorEngine] = None
+_UNAVAILABLE = False
+
+
+def get_engine(max_batch: int = 1024) -> Optional[TensorEngine]:
+    """Process-wide engine, created on first use; None when torch is not installed."""
+    global _ENGINE, _UNAVAILABLE
+    if _ENGINE is None and not _UNAVAILABLE:
+        try:
+            _ENGINE = TensorEngine(max_batch)
+        except ImportError:
+            _UNAVAILABLE = True
+            log('yellow', "torch is not installed: GPU slices mark on the CPU with NumPy")
+    return _ENGINE
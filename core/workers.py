@@ -0,0 +1,167 @@
+"""
+Capture sharded across worker processes by flow hash.
+
+A single Sniffer runs capture, dissection, classification and forwarding on one core under
+one GIL. CaptureWorkers starts N processes whose capture sockets join the same
+PACKET_FANOUT_HASH group: the kernel hashes the flow of every packet (addresses, ports) and
+always delivers a flow to the same worker, so per-flow state (policers, samplers, packet
+order) stays in one process and needs no lock. Each worker builds its own classifier and
+slices. Their per-slice counters live in one shared-memory array, one row per worker, that
+only that worker writes; the parent sums the rows for its display and the exporter.
+
+    python main.py --workers 4
+"""
+import os
+import signal
+import socket
+import struct
+import time
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+import numpy as np
+
+import config
+from utils.exporter import METRICS, SLICE_COLUMNS
+from utils.helpers import log
+
+SOL_PACKET = 263
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+# Reassemble IP fragments before hashing, so every fragment of a flow reaches the same worker
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+
+
+def join_fanout(sock: socket.socket, group: int, mode: int = PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG):
+    """Add an AF_PACKET socket to fanout group `group` (0-65535)."""
+    # Packed as unsigned: the defrag flag sets the sign bit of the C int
+    sock.setsockopt(SOL_PACKET, PACKET_FANOUT, struct.pack("I", (group & 0xFFFF) | (mode << 16)))
+
+
+def _terminate(*_):
+    # SystemExit, unlike KeyboardInterrupt, is not swallowed by Sniffer.process_packet
+    raise SystemExit(0)
+
+
+def _worker(index: int, group: int, shm_name: str, shape, interface: str, filters: Optional[str], specs, args,
+            batch_size: int, time_limit: float):
+    """Entry point of one capture worker process."""
+    from core.classifier import PacketClassifier
+    from core.scanner import Scanner
+    from core.slices_setup import build_slices
+    from core.sniffer import Sniffer
+
+    args.display_metrics = False  # the parent prints the merged counters
+    config.args = args
+    # Ctrl+C reaches the whole process group; CaptureWorkers.stop() sends SIGTERM
+    signal.signal(signal.SIGTERM, _terminate)
+    shm = SharedMemory(name=shm_name)
+    classifier = None
+    try:
+        counters = np.ndarray(shape, dtype=np.int64, buffer=shm.buf)
+        slices = build_slices(interface, specs)  # the parent already installed the tc plan
+        classifier = PacketClassifier(slices=slices, args=args, batch_size=batch_size, time_limit=time_limit)
+        METRICS.register_slices(classifier.slice_names, counters=counters[index])
+        scanner = Scanner()
+        scanner.interface = interface
+        scanner.filters = filters
+        Sniffer(args=args, scanner=scanner, classifier=classifier, fanout=group).start_sniffing()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if classifier is not None:
+            classifier.close()
+        METRICS.register_slices([])  # drop the views into the shared block before closing it
+        counters = None
+        shm.close()
+
+
+class CaptureWorkers:
+    def __init__(self, count: int, interface: str, filters: Optional[str], specs: List, args,
+                 batch_size: int = 1, time_limit: float = 0.0, group: Optional[int] = None):
+        """
+        :param count: number of worker processes
+        :param specs: slice definitions (SliceSpec), rebuilt in every worker
+        :param group: fanout group id (default: derived from the parent pid)
+        """
+        if count < 1:
+            raise ValueError(f"count must be >= 1 (got {count})")
+        self.count = count
+        self.interface = interface
+        self.filters = filters
+        self.specs = specs
+        self.args = args
+        self.batch_size = batch_size
+        self.time_limit = time_limit
+        self.group = os.getpid() & 0xFFFF if group is None else group
+        self.slice_names = [spec.name for spec in specs]
+        self.shape = (count, len(specs), len(SLICE_COLUMNS))
+        self._shm: Optional[SharedMemory] = None
+        self.counters: Optional[np.ndarray] = None
+        self.processes = []
+
+    def start(self):
+        self._shm = SharedMemory(create=True, size=max(int(np.prod(self.shape)) * 8, 1))
+        self.counters = np.ndarray(self.shape, dtype=np.int64, buffer=self._shm.buf)
+        self.counters[:] = 0
+        METRICS.merge_shards(self.slice_names, self.counters)
+        # spawn: workers start from a clean interpreter, not from a copy of the parent's threads
+        context = get_context("spawn")
+        for index in range(self.count):
+            process = context.Process(
+                target=_worker, name=f"capture-{index}", daemon=True,
+                args=(index, self.group, self._shm.name, self.shape, self.interface, self.filters, self.specs,
+                      self.args, self.batch_size, self.time_limit))
+            process.start()
+            self.processes.append(process)
+        log('cyan', f"{self.count} capture workers in fanout group {self.group} on {self.interface}")
+
+    def merged(self) -> np.ndarray:
+        """(slices, columns) sum of the worker counters."""
+        return self.counters.sum(axis=0)
+
+    def per_worker_packets(self) -> List[int]:
+        return [int(row[:, 0].sum()) for row in self.counters]
+
+    def report(self) -> str:
+        totals = self.merged()
+        lines = [f"{'slice':<10} {'packets':>10} {'bytes':>12} {'drops':>8}"]
+        for name, (packets, size, drops) in zip(self.slice_names, totals):
+            lines.append(f"{name:<10} {packets:>10} {size:>12} {drops:>8}")
+        lines.append(f"per worker: {self.per_worker_packets()}")
+        return "\n".join(lines)
+
+    def serve(self, interval: float = 2.0):
+        """Start the workers and print the merged counters until they exit (Ctrl+C)."""
+        self.start()
+        try:
+            previous, last = 0, time.time()
+            while any(process.is_alive() for process in self.processes):
+                time.sleep(interval)
+                packets = int(self.merged()[:, 0].sum())
+                now = time.time()
+                if self.args.display_metrics:
+                    log('magenta', f"Packets/s: {(packets - previous) / (now - last):.1f} | Total: {packets} | "
+                                   f"per worker: {self.per_worker_packets()}")
+                previous, last = packets, now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            print(self.report())
+
+    def stop(self, timeout: float = 5.0):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+        self.processes = []
+        if self._shm is not None:
+            # Keep the final counters for report() once the block is gone
+            self.counters = self.counters.copy()
+            METRICS.merge_shards(self.slice_names, self.counters)
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -1,12 +1,24 @@
+import asyncio
+import sys
+
 import config
+from core.async_runtime import AsyncSlicer
 from core.classifier import PacketClassifier
+from core.frame_ring import RingSplit
+from core.offload import TcOffload
+from core.packet_filter import FilterError, build_filter, check_filter
 from core.parser import parse_args
+from core.prober import SliceProber
 from termcolor import cprint
 from core.scanner import Scanner
+from core.slice_config import ConfigError, load_config
 from core.slices_setup import setup_slices
 from core.sniffer import Sniffer
+from core.workers import CaptureWorkers
 from utils import log
+from utils.exporter import MetricsExporter
 from utils.helpers import reset_environment, setup_environment
+from utils.profiling import TIMERS, ProfileWindow
 
 """
 TOS: the differentiated services
@@ -33,22 +45,103 @@ def net_slicer():
     assert config.args is not None
     config.args.display_metrics = True
     config.args.display_packets = True
+    try:
+        slicer_config = load_config(config.args.config or config.DEFAULT_CONFIG)
+    except ConfigError as e:
+        log("red", str(e))
+        sys.exit(1)
+    config.args.gpu = config.args.gpu and slicer_config.engine == "gpu"
     # === Environment setup =====================
     setup_environment(config.args)
     # === Scan for network interfaces ===========
     scanner = Scanner()
-    # scanner.interface = "eth0"
-    # scanner.filters = "ip or tcp or udp or icmp"
-    scanner.select_interface()
-    scanner.packet_filter()  # Berkeley Packet Filter
+    scanner.interface = config.args.interface or slicer_config.interface
+    scanner.filters = slicer_config.filter
+    # Interactive prompts only for what the configuration leaves open
+    if not scanner.interface:
+        scanner.select_interface()
+    if slicer_config.engine == "offload":
+        # The kernel classifies and marks: Python only loads the program and reads the counters
+        setup_slices(scanner.interface, slicer_config.slices)
+        TcOffload(scanner.interface, slicer_config.slices).serve()
+        reset_environment()
+        return
+    if scanner.filters == "auto":
+        scanner.filters = build_filter(slicer_config.slices)
+    if not scanner.filters:
+        scanner.packet_filter()  # Berkeley Packet Filter
+    try:
+        log("green", f"Capture filter compiles to {check_filter(scanner.filters, scanner.interface)} BPF instructions")
+    except FilterError as e:
+        log("red", str(e))
+        sys.exit(1)
+    except ImportError as e:
+        log("yellow", f"Capture filter not checked: {e}")
+    if config.args.runtime == "asyncio":
+        # Capture, batch deadlines, tc and the metrics/control server share one event loop
+        runtime = AsyncSlicer(scanner.interface, scanner.filters, slicer_config, config.args,
+                              metrics_port=config.args.metrics_port)
+        asyncio.run(runtime.run())
+        reset_environment()
+        return
     # === Network Slices =========================
-    ns_urllc, ns_embb, ns_mmtc = setup_slices(scanner.interface)
-    slices = {"urllc": ns_urllc, "embb": ns_embb, "mmtc": ns_mmtc}
+    slices = setup_slices(scanner.interface, slicer_config.slices)
+    if config.args.workers > 1 and config.IS_LINUX:
+        # Each worker process captures its share of the flows with its own classifier and slices
+        workers = CaptureWorkers(config.args.workers, scanner.interface, scanner.filters, slicer_config.slices,
+                                 config.args, batch_size=slicer_config.batch_size,
+                                 time_limit=slicer_config.time_limit)
+        exporter = None
+        if config.args.metrics_port:
+            exporter = MetricsExporter(config.args.metrics_port, slices=slices, interface=scanner.interface)
+            exporter.start()
+        workers.serve()
+        if exporter:
+            exporter.stop()
+        reset_environment()
+        return
     # === Classifier Sniffer =====================
-    classifier = PacketClassifier(slices=slices, args=config.args)
+    split = None
+    if config.args.split:
+        # Classification and forwarding run in their own process, fed through a shared-memory ring
+        split = RingSplit(scanner.interface, slicer_config.slices, config.args, batch_size=slicer_config.batch_size,
+                          time_limit=slicer_config.time_limit)
+        split.start()
+        classifier = split.writer
+    else:
+        classifier = PacketClassifier(slices=slices, args=config.args, batch_size=slicer_config.batch_size,
+                                      time_limit=slicer_config.time_limit)
+    # === Active slice prober ====================
+    prober = None
+    if config.args.probe_target:
+        prober = SliceProber.from_slices(slices, config.args.probe_target, port=config.args.probe_port)
+        prober.start()
+    # === Profiling hooks =======================
+    profiler = ProfileWindow(config.args.profile or "sample", config.args.profile_seconds)
+    profiler.install_signals()
+    if config.args.profile:
+        TIMERS.enabled = True
+        profiler.start()
     # === Packet Sniffer ========================
     sniffer = Sniffer(args=config.args, scanner=scanner, classifier=classifier)
+    # === Metrics exporter ======================
+    exporter = None
+    if config.args.metrics_port:
+        exporter = MetricsExporter(config.args.metrics_port, slices=slices, interface=scanner.interface,
+                                   capture_stats=lambda: sniffer.capture)
+        exporter.start()
     sniffer.start_sniffing()
+    if split:
+        split.stop()
+    else:
+        classifier.close()
+    if exporter:
+        exporter.stop()
+    if prober:
+        prober.stop()
+    profiler.stop()
+    if TIMERS.enabled:
+        print(TIMERS.report())
     # === Plot results ==========================
     # === Reset Environment =====================
     reset_environment()
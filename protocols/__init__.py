@@ -0,0 +1 @@
+from .frame import FrameOffsets, parse_frame
@@ -0,0 +1,130 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from protocols.ethernet import ETH_HEADER_LEN
+from protocols.frame import (ETH_P_8021AD, ETH_P_8021Q, ETH_P_IP, ETH_P_IPV6, IPPROTO_TCP, IPPROTO_UDP,
+                             IPV6_EXT_HEADERS, IPV6_FRAGMENT, MAX_IPV6_EXT_HEADERS, VLAN_TAG_LEN)
+
+
+class HeaderColumns(NamedTuple):
+    """Decoded headers of N frames; fields of frames that are not IP are 0 (l3 = -1)."""
+    ethertype: np.ndarray  # uint16, inner EtherType after VLAN tags
+    vlan: np.ndarray  # uint16, outer VLAN ID (0 = untagged)
+    l3: np.ndarray  # int32, IP header offset in the frame (-1 = not IP)
+    ihl: np.ndarray  # uint8, IPv4 header length in 32-bit words (0 for IPv6)
+    tos: np.ndarray  # uint8, IPv4 TOS / IPv6 traffic class
+    total_length: np.ndarray  # uint16, IPv4 total length / IPv6 header + payload length
+    proto: np.ndarray  # uint8, transport protocol (IPv6: after extension headers)
+    src: np.ndarray  # uint32 (IPv6: XOR-fold of the 128-bit address)
+    dst: np.ndarray  # uint32 (IPv6: XOR-fold of the 128-bit address)
+    sport: np.ndarray  # uint16 (0 when there is no TCP/UDP header)
+    dport: np.ndarray  # uint16
+    ipv4: np.ndarray  # bool mask
+    ipv6: np.ndarray  # bool mask
+
+
+def _u8(buf, positions, valid):
+    # Positions of masked-out frames may point past the buffer: clamp them, the mask hides them
+    return np.where(valid, buf[np.minimum(positions, len(buf) - 1)], 0).astype(np.uint32)
+
+
+def _u16(buf, positions, valid):
+    return (_u8(buf, positions, valid) << 8) | _u8(buf, positions + 1, valid)
+
+
+def _u32(buf, positions, valid):
+    return (_u16(buf, positions, valid) << 16) | _u16(buf, positions + 2, valid)
+
+
+def _fold128(buf, positions, valid):
+    return (_u32(buf, positions, valid) ^ _u32(buf, positions + 4, valid) ^
+            _u32(buf, positions + 8, valid) ^ _u32(buf, positions + 12, valid))
+
+
+def decode_headers(buffer, offsets, lengths) -> HeaderColumns:
+    """
+    Decode the L2-L4 headers of a block of Ethernet frames with NumPy fancy indexing.
+    :param buffer: contiguous frame bytes (np.uint8 array, bytes, bytearray or memoryview)
+    :param offsets: start of every frame in buffer
+    :param lengths: length of every frame
+    Handles up to two stacked 802.1Q / 802.1ad tags, IPv4 and IPv6 (with up to
+    MAX_IPV6_EXT_HEADERS extension headers, as parse_frame) and masks every other frame,
+    IPv4 headers with an IHL below 5 included.
+    """
+    buf = buffer if isinstance(buffer, np.ndarray) else np.frombuffer(buffer, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(offsets)
+    if n == 0 or len(buf) == 0:
+        u16, u32 = np.zeros(n, dtype=np.uint16), np.zeros(n, dtype=np.uint32)
+        u8, none = np.zeros(n, dtype=np.uint8), np.zeros(n, dtype=bool)
+        return HeaderColumns(u16, u16, np.full(n, -1, dtype=np.int32), u8, u8, u16, u8, u32, u32, u16, u16,
+                             none, none)
+
+    # ── L2: EtherType and VLAN tags ───────────────────────────────────────────────
+    valid = lengths >= ETH_HEADER_LEN
+    l3 = np.full(n, ETH_HEADER_LEN, dtype=np.int64)
+    ethertype = _u16(buf, offsets + 12, valid)
+    vlan = np.zeros(n, dtype=np.uint32)
+    for depth in range(2):
+        tagged = valid & ((ethertype == ETH_P_8021Q) | (ethertype == ETH_P_8021AD))
+        tagged &= lengths >= l3 + VLAN_TAG_LEN
+        if depth == 0:
+            vlan = np.where(tagged, _u16(buf, offsets + l3, tagged) & 0x0FFF, 0)
+        ethertype = np.where(tagged, _u16(buf, offsets + l3 + 2, tagged), ethertype)
+        l3 += tagged * VLAN_TAG_LEN
+    ip = offsets + l3
+
+    # ── L3: IPv4 header ───────────────────────────────────────────────────────────
+    ipv4 = valid & (ethertype == ETH_P_IP) & (lengths >= l3 + 20)
+    version_ihl = _u8(buf, ip, ipv4)
+    ipv4 &= ((version_ihl >> 4) == 4) & ((version_ihl & 0x0F) >= 5)
+    ihl = np.where(ipv4, version_ihl & 0x0F, 0)
+    first_fragment = (_u16(buf, ip + 6, ipv4) & 0x1FFF) == 0
+
+    # ── L3: IPv6 header (traffic class straddles bytes 0 and 1) ────────────────────
+    ipv6 = valid & (ethertype == ETH_P_IPV6) & (lengths >= l3 + 40)
+    ipv6 &= (_u8(buf, ip, ipv6) >> 4) == 6
+    next_header = _u8(buf, ip + 6, ipv6)
+    l4 = np.where(ipv6, l3 + 40, l3 + ihl * 4)
+    for _ in range(MAX_IPV6_EXT_HEADERS):
+        ext = ipv6 & np.isin(next_header, IPV6_EXT_HEADERS) & (lengths >= l4 + 2)
+        if not ext.any():
+            break
+        ext_len = (_u8(buf, offsets + l4 + 1, ext).astype(np.int64) + 1) * 8
+        next_header = np.where(ext, _u8(buf, offsets + l4, ext), next_header)
+        l4 += ext * ext_len
+    fragment = ipv6 & (next_header == IPV6_FRAGMENT) & (lengths >= l4 + 8)
+    first_fragment &= ~fragment | ((_u16(buf, offsets + l4 + 2, fragment) & 0xFFF8) == 0)
+    next_header = np.where(fragment, _u8(buf, offsets + l4, fragment), next_header)
+    l4 += fragment * 8
+
+    is_ip = ipv4 | ipv6
+    tos = np.where(ipv4, _u8(buf, ip + 1, ipv4), (_u16(buf, ip, ipv6) >> 4) & 0xFF)
+    total_length = np.where(ipv4, _u16(buf, ip + 2, ipv4), _u16(buf, ip + 4, ipv6) + 40 * ipv6)
+    proto = np.where(ipv4, _u8(buf, ip + 9, ipv4), next_header)
+    src = np.where(ipv4, _u32(buf, ip + 12, ipv4), _fold128(buf, ip + 8, ipv6))
+    dst = np.where(ipv4, _u32(buf, ip + 16, ipv4), _fold128(buf, ip + 24, ipv6))
+
+    # ── L4: ports of unfragmented (or first fragment) TCP/UDP ─────────────────────
+    has_ports = is_ip & ((proto == IPPROTO_TCP) | (proto == IPPROTO_UDP)) & first_fragment
+    has_ports &= lengths >= l4 + 4
+    sport = _u16(buf, offsets + l4, has_ports)
+    dport = _u16(buf, offsets + l4 + 2, has_ports)
+
+    return HeaderColumns(
+        ethertype=ethertype.astype(np.uint16),
+        vlan=vlan.astype(np.uint16),
+        l3=np.where(is_ip, l3, -1).astype(np.int32),
+        ihl=ihl.astype(np.uint8),
+        tos=tos.astype(np.uint8),
+        total_length=total_length.astype(np.uint16),
+        proto=proto.astype(np.uint8),
+        src=src.astype(np.uint32),
+        dst=dst.astype(np.uint32),
+        sport=sport.astype(np.uint16),
+        dport=dport.astype(np.uint16),
+        ipv4=ipv4,
+        ipv6=ipv6,
+    )
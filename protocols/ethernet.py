@@ -1,12 +1,28 @@
-
-import socket
 import struct
+
 from utils.helpers import get_mac_addr
 
+ETH_HEADER_LEN = 14
+# EtherType is already in network order on the wire: read it big-endian, no htons
+ETHERTYPE = struct.Struct('! H')
+
+
 class Ethernet:
+    __slots__ = ('raw', 'proto', 'header_length')
+
     def __init__(self, raw_data):
-        dest, src, prototype = struct.unpack('! 6s 6s H', raw_data[:14])
-        self.dest_mac = get_mac_addr(dest)
-        self.src_mac = get_mac_addr(src)
-        self.proto = socket.htons(prototype)
-        self.data = raw_data[14:]
+        self.raw = memoryview(raw_data)
+        self.proto, = ETHERTYPE.unpack_from(self.raw, 12)
+        self.header_length = ETH_HEADER_LEN
+
+    @property
+    def dest_mac(self):
+        return get_mac_addr(self.raw[0:6])
+
+    @property
+    def src_mac(self):
+        return get_mac_addr(self.raw[6:12])
+
+    @property
+    def data(self):
+        return self.raw[self.header_length:]
@@ -0,0 +1,91 @@
+import struct
+from typing import NamedTuple
+
+from protocols.ethernet import ETH_HEADER_LEN, ETHERTYPE
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+VLAN_TAG_LEN = 4
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+# IPv6 extension headers skipped to reach the transport header
+IPV6_EXT_HEADERS = (0, 43, 60)  # hop-by-hop, routing, destination options
+IPV6_FRAGMENT = 44
+# Extension headers walked per frame before giving up on finding the transport header (the
+# frame then reports the extension header as its protocol); shared with protocols.batch
+MAX_IPV6_EXT_HEADERS = 4
+
+_VERSION_IHL_TOS = struct.Struct('! B B')
+_IPV4_FRAGMENT_PROTO = struct.Struct('! H B B')
+_IPV6_CLASS = struct.Struct('! H')
+_PROTO = struct.Struct('! B')
+_EXT_HEADER = struct.Struct('! B B')
+_TCP_OFFSET = struct.Struct('! B')
+_VLAN_TAG = struct.Struct('! H H')
+_FRAGMENT = struct.Struct('! B B H')
+
+
+class FrameOffsets(NamedTuple):
+    """L2-L4 layout of a frame; offsets are from the start of the frame, -1 when absent."""
+    ethertype: int  # inner EtherType after VLAN tags
+    vlan: int  # outer VLAN ID (0 = untagged)
+    l3: int
+    l4: int
+    payload: int
+    proto: int  # IPv4 protocol / IPv6 next header of the transport layer
+    tos: int  # IPv4 TOS / IPv6 traffic class
+
+
+def parse_frame(raw_data) -> FrameOffsets:
+    """
+    Locate the L2, L3 and L4 headers of an Ethernet frame (802.1Q/802.1ad tagged or not,
+    IPv4 or IPv6) in one pass, without copying the frame or building any address strings.
+    """
+    length = len(raw_data)
+    if length < ETH_HEADER_LEN:
+        return FrameOffsets(-1, 0, -1, -1, -1, -1, -1)
+    ethertype, = ETHERTYPE.unpack_from(raw_data, 12)
+    l3 = ETH_HEADER_LEN
+    vlan = 0
+    while ethertype in (ETH_P_8021Q, ETH_P_8021AD) and length >= l3 + VLAN_TAG_LEN:
+        tci, ethertype = _VLAN_TAG.unpack_from(raw_data, l3)
+        vlan = vlan or tci & 0x0FFF
+        l3 += VLAN_TAG_LEN
+
+    if ethertype == ETH_P_IP and length >= l3 + 20:
+        version_ihl, tos = _VERSION_IHL_TOS.unpack_from(raw_data, l3)
+        if version_ihl & 15 < 5:
+            # Malformed: the header would end inside its own fixed part
+            return FrameOffsets(ethertype, vlan, -1, -1, -1, -1, -1)
+        fragment, _, proto = _IPV4_FRAGMENT_PROTO.unpack_from(raw_data, l3 + 6)
+        l4 = l3 + (version_ihl & 15) * 4
+        if fragment & 0x1FFF:
+            # Non-first fragment: no transport header
+            return FrameOffsets(ethertype, vlan, l3, l4, l4, proto, tos)
+    elif ethertype == ETH_P_IPV6 and length >= l3 + 40:
+        tos = (_IPV6_CLASS.unpack_from(raw_data, l3)[0] >> 4) & 0xFF
+        proto, = _PROTO.unpack_from(raw_data, l3 + 6)
+        l4 = l3 + 40
+        for _ in range(MAX_IPV6_EXT_HEADERS):
+            if proto not in IPV6_EXT_HEADERS or length < l4 + 2:
+                break
+            proto, ext_len = _EXT_HEADER.unpack_from(raw_data, l4)
+            l4 += (ext_len + 1) * 8
+        if proto == IPV6_FRAGMENT and length >= l4 + 8:
+            proto, _, fragment = _FRAGMENT.unpack_from(raw_data, l4)
+            l4 += 8
+            if fragment & 0xFFF8:
+                # Non-first fragment: no transport header
+                return FrameOffsets(ethertype, vlan, l3, l4, l4, proto, tos)
+    else:
+        return FrameOffsets(ethertype, vlan, -1, -1, -1, -1, -1)
+
+    if proto == IPPROTO_TCP and length >= l4 + 20:
+        payload = l4 + (_TCP_OFFSET.unpack_from(raw_data, l4 + 12)[0] >> 4) * 4
+    elif proto == IPPROTO_UDP and length >= l4 + 8:
+        payload = l4 + 8
+    else:
+        payload = l4
+    return FrameOffsets(ethertype, vlan, l3, l4, min(payload, length), proto, tos)
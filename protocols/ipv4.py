@@ -1,17 +1,45 @@
+import socket
 import struct
 
+# version/IHL, TOS, total length, TTL, protocol, source, destination
+IPV4_HEADER = struct.Struct('! B B H 4x B B 2x I I')
+
 
 class IPv4:
+    __slots__ = ('raw', 'version_header_length', 'tos', 'total_length', 'ttl', 'proto', 'src_addr', 'target_addr')
 
     def __init__(self, raw_data):
-        version_header_length = raw_data[0]
-        self.version = version_header_length >> 4
-        self.header_length = (version_header_length & 15) * 4
-        self.ttl, self.proto, src, target = struct.unpack('! 8x B B 2x 4s 4s', raw_data[:20])
-        self.src = self.ipv4(src)
-        self.target = self.ipv4(target)
-        self.data = raw_data[self.header_length:]
+        self.raw = memoryview(raw_data)
+        (self.version_header_length, self.tos, self.total_length, self.ttl, self.proto,
+         self.src_addr, self.target_addr) = IPV4_HEADER.unpack_from(self.raw)
+
+    @property
+    def version(self):
+        return self.version_header_length >> 4
+
+    @property
+    def header_length(self):
+        return (self.version_header_length & 15) * 4
+
+    @property
+    def dscp(self):
+        return self.tos >> 2
+
+    @property
+    def src(self):
+        return self.ipv4(self.src_addr)
+
+    @property
+    def target(self):
+        return self.ipv4(self.target_addr)
+
+    @property
+    def data(self):
+        return self.raw[self.header_length:]
 
     # Returns properly formatted IPv4 address
-    def ipv4(self, addr):
-        return '.'.join(map(str, addr))
+    @staticmethod
+    def ipv4(addr):
+        if isinstance(addr, int):
+            addr = addr.to_bytes(4, 'big')
+        return socket.inet_ntoa(bytes(addr))
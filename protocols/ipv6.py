@@ -0,0 +1,47 @@
+import socket
+import struct
+
+IPV6_HEADER_LEN = 40
+# version/traffic class/flow label, payload length, next header, hop limit
+IPV6_HEADER = struct.Struct('! I H B B')
+
+
+class IPv6:
+    __slots__ = ('raw', 'version_class_label', 'payload_length', 'proto', 'hop_limit')
+
+    def __init__(self, raw_data):
+        self.raw = memoryview(raw_data)
+        (self.version_class_label, self.payload_length, self.proto,
+         self.hop_limit) = IPV6_HEADER.unpack_from(self.raw)
+
+    @property
+    def version(self):
+        return self.version_class_label >> 28
+
+    @property
+    def traffic_class(self):
+        return (self.version_class_label >> 20) & 0xFF
+
+    @property
+    def dscp(self):
+        return self.traffic_class >> 2
+
+    @property
+    def flow_label(self):
+        return self.version_class_label & 0xFFFFF
+
+    @property
+    def header_length(self):
+        return IPV6_HEADER_LEN
+
+    @property
+    def src(self):
+        return socket.inet_ntop(socket.AF_INET6, bytes(self.raw[8:24]))
+
+    @property
+    def target(self):
+        return socket.inet_ntop(socket.AF_INET6, bytes(self.raw[24:40]))
+
+    @property
+    def data(self):
+        return self.raw[IPV6_HEADER_LEN:]
@@ -14,5 +14,15 @@ class Pcap:
         self.pcap_file.write(struct.pack('@ I I I I', ts_sec, ts_usec, length, length))
         self.pcap_file.write(data)
 
+    def write_batch(self, view):
+        """Write every frame of a PacketBatch / BatchView with its capture timestamp"""
+        batch = view.batch if hasattr(view, "batch") else view
+        indices = view.indices if hasattr(view, "indices") else range(len(batch))
+        for i in indices:
+            ts = batch.timestamps[i]
+            length = int(batch.lengths[i])
+            self.pcap_file.write(struct.pack('@ I I I I', int(ts), int((ts % 1) * 1e6), length, length))
+            self.pcap_file.write(batch.frame(i))
+
     def close(self):
         self.pcap_file.close()
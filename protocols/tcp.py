@@ -1,16 +1,45 @@
 import struct
 
+# source port, destination port, sequence, acknowledgment, offset/reserved/flags
+TCP_HEADER = struct.Struct('! H H L L H')
+
 
 class TCP:
+    __slots__ = ('raw', 'src_port', 'dest_port', 'sequence', 'acknowledgment', 'offset_reserved_flags')
 
     def __init__(self, raw_data):
-        (self.src_port, self.dest_port, self.sequence, self.acknowledgment, offset_reserved_flags) = struct.unpack(
-            '! H H L L H', raw_data[:14])
-        offset = (offset_reserved_flags >> 12) * 4
-        self.flag_urg = (offset_reserved_flags & 32) >> 5
-        self.flag_ack = (offset_reserved_flags & 16) >> 4
-        self.flag_psh = (offset_reserved_flags & 8) >> 3
-        self.flag_rst = (offset_reserved_flags & 4) >> 2
-        self.flag_syn = (offset_reserved_flags & 2) >> 1
-        self.flag_fin = offset_reserved_flags & 1
-        self.data = raw_data[offset:]
+        self.raw = memoryview(raw_data)
+        (self.src_port, self.dest_port, self.sequence, self.acknowledgment,
+         self.offset_reserved_flags) = TCP_HEADER.unpack_from(self.raw)
+
+    @property
+    def header_length(self):
+        return (self.offset_reserved_flags >> 12) * 4
+
+    @property
+    def flag_urg(self):
+        return (self.offset_reserved_flags & 32) >> 5
+
+    @property
+    def flag_ack(self):
+        return (self.offset_reserved_flags & 16) >> 4
+
+    @property
+    def flag_psh(self):
+        return (self.offset_reserved_flags & 8) >> 3
+
+    @property
+    def flag_rst(self):
+        return (self.offset_reserved_flags & 4) >> 2
+
+    @property
+    def flag_syn(self):
+        return (self.offset_reserved_flags & 2) >> 1
+
+    @property
+    def flag_fin(self):
+        return self.offset_reserved_flags & 1
+
+    @property
+    def data(self):
+        return self.raw[self.header_length:]
@@ -1,8 +1,17 @@
 import struct
 
+# source port, destination port, length (header + payload)
+UDP_HEADER = struct.Struct('! H H H')
+UDP_HEADER_LEN = 8
+
 
 class UDP:
+    __slots__ = ('raw', 'src_port', 'dest_port', 'size')
 
     def __init__(self, raw_data):
-        self.src_port, self.dest_port, self.size = struct.unpack('! H H 2x H', raw_data[:8])
-        self.data = raw_data[8:]
+        self.raw = memoryview(raw_data)
+        self.src_port, self.dest_port, self.size = UDP_HEADER.unpack_from(self.raw)
+
+    @property
+    def data(self):
+        return self.raw[UDP_HEADER_LEN:]
@@ -0,0 +1,311 @@
+"""
+Prometheus / OpenMetrics exporter.
+
+The data path updates METRICS, a registry of preallocated NumPy counters: once per batch
+the classifier adds the per-slice packets/bytes (one bincount) and the batch size and flush
+latency histograms, the slices add their pipeline drops. These updates take no lock of
+their own: the classifier runs one flush at a time (its flush lock serializes the size and
+timer flushes), so every slot has a single writer per process, and the exporter only copies
+the arrays, so a scrape never contends with packet processing. tc class statistics (drops, queue depth) are read by the exporter
+thread at scrape time; the capture socket counters come from the Sniffer's monitor thread.
+In multi-process modes (--workers, --split) only the slice counters are merged from the
+processes' shared-memory shards; the AQM, policer and fair-queue families are not exported.
+
+    GET http://<host>:<port>/metrics
+"""
+import json
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.helpers import log
+
+HISTOGRAM_BUCKETS = 32  # log2 buckets: bucket i counts values in [2^(i-1), 2^i)
+SLICE_COLUMNS = ("packets", "bytes", "pipeline_drops")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.slice_names: List[str] = []
+        self.slices = np.zeros((0, len(SLICE_COLUMNS)), dtype=np.int64)
+        self.unclassified = np.zeros(2, dtype=np.int64)  # packets, bytes
+        self.batch_size = np.zeros(HISTOGRAM_BUCKETS, dtype=np.int64)
+        self.batch_size_sum = np.zeros(1, dtype=np.int64)
+        self.flush_latency = np.zeros(HISTOGRAM_BUCKETS, dtype=np.int64)  # ns
+        self.flush_latency_sum = np.zeros(1, dtype=np.int64)
+        # Learned flow classifier (core.flow_model): packets decided by the model, left to the DSCP, inferences
+        self.ml = np.zeros(3, dtype=np.int64)
+        self.ml_enabled = False
+        # (workers, slices, columns) counters of capture worker processes, summed by snapshot()
+        self.shards: Optional[np.ndarray] = None
+
+    def register_slices(self, names: List[str], counters: Optional[np.ndarray] = None):
+        """
+        Preallocate one counter row per slice, in classifier slice index order.
+        :param counters: (slices, columns) array to count into instead, e.g. a worker's shared-memory row
+        """
+        self.slice_names = list(names)
+        self.slices = counters if counters is not None else np.zeros((len(names), len(SLICE_COLUMNS)),
+                                                                      dtype=np.int64)
+
+    def merge_shards(self, names: List[str], shards: np.ndarray):
+        """Export the sum of the per-worker counters (core.workers) as the slice counters."""
+        self.slice_names = list(names)
+        self.shards = shards
+
+    def slice_index(self, name: str) -> int:
+        return self.slice_names.index(name) if name in self.slice_names else -1
+
+    # === Data path (one call per batch) ========================================
+
+    def add_batch(self, slice_ids: np.ndarray, lengths: np.ndarray):
+        """:param slice_ids: slice index of every packet of a batch (-1 = unclassified)"""
+        n = len(self.slice_names)
+        classified = slice_ids >= 0
+        self.slices[:, 0] += np.bincount(slice_ids[classified], minlength=n)[:n]
+        self.slices[:, 1] += np.bincount(slice_ids[classified], weights=lengths[classified], minlength=n)[:n].astype(
+            np.int64)
+        other = ~classified
+        self.unclassified[0] += int(other.sum())
+        self.unclassified[1] += int(lengths[other].sum())
+
+    def observe_flush(self, size: int, latency_ns: int):
+        self.batch_size[min(int(size).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.batch_size_sum[0] += size
+        self.flush_latency[min(int(latency_ns).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.flush_latency_sum[0] += latency_ns
+
+    def add_drops(self, index: int, count: int):
+        if index >= 0:
+            self.slices[index, 2] += count
+
+    def enable_ml(self):
+        self.ml_enabled = True
+
+    def add_ml(self, model: int, fallback: int, inferences: int):
+        self.ml[0] += model
+        self.ml[1] += fallback
+        self.ml[2] += inferences
+
+    # === Exporter side ==========================================================
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        return {
+            "slices": self.shards.sum(axis=0) if self.shards is not None else self.slices.copy(),
+            "unclassified": self.unclassified.copy(),
+            "batch_size": self.batch_size.copy(),
+            "batch_size_sum": self.batch_size_sum.copy(),
+            "flush_latency": self.flush_latency.copy(),
+            "flush_latency_sum": self.flush_latency_sum.copy(),
+            "ml": self.ml.copy() if self.ml_enabled else None,
+        }
+
+
+METRICS = MetricsRegistry()
+
+
+CONTENT_TYPES = {
+    False: "text/plain; version=0.0.4; charset=utf-8",
+    True: "application/openmetrics-text; version=1.0.0; charset=utf-8",
+}
+
+
+def tc_class_stats(interface: str) -> Dict[str, Dict[str, int]]:
+    """Statistics of every tc class of an interface, by classid ("1:1", ...)."""
+    try:
+        result = subprocess.run(["tc", "-s", "-j", "class", "show", "dev", interface], capture_output=True,
+                                text=True, timeout=2)
+    except (OSError, subprocess.TimeoutExpired):
+        return {}
+    return parse_tc_class_stats(result.stdout)
+
+
+def parse_tc_class_stats(output: str) -> Dict[str, Dict[str, int]]:
+    """Parse the output of `tc -s -j class show`."""
+    try:
+        classes = json.loads(output or "[]")
+    except ValueError:
+        return {}
+    stats = {}
+    for cls in classes:
+        stats[cls.get("handle", "")] = {
+            "bytes": cls.get("bytes", 0), "packets": cls.get("packets", 0), "drops": cls.get("drops", 0),
+            "overlimits": cls.get("overlimits", 0), "backlog": cls.get("backlog", 0), "qlen": cls.get("qlen", 0),
+        }
+    return stats
+
+
+class MetricsExporter:
+    def __init__(self, port: int = 9108, registry: MetricsRegistry = METRICS, slices=None,
+                 interface: Optional[str] = None, capture_stats: Optional[Callable[[], Optional[dict]]] = None,
+                 address: str = "0.0.0.0"):
+        """
+        :param slices: mapping name -> NetworkSlice (labels and tc classids)
+        :param interface: interface whose tc classes are exported
+        :param capture_stats: callable returning the capture socket counters (Sniffer.capture)
+        """
+        self.port = port
+        self.address = address
+        self.registry = registry
+        self.slices = slices or {}
+        self.interface = interface
+        self.capture_stats = capture_stats
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Serve /metrics from a background HTTP server thread."""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = exporter.render(openmetrics).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPES[openmetrics])
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.address, self.port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        log('blue', f"Metrics exporter listening on :{self.server.server_address[1]}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def render(self, openmetrics: bool = False, tc_stats: Optional[Dict[str, Dict[str, int]]] = None) -> str:
+        """:param tc_stats: tc class statistics already polled by the caller (default: read them now)"""
+        snap = self.registry.snapshot()
+        lines: List[str] = []
+
+        def family(name, kind, help_text, samples):
+            # OpenMetrics names counter families without their _total suffix
+            family_name = name[:-len("_total")] if openmetrics and kind == "counter" else name
+            lines.append(f"# HELP {family_name} {help_text}")
+            lines.append(f"# TYPE {family_name} {kind}")
+            for labels, value in samples:
+                series = name if kind != "histogram" else f"{name}_{labels.pop('_series')}"
+                label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+                lines.append(f"{series}{label_text} {value}")
+
+        def histogram(name, help_text, series, scale):
+            """:param series: (labels, log2 buckets, sum) per labelled histogram"""
+            samples = []
+            for labels, buckets, total in series:
+                cumulative = np.cumsum(buckets)
+                # Bucket i holds integers below 2^i, hence the inclusive bound 2^i - 1
+                samples += [({**labels, "_series": "bucket", "le": f"{((1 << i) - 1) * scale:g}"},
+                             int(cumulative[i])) for i in range(len(buckets) - 1)]
+                samples += [({**labels, "_series": "bucket", "le": "+Inf"}, int(cumulative[-1])),
+                            ({**labels, "_series": "sum"}, f"{total * scale:g}"),
+                            ({**labels, "_series": "count"}, int(cumulative[-1]))]
+            family(name, "histogram", help_text, samples)
+
+        def slice_labels(name):
+            ns = self.slices.get(name)
+            return {"slice": name, "dscp": ns.dscp} if ns is not None else {"slice": name}
+
+        names = self.registry.slice_names
+        rows = snap["slices"]
+        family("netslicer_slice_packets_total", "counter", "Packets classified into the slice",
+               [(slice_labels(n), int(rows[i, 0])) for i, n in enumerate(names)])
+        family("netslicer_slice_bytes_total", "counter", "Bytes classified into the slice",
+               [(slice_labels(n), int(rows[i, 1])) for i, n in enumerate(names)])
+        family("netslicer_slice_pipeline_drops_total", "counter", "Packets dropped by the slice handler pipeline",
+               [(slice_labels(n), int(rows[i, 2])) for i, n in enumerate(names)])
+        family("netslicer_unclassified_packets_total", "counter", "Packets matching no slice",
+               [({}, int(snap["unclassified"][0]))])
+        histogram("netslicer_classifier_batch_size", "Packets per classifier flush",
+                  [({}, snap["batch_size"], int(snap["batch_size_sum"][0]))], scale=1)
+        histogram("netslicer_classifier_flush_seconds", "Seal + dispatch time of a classifier flush",
+                  [({}, snap["flush_latency"], int(snap["flush_latency_sum"][0]))], scale=1e-9)
+        if snap["ml"] is not None:
+            family("netslicer_ml_packets_total", "counter", "Untagged packets by who chose their slice",
+                   [({"decision": "model"}, int(snap["ml"][0])), ({"decision": "dscp_fallback"}, int(snap["ml"][1]))])
+            family("netslicer_ml_inferences_total", "counter", "Flows run through the flow classifier model",
+                   [({}, int(snap["ml"][2]))])
+        # Stage and scheduler families read the slices handed to the exporter. With --workers or
+        # --split those are the parent's idle copies (the processing ones live in other processes),
+        # so the families are left out rather than exported as zeros
+        local = {} if self.registry.shards is not None else self.slices
+        # User-space AQM (codel pipeline stages): sojourn time of the packets it dropped / marked
+        aqm = [(name, stage) for name, ns in local.items() for stage in ns.pipeline.stages
+               if stage.name == "codel"]
+        if aqm:
+            histogram("netslicer_aqm_drop_sojourn_seconds", "Sojourn time of packets dropped by the slice AQM",
+                      [({"slice": name}, stage.drop_sojourn.copy(), stage.sojourn_sum[0] * 1e6)
+                       for name, stage in aqm], scale=1e-6)
+            histogram("netslicer_aqm_mark_sojourn_seconds", "Sojourn time of packets ECN-marked by the slice AQM",
+                      [({"slice": name}, stage.mark_sojourn.copy(), stage.sojourn_sum[1] * 1e6)
+                       for name, stage in aqm], scale=1e-6)
+
+        # Two-rate three-color policers (trtcm pipeline stages): conformance per color
+        meters = [(name, stage) for name, ns in local.items() for stage in ns.pipeline.stages
+                  if stage.name == "trtcm"]
+        if meters:
+            family("netslicer_policer_packets_total", "counter", "Packets metered by the slice policer, by color",
+                   [({"slice": name, "color": color}, int(stage.colors[i, 0]))
+                    for name, stage in meters for i, color in enumerate(stage.COLORS)])
+            family("netslicer_policer_bytes_total", "counter", "Bytes metered by the slice policer, by color",
+                   [({"slice": name, "color": color}, int(stage.colors[i, 1]))
+                    for name, stage in meters for i, color in enumerate(stage.COLORS)])
+
+        # Per-flow DRR (slices with a fair_queue table)
+        fair = [(name, ns.scheduler.scheduler.stats()) for name, ns in local.items()
+                if getattr(ns, "scheduler", None) is not None]
+        if fair:
+            family("netslicer_fq_backlog_packets", "gauge", "Packets waiting in the slice flow queues",
+                   [({"slice": name}, stats["backlog"]) for name, stats in fair])
+            family("netslicer_fq_backlog_bytes", "gauge", "Bytes waiting in the slice flow queues",
+                   [({"slice": name}, stats["backlog_bytes"]) for name, stats in fair])
+            family("netslicer_fq_active_flows", "gauge", "Flow queues of the slice with a backlog",
+                   [({"slice": name}, stats["flows"]) for name, stats in fair])
+            family("netslicer_fq_drops_total", "counter", "Packets dropped by the slice flow queues (limits)",
+                   [({"slice": name}, stats["dropped"]) for name, stats in fair])
+
+        capture = self.capture_stats() if self.capture_stats else None
+        if capture:
+            family("netslicer_capture_accepted_total", "counter", "Packets delivered to the capture socket",
+                   [({}, capture["accepted"])])
+            family("netslicer_capture_drops_total", "counter",
+                   "Packets the kernel dropped because userspace fell behind", [({}, capture["queue_drops"])])
+            family("netslicer_capture_ring_freezes_total", "counter", "Times the TPACKET_V3 capture ring froze",
+                   [({}, capture.get("freezes", 0))])
+            if capture.get("filtered") is not None:
+                family("netslicer_capture_filtered_total", "counter", "Packets dropped by the kernel capture filter",
+                       [({}, capture["filtered"])])
+
+        if self.interface:
+            by_classid = {ns.tc_classid: name for name, ns in self.slices.items()}
+            samples = {key: [] for key in ("bytes", "packets", "drops", "overlimits", "backlog", "qlen")}
+            if tc_stats is None:
+                tc_stats = tc_class_stats(self.interface)
+            for classid, stats in tc_stats.items():
+                for key in samples:
+                    samples[key].append(({"classid": classid, "slice": by_classid.get(classid, "")}, stats[key]))
+            family("netslicer_tc_class_bytes_total", "counter", "Bytes sent by the tc class", samples["bytes"])
+            family("netslicer_tc_class_packets_total", "counter", "Packets sent by the tc class", samples["packets"])
+            family("netslicer_tc_class_drops_total", "counter", "Packets dropped by the tc class", samples["drops"])
+            family("netslicer_tc_class_overlimits_total", "counter", "Times the tc class exceeded its rate",
+                   samples["overlimits"])
+            family("netslicer_tc_class_backlog_bytes", "gauge", "Bytes queued in the tc class", samples["backlog"])
+            family("netslicer_tc_class_queue_packets", "gauge", "Packets queued in the tc class (queue depth)",
+                   samples["qlen"])
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -1,3 +1,4 @@
+import threading
 import time
 
 class PacketMetrics:
@@ -10,6 +11,11 @@ class PacketMetrics:
         self.packet_count += 1
         self.total_data += packet_size
 
+    def update_batch(self, view):
+        """Account a whole PacketBatch / BatchView at once"""
+        self.packet_count += len(view)
+        self.total_data += int(view.lengths.sum())
+
     def pps(self):
         """Packets per second"""
         elapsed = time.time() - self.start_time
@@ -19,3 +25,147 @@ class PacketMetrics:
         """Throughput"""
         elapsed = time.time() - self.start_time
         return round((self.total_data / 1024) / elapsed, 2) if elapsed > 0 else 0
+
+
+class SliceProbeStats:
+    """
+    Running active-probe statistics of one slice: delay, RFC 3550 jitter, reordering, duplicates
+    and loss. Delays are in milliseconds; one-way delay assumes synchronized clocks at both ends.
+    Sequence numbers are 32-bit and wrap (core.prober): they are compared with serial-number
+    arithmetic (RFC 1982) and unwrapped into a 64-bit count.
+    """
+
+    SEQ_MOD = 1 << 32
+    DUPLICATE_WINDOW = 4096  # recent sequence numbers remembered to tell duplicates from late packets
+
+    def __init__(self, name, dscp):
+        self.name = name
+        self.dscp = dscp
+        self.received = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.remarked = 0
+        self.first_seq = None  # unwrapped
+        self.max_seq = None  # unwrapped
+        self.delay_min = float("inf")
+        self.delay_max = 0.0
+        self.delay_sum = 0.0
+        self.jitter = 0.0
+        self._last_transit = None
+        self._seen = set()  # unwrapped sequence numbers of the last DUPLICATE_WINDOW
+        self._period = (0, 0, 0.0)  # received, lost, delay_sum at the start of the SLA period
+
+    def update(self, seq, transit_ns, tos=None):
+        transit = transit_ns / 1e6
+        if self.first_seq is None:
+            self.first_seq = self.max_seq = seq
+        else:
+            # Signed distance from the highest sequence number, modulo 2^32
+            delta = (seq - self.max_seq + (self.SEQ_MOD >> 1)) % self.SEQ_MOD - (self.SEQ_MOD >> 1)
+            seq = self.max_seq + delta
+            if seq in self._seen:
+                self.duplicates += 1
+                return
+            if delta > 0:
+                self.max_seq = seq
+            else:
+                self.reordered += 1
+        self._seen.add(seq)
+        if len(self._seen) > 2 * self.DUPLICATE_WINDOW:
+            oldest = self.max_seq - self.DUPLICATE_WINDOW
+            self._seen = {s for s in self._seen if s > oldest}
+        self.received += 1
+        if tos is not None and tos >> 2 != self.dscp:
+            self.remarked += 1
+        self.delay_min = min(self.delay_min, transit)
+        self.delay_max = max(self.delay_max, transit)
+        self.delay_sum += transit
+        # RFC 3550 interarrival jitter: J += (|D(i-1, i)| - J) / 16
+        if self._last_transit is not None:
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16
+        self._last_transit = transit
+
+    def lost(self):
+        if self.first_seq is None:
+            return 0
+        return max(self.max_seq - self.first_seq + 1 - self.received, 0)
+
+    def snapshot(self):
+        expected = self.received + self.lost()
+        return {
+            "slice": self.name,
+            "dscp": self.dscp,
+            "received": self.received,
+            "lost": self.lost(),
+            "loss_pct": round(100 * self.lost() / expected, 3) if expected else 0.0,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "remarked": self.remarked,
+            "delay_min_ms": round(self.delay_min, 4) if self.received else None,
+            "delay_avg_ms": round(self.delay_sum / self.received, 4) if self.received else None,
+            "delay_max_ms": round(self.delay_max, 4) if self.received else None,
+            "jitter_ms": round(self.jitter, 4),
+        }
+
+    def period(self):
+        """Received, loss and average delay since the last call (the jitter estimate is already recent)."""
+        received, lost, delay_sum = self.received, self.lost(), self.delay_sum
+        last_received, last_lost, last_delay = self._period
+        self._period = (received, lost, delay_sum)
+        received, lost = received - last_received, max(lost - last_lost, 0)  # late packets lower it
+        expected = received + lost
+        return {
+            "received": received,
+            "loss_pct": round(100 * lost / expected, 3) if expected > 0 else 0.0,
+            "delay_avg_ms": round((delay_sum - last_delay) / received, 4) if received else None,
+            "jitter_ms": round(self.jitter, 4),
+        }
+
+
+class ProbeMetrics:
+    """Per-slice active probe statistics fed by the slice prober/reflector."""
+
+    def __init__(self, slices, delay_scale=1.0):
+        """
+        :param slices: mapping slice name -> DSCP
+        :param delay_scale: factor applied to transit times (0.5 turns echoed RTTs into RTT/2 delays)
+        """
+        self.slices = {dscp: SliceProbeStats(name, dscp) for name, dscp in slices.items()}
+        self.delay_scale = delay_scale
+        self.lock = threading.Lock()
+
+    def update(self, dscp, seq, transit_ns, tos=None):
+        stats = self.slices.get(dscp)
+        if stats is None:
+            return
+        with self.lock:
+            stats.update(seq, transit_ns * self.delay_scale, tos)
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            report = {stats.name: stats.snapshot() for stats in self.slices.values()}
+            if reset:
+                self.slices = {dscp: SliceProbeStats(s.name, dscp) for dscp, s in self.slices.items()}
+        return report
+
+    def check_sla(self, policies):
+        """
+        Compare the statistics of the period since the last check with the SLA of each slice
+        policy, so an old bad period is not reported again and a new one is not diluted.
+        :param policies: mapping slice name -> Policy
+        :return: list of violation messages
+        """
+        violations = []
+        with self.lock:
+            periods = {stats.name: stats.period() for stats in self.slices.values()}
+        for name, stats in periods.items():
+            policy = policies.get(name)
+            if policy is None or not stats["received"]:
+                continue
+            if policy.max_delay is not None and stats["delay_avg_ms"] > policy.max_delay:
+                violations.append(f"{name}: delay {stats['delay_avg_ms']} ms > {policy.max_delay} ms")
+            if policy.max_jitter is not None and stats["jitter_ms"] > policy.max_jitter:
+                violations.append(f"{name}: jitter {stats['jitter_ms']} ms > {policy.max_jitter} ms")
+            if policy.max_loss is not None and stats["loss_pct"] > policy.max_loss:
+                violations.append(f"{name}: loss {stats['loss_pct']}% > {policy.max_loss}%")
+        return violations
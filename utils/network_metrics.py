@@ -0,0 +1,374 @@
+"""
+Network metrics measurement (Python replacement for network_metrics.sh).
+
+Runs ping, iperf3 and traceroute probes concurrently through asyncio subprocesses, or
+uses the built-in UDP echo prober, for every slice DSCP and every packet size listed in
+INFO.md. Results are collected into one JSON document.
+
+Usage:
+    python -m utils.network_metrics 147.83.39.190 --json results.json
+    python -m utils.network_metrics --serve-echo 9000          # loopback stand-in
+    python -m utils.network_metrics 127.0.0.1 --udp-mode echo --echo-port 9000
+"""
+import argparse
+import asyncio
+import json
+import math
+import re
+import shutil
+import socket
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import config
+from utils.helpers import log
+
+# Packet-size sweep from INFO.md
+PING_SIZES = [100, 200, 400, 800, 1490]
+# Total UDP volumes (KB) sent per iperf3 run, as in network_metrics.sh
+UDP_TOTALS_KB = [60, 80, 200, 500, 1024]
+MAX_UDP_PAYLOAD = 65507
+# Payload sizes (B) used by the built-in echo prober
+ECHO_PAYLOAD_SIZES = [100, 200, 400, 800, 1472]
+
+_PROBE_HEADER = struct.Struct("!IQ")  # sequence number, send timestamp (ns)
+_PING_RTT = re.compile(r"(?:rtt|round-trip)[^=]*=\s*([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+)")
+_PING_LOSS = re.compile(r"([\d.]+)% packet loss")
+
+
+def bitrate_stats(rates: List[float]) -> Dict[str, Optional[float]]:
+    """Avg / peak / std (population, as the awk version) of per-interval bitrates in Mbps."""
+    if not rates:
+        return {"avg_mbps": None, "max_mbps": None, "std_mbps": None, "samples": 0}
+    avg = sum(rates) / len(rates)
+    var = max(sum(r * r for r in rates) / len(rates) - avg * avg, 0.0)
+    return {
+        "avg_mbps": round(avg / 1e6, 3),
+        "max_mbps": round(max(rates) / 1e6, 3),
+        "std_mbps": round(math.sqrt(var) / 1e6, 3),
+        "samples": len(rates),
+    }
+
+
+async def run_command(cmd: List[str], timeout: float) -> Tuple[int, str]:
+    """Run a command without blocking the event loop and return (returncode, stdout)."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return -1, ""
+    return proc.returncode, stdout.decode(errors="replace")
+
+
+# === External tool probes ==================================================
+
+
+async def measure_ping(ip: str, size: int, dscp: int, count: int = 10, interval: float = 0.2) -> Dict:
+    """RTT, one-way delay (RTT/2) and loss for one ICMP payload size."""
+    tos_flag = "-z" if config.IS_MACOS else "-Q"
+    cmd = ["ping", "-c", str(count), "-i", str(interval), "-s", str(size), tos_flag, str(dscp << 2), ip]
+    code, out = await run_command(cmd, timeout=count * interval + 10)
+    result = {"size": size, "rtt_min_ms": None, "rtt_avg_ms": None, "rtt_max_ms": None,
+              "rtt_std_ms": None, "one_way_delay_ms": None, "loss_pct": None}
+    rtt = _PING_RTT.search(out)
+    if rtt:
+        rtt_min, rtt_avg, rtt_max, rtt_std = map(float, rtt.groups())
+        result.update(rtt_min_ms=rtt_min, rtt_avg_ms=rtt_avg, rtt_max_ms=rtt_max, rtt_std_ms=rtt_std,
+                      one_way_delay_ms=round(rtt_avg / 2, 3))
+    loss = _PING_LOSS.search(out)
+    if loss:
+        result["loss_pct"] = float(loss.group(1))
+    if code not in (0, 1):
+        result["error"] = f"ping exited with {code}"
+    return result
+
+
+async def _iperf3(ip: str, port: int, extra: List[str], timeout: float) -> Optional[Dict]:
+    code, out = await run_command(["iperf3", "-c", ip, "-p", str(port), "-i", "1", "-J", *extra], timeout)
+    try:
+        report = json.loads(out)
+    except json.JSONDecodeError:
+        return None
+    return report if "error" not in report else None
+
+
+async def measure_udp_iperf(ip: str, total_kb: int, dscp: int, ports: asyncio.Queue,
+                            bandwidth: str = "1G") -> Dict:
+    """UDP bitrate avg/peak/std, jitter and loss for one total volume."""
+    total_bytes = total_kb * 1024
+    payload = min(total_bytes, MAX_UDP_PAYLOAD)
+    # iperf3 servers run one test at a time, so each run holds a port for its duration
+    port = await ports.get()
+    try:
+        report = await _iperf3(ip, port, ["-u", "-b", bandwidth, "-l", str(payload), "-n", str(total_bytes),
+                                          "--tos", str(dscp << 2)], timeout=60)
+    finally:
+        ports.put_nowait(port)
+    result = {"total_kb": total_kb, "payload": payload}
+    if report is None:
+        result["error"] = "iperf3 failed"
+        return result
+    rates = [interval["sum"]["bits_per_second"] for interval in report.get("intervals", [])]
+    result.update(bitrate_stats(rates))
+    summary = report.get("end", {}).get("sum", {})
+    result["jitter_ms"] = summary.get("jitter_ms")
+    result["loss_pct"] = summary.get("lost_percent")
+    return result
+
+
+async def measure_tcp_iperf(ip: str, dscp: int, ports: asyncio.Queue, duration: int = 10) -> Dict:
+    """TCP bitrate avg/peak/std and overall throughput."""
+    port = await ports.get()
+    try:
+        report = await _iperf3(ip, port, ["-t", str(duration), "--tos", str(dscp << 2)], timeout=duration + 30)
+    finally:
+        ports.put_nowait(port)
+    if report is None:
+        return {"error": "iperf3 failed"}
+    rates = [interval["sum"]["bits_per_second"] for interval in report.get("intervals", [])]
+    result = bitrate_stats(rates)
+    received = report.get("end", {}).get("sum_received", {}).get("bits_per_second")
+    result["throughput_mbps"] = round(received / 1e6, 3) if received is not None else None
+    return result
+
+
+async def measure_hops(ip: str) -> Optional[int]:
+    """Hop count from traceroute."""
+    code, out = await run_command(["traceroute", "-n", "-q", "1", "-w", "1", ip], timeout=60)
+    if code != 0:
+        return None
+    return sum(1 for line in out.splitlines() if re.match(r"^\s*\d+", line))
+
+
+# === Built-in UDP echo prober ==============================================
+
+
+_YIELD_EVERY = 8  # sends between two event loop turns when the train runs behind schedule
+
+
+class _EchoServerProtocol(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+class _EchoClient:
+    """
+    Reply reader of a probe train. asyncio's datagram transport reads one datagram per loop
+    turn, which falls behind a fast train; this drains the socket on every readable event.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.replies = []  # (seq, sent_ns, received_ns, size)
+
+    def on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return  # ICMP port unreachable surfaced on the connected socket: counted as loss
+            if len(data) >= _PROBE_HEADER.size:
+                seq, sent_ns = _PROBE_HEADER.unpack_from(data)
+                self.replies.append((seq, sent_ns, time.perf_counter_ns(), len(data)))
+
+
+async def serve_udp_echo(host: str = "0.0.0.0", port: int = 9000):
+    """UDP echo reflector used as a local stand-in for the remote end."""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(_EchoServerProtocol, local_addr=(host, port))
+    log('cyan', f"UDP echo server listening on {host}:{port}")
+    return transport
+
+
+async def measure_udp_echo(ip: str, port: int, payload: int, dscp: int, count: int = 2000,
+                           rate_mbps: float = 50.0, interval: float = 0.01, wait: float = 1.0) -> Dict:
+    """
+    Paced UDP train against an echo reflector: bitrate stats over `interval` windows,
+    RTT, RFC 3550 jitter and loss.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, dscp << 2)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)  # room for the replies of a burst
+    sock.connect((ip, port))
+    sock.setblocking(False)
+    client = _EchoClient(sock)
+    loop.add_reader(sock.fileno(), client.on_readable)
+    padding = bytes(max(payload - _PROBE_HEADER.size, 0))
+    gap_ns = int(payload * 8 / (rate_mbps * 1e6) * 1e9)
+    try:
+        start = time.perf_counter_ns()
+        for seq in range(count):
+            target = start + seq * gap_ns
+            delay = (target - time.perf_counter_ns()) / 1e9
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            # Never send early: spin to the deadline through the loop, so the replies keep draining
+            while time.perf_counter_ns() < target:
+                await asyncio.sleep(0)
+            if seq % _YIELD_EVERY == 0:
+                await asyncio.sleep(0)  # behind schedule: still let the loop read the replies
+            try:
+                sock.send(_PROBE_HEADER.pack(seq, time.perf_counter_ns()) + padding)
+            except (BlockingIOError, ConnectionRefusedError):
+                pass  # full send buffer or no reflector (yet): the probe counts as lost
+        await asyncio.sleep(wait)
+    finally:
+        loop.remove_reader(sock.fileno())
+        sock.close()
+
+    replies = sorted(client.replies, key=lambda r: r[2])
+    received = len({r[0] for r in replies})
+    result = {"payload": payload, "sent": count, "received": received,
+              "loss_pct": round(100.0 * (count - received) / count, 3) if count else None}
+    if not replies:
+        result.update(bitrate_stats([]), rtt_avg_ms=None, one_way_delay_ms=None, jitter_ms=None)
+        return result
+
+    # Bitrate over fixed windows of received bytes
+    window_ns = int(interval * 1e9)
+    first = replies[0][2]
+    windows: Dict[int, int] = {}
+    for _, _, recv_ns, size in replies:
+        slot = (recv_ns - first) // window_ns
+        windows[slot] = windows.get(slot, 0) + size
+    rates = [windows.get(slot, 0) * 8 / interval for slot in range(max(windows) + 1)]
+    result.update(bitrate_stats(rates))
+
+    # RTT and RFC 3550 interarrival jitter (J += (|D| - J) / 16)
+    rtts = [(recv_ns - sent_ns) / 1e6 for _, sent_ns, recv_ns, _ in replies]
+    jitter = 0.0
+    for prev, cur in zip(rtts, rtts[1:]):
+        jitter += (abs(cur - prev) - jitter) / 16
+    rtt_avg = sum(rtts) / len(rtts)
+    result["rtt_avg_ms"] = round(rtt_avg, 4)
+    result["rtt_max_ms"] = round(max(rtts), 4)
+    result["one_way_delay_ms"] = round(rtt_avg / 2, 4)
+    result["jitter_ms"] = round(jitter, 4)
+    return result
+
+
+# === Orchestration =========================================================
+
+
+async def measure_all(ip: str, slices: Dict[str, int], udp_mode: str = "iperf", iperf_ports: List[int] = None,
+                      echo_port: int = 9000, ping_count: int = 10, tcp_duration: int = 10,
+                      with_tcp: bool = True, with_hops: bool = True) -> Dict:
+    """Run every probe for every slice concurrently and gather the results."""
+    started = time.time()
+    ports: asyncio.Queue = asyncio.Queue()
+    for port in iperf_ports or [5201]:
+        ports.put_nowait(port)
+
+    jobs = {}
+    for name, dscp in slices.items():
+        jobs[(name, "ping")] = asyncio.gather(*(measure_ping(ip, size, dscp, ping_count) for size in PING_SIZES))
+        if udp_mode == "echo":
+            # Sequential per slice so the probe trains of one slice don't compete with each other
+            async def echo_sweep(dscp=dscp):
+                return [await measure_udp_echo(ip, echo_port, size, dscp) for size in ECHO_PAYLOAD_SIZES]
+
+            jobs[(name, "udp")] = echo_sweep()
+        else:
+            jobs[(name, "udp")] = asyncio.gather(*(measure_udp_iperf(ip, kb, dscp, ports) for kb in UDP_TOTALS_KB))
+            if with_tcp:
+                jobs[(name, "tcp")] = measure_tcp_iperf(ip, dscp, ports, tcp_duration)
+    if with_hops:
+        jobs[("*", "hops")] = measure_hops(ip)
+
+    values = await asyncio.gather(*jobs.values(), return_exceptions=True)
+    report = {"target": ip, "started": started, "udp_mode": udp_mode, "slices": {}}
+    for (name, probe), value in zip(jobs.keys(), values):
+        if isinstance(value, Exception):
+            value = {"error": repr(value)}
+        if name == "*":
+            report[probe] = value
+        else:
+            report["slices"].setdefault(name, {"dscp": slices[name]})[probe] = value
+    report["duration_s"] = round(time.time() - started, 3)
+    return report
+
+
+def _check_tools(udp_mode: str, with_hops: bool) -> bool:
+    required = ["ping"]
+    if udp_mode == "iperf":
+        required.append("iperf3")
+    if with_hops:
+        required.append("traceroute")
+    missing = [tool for tool in required if shutil.which(tool) is None]
+    for tool in missing:
+        log('red', f"Error: {tool} could not be found. Please install it.")
+    return not missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NetSlicer network metrics")
+    parser.add_argument("ip", nargs="?", help="Target IP address")
+    parser.add_argument("--config", default=config.DEFAULT_CONFIG, help="Slice configuration (names and DSCPs)")
+    parser.add_argument("--slices", nargs="+", default=None,
+                        help="Slices (DSCP markings) to measure (default: every slice of --config)")
+    parser.add_argument("--udp-mode", choices=["iperf", "echo"], default="iperf",
+                        help="Use iperf3 or the built-in UDP echo prober")
+    parser.add_argument("--iperf-ports", type=int, nargs="+", default=[5201],
+                        help="iperf3 server ports; one test runs per port at a time")
+    parser.add_argument("--echo-port", type=int, default=9000, help="UDP echo reflector port")
+    parser.add_argument("--serve-echo", type=int, metavar="PORT", help="Run a UDP echo reflector and exit on Ctrl+C")
+    parser.add_argument("--ping-count", type=int, default=10)
+    parser.add_argument("--tcp-duration", type=int, default=10)
+    parser.add_argument("--no-tcp", action="store_false", dest="with_tcp")
+    parser.add_argument("--no-hops", action="store_false", dest="with_hops")
+    parser.add_argument("--json", type=str, help="Write the report to this file instead of STDOUT")
+    opts = parser.parse_args()
+
+    if opts.serve_echo:
+        async def serve_forever():
+            await serve_udp_echo(port=opts.serve_echo)
+            await asyncio.Event().wait()
+
+        asyncio.run(serve_forever())
+        return
+    if not opts.ip:
+        parser.error("target IP address is required")
+    from core.slice_config import ConfigError, load_config
+    try:
+        slice_dscp = load_config(opts.config).slice_dscp()
+    except ConfigError as e:
+        log('red', str(e))
+        sys.exit(1)
+    unknown = sorted(set(opts.slices or []) - set(slice_dscp))
+    if unknown:
+        parser.error(f"unknown slices {', '.join(unknown)} (known: {', '.join(slice_dscp)})")
+    if not _check_tools(opts.udp_mode, opts.with_hops):
+        return
+
+    log('cyan', f"---------- Measuring network metrics for {opts.ip} ----------")
+    report = asyncio.run(measure_all(
+        opts.ip, {name: slice_dscp[name] for name in opts.slices or slice_dscp}, udp_mode=opts.udp_mode,
+        iperf_ports=opts.iperf_ports, echo_port=opts.echo_port, ping_count=opts.ping_count,
+        tcp_duration=opts.tcp_duration, with_tcp=opts.with_tcp, with_hops=opts.with_hops,
+    ))
+    output = json.dumps(report, indent=2)
+    if opts.json:
+        with open(opts.json, "w") as f:
+            f.write(output)
+        log('green', f"Report written to {opts.json} in {report['duration_s']}s")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        log("red", "Measurement interrupted by KeyboardInterrupt!")
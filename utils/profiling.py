@@ -0,0 +1,232 @@
+"""
+Hot-path profiling hooks.
+
+Stage timers: the data path brackets its stages (dissection, display, classifier lock,
+checksum work, send, ...) with perf_counter_ns() and adds the elapsed time to TIMERS, a
+set of preallocated log2 histograms. They are off by default: --profile turns them on,
+and so does the first SIGUSR2. While off, the per-packet paths skip the clock reads too
+(they test TIMERS.enabled first); per-batch stages only pay one clock read per batch.
+
+Profile windows: ProfileWindow turns on cProfile (main thread: the capture loop) or a
+statistical sampler (all threads) for N seconds, then dumps the results. Nothing runs
+while no window is open. Windows are opened from the command line (--profile) or on
+demand with SIGUSR1; SIGUSR2 turns the stage timers on, then prints them.
+
+    kill -USR1 <pid>    # profile the next N seconds
+    kill -USR2 <pid>    # start timing the stages; again: print the stage timing histograms
+"""
+import collections
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from functools import wraps
+from typing import Dict, Optional
+
+from utils.helpers import log
+
+# Bucket i holds durations in [2^(i-1), 2^i) ns; the last bucket is open-ended (> 2^39 ns ~ 9 min)
+BUCKETS = 40
+
+
+class StageHistogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, ns: int):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        self.buckets[min(ns.bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, q: float) -> int:
+        """Upper bound (ns) of the bucket holding the q-th percentile."""
+        if not self.count:
+            return 0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(1 << i, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total / 1e6, 3),
+            "mean_us": round(self.total / self.count / 1e3, 3) if self.count else 0.0,
+            "p50_us": round(self.percentile(50) / 1e3, 3),
+            "p99_us": round(self.percentile(99) / 1e3, 3),
+            "max_us": round(self.max / 1e3, 3),
+        }
+
+
+class StageTimers:
+    def __init__(self):
+        self.enabled = False
+        self.stages: Dict[str, StageHistogram] = {}
+
+    def add(self, stage: str, ns: int):
+        if not self.enabled:
+            return
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            # setdefault keeps concurrent first updates of a stage on one histogram
+            histogram = self.stages.setdefault(stage, StageHistogram())
+        histogram.add(ns)
+
+    def timed(self, stage: str):
+        """Decorator timing every call of the function as `stage`."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter_ns() - start)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        self.stages = {}
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {stage: histogram.snapshot() for stage, histogram in sorted(self.stages.items())}
+
+    def report(self) -> str:
+        stages = self.snapshot()
+        if not stages:
+            return "No stage timings recorded"
+        total = sum(s["total_ms"] for s in stages.values()) or 1.0
+        lines = [f"{'stage':<24} {'count':>9} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'max us':>10} {'share':>6}"]
+        for stage, s in stages.items():
+            lines.append(f"{stage:<24} {s['count']:>9} {s['mean_us']:>9} {s['p50_us']:>9} {s['p99_us']:>9} "
+                         f"{s['max_us']:>10} {100 * s['total_ms'] / total:>5.1f}%")
+        return "\n".join(lines)
+
+
+TIMERS = StageTimers()
+
+
+def _stage_timers_signal():
+    if TIMERS.enabled:
+        print(TIMERS.report())
+    else:
+        TIMERS.enabled = True
+        log('cyan', "Stage timers on: send SIGUSR2 again to print them")
+
+
+class ProfileWindow:
+    MODES = ("cprofile", "sample")
+
+    def __init__(self, mode: str = "sample", seconds: float = 10.0, out_dir: str = ".", interval: float = 0.001,
+                 top: int = 25):
+        """
+        :param mode: "cprofile" (deterministic, main thread only) or "sample" (statistical, every thread)
+        :param seconds: length of a window
+        :param out_dir: where the .pstats / .folded dumps are written
+        :param interval: sampling period (s) of the statistical sampler
+        :param top: functions printed when a window closes
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"profile mode must be one of {', '.join(self.MODES)} (got {mode!r})")
+        self.mode = mode
+        self.seconds = seconds
+        self.out_dir = out_dir
+        self.interval = interval
+        self.top = top
+        self.active = False
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _path(self, ext):
+        return os.path.join(self.out_dir, f"netslicer-{time.strftime('%Y%m%d-%H%M%S')}.{ext}")
+
+    def start(self):
+        """Open a window. cProfile windows must be opened from the main thread (e.g. a signal handler)."""
+        if self.active:
+            log('yellow', "A profile window is already open")
+            return
+        self.active = True
+        log('cyan', f"Profiling ({self.mode}) for {self.seconds:g}s...")
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            # The profiler is per thread: it is closed by SIGALRM, which also runs on the main thread
+            signal.signal(signal.SIGALRM, lambda *_: self.stop())
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        else:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        if not self.active:
+            return
+        if self.mode == "cprofile":
+            self._profile.disable()
+            self._dump_cprofile()
+        else:
+            self._stop.set()
+            if self._sampler is not threading.current_thread():
+                self._sampler.join()
+        self.active = False
+
+    def _dump_cprofile(self):
+        path = self._path("pstats")
+        self._profile.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(self._profile, stream=text).sort_stats("cumulative").print_stats(self.top)
+        print(text.getvalue())
+        log('green', f"cProfile window written to {path} (open with python -m pstats)")
+
+    def _sample(self):
+        me = threading.get_ident()
+        stacks = collections.Counter()
+        own = collections.Counter()
+        deadline = time.monotonic() + self.seconds
+        samples = 0
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if names:
+                    own[names[0]] += 1
+                    stacks[";".join(reversed(names))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        path = self._path("folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        total = sum(own.values()) or 1
+        print(f"{'self %':>7}  function  ({samples} samples)")
+        for name, count in own.most_common(self.top):
+            print(f"{100 * count / total:>6.1f}%  {name}")
+        log('green', f"Sampled stacks written to {path} (flamegraph.pl / speedscope format)")
+        self.active = False
+
+    def install_signals(self):
+        """SIGUSR1 opens a window, SIGUSR2 turns the stage timers on or prints them (main thread only)."""
+        signal.signal(signal.SIGUSR1, lambda *_: self.start())
+        signal.signal(signal.SIGUSR2, lambda *_: _stage_timers_signal())
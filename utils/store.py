@@ -1,8 +1,11 @@
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+import ipaddress
 
 
 def store_init():
+    # influxdb_client is only imported when packet storage is enabled
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
     influx_client = InfluxDBClient(
         url="http://localhost:8086",
         token="YOUR_TOKEN",
@@ -14,6 +17,7 @@ def store_init():
 
 
 def store_packet(write_api, packet):
+    from influxdb_client import Point
     point = Point("network_packets") \
         .tag("source", packet.ip_src) \
         .tag("destination", packet.ip_dst) \
@@ -22,3 +26,18 @@ def store_packet(write_api, packet):
         .field("data_size", packet.data_size)
 
     return write_api.write(bucket="YOUR_BUCKET", record=point)
+
+
+def store_batch(write_api, view):
+    """Store a PacketBatch / BatchView with one write call, reading the parsed columns"""
+    from influxdb_client import Point
+    points = [
+        Point("network_packets")
+        .tag("source", ipaddress.IPv4Address(int(src)).compressed)
+        .tag("destination", ipaddress.IPv4Address(int(dst)).compressed)
+        .tag("protocol", int(proto))
+        .tag("dscp", int(dscp))
+        .field("size", int(length))
+        for src, dst, proto, dscp, length in zip(view.src, view.dst, view.proto, view.dscp, view.lengths)
+    ]
+    return write_api.write(bucket="YOUR_BUCKET", record=points)